@@ -0,0 +1,401 @@
+"""
+Benchmark for routers/pdf_generator.
+
+Builds synthetic patients of increasing size, serves them from an in-memory
+fake Firestore and Storage bucket plus a local HTTP image server, and reports
+wall time, page count, peak RSS and uploaded bytes for
+generate_medical_report_pdf. Each scenario runs in its own process so peak
+RSS is per scenario and every run starts with a cold image cache.
+
+    python benchmarks/pdf_generator_bench.py
+    python benchmarks/pdf_generator_bench.py --scenarios small large --json out.json
+"""
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# -------------------- Configuration --------------------
+
+# name -> record counts. Images are distinct URLs, so none are served from the cache.
+SCENARIOS = {
+    "small":  {"bp_readings": 5,     "medications": 3,   "blood_tests": 2,  "results_per_test": 5,  "images_per_test": 1, "radiology_exams": 1,  "images_per_exam": 1},
+    "medium": {"bp_readings": 200,   "medications": 20,  "blood_tests": 10, "results_per_test": 10, "images_per_test": 1, "radiology_exams": 4,  "images_per_exam": 2},
+    "large":  {"bp_readings": 2000,  "medications": 60,  "blood_tests": 25, "results_per_test": 15, "images_per_test": 1, "radiology_exams": 10, "images_per_exam": 2},
+    "xlarge": {"bp_readings": 10000, "medications": 150, "blood_tests": 40, "results_per_test": 20, "images_per_test": 2, "radiology_exams": 20, "images_per_exam": 2},
+}
+
+PATIENT_ID = "29001011234567"
+SOURCE_IMAGE_SIZE = (1600, 1200)  # Typical phone photo of a lab report
+SOURCE_IMAGE_VARIANTS = 4
+
+# -------------------- Fake Firestore --------------------
+
+class Strict:
+    """Fails loudly on any client call the fakes do not implement, instead of silently diverging"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"{type(self).__name__}.{name} is not implemented by the benchmark fakes")
+
+
+class FakeSnapshot(Strict):
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self.update_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeAggregation(Strict):
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeQuery(Strict):
+    """The subset of the query API the report uses: order_by, start_after, limit, count, stream"""
+
+    def __init__(self, store, path, order=None, after=None, limit=None):
+        self._store = store
+        self._path = path
+        self._order = order
+        self._after = after
+        self._limit = limit
+
+    def _with(self, **changes):
+        state = {"order": self._order, "after": self._after, "limit": self._limit, **changes}
+        return FakeQuery(self._store, self._path, **state)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._with(order=(field, direction == "DESCENDING"))
+
+    def start_after(self, snapshot):
+        return self._with(after=snapshot)
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def _sort_key(self, field):
+        if field == "__name__":
+            return lambda item: item[0]
+        return lambda item: str(item[1].get(field, ""))
+
+    def stream(self):
+        self._store.wait()
+        items = sorted(self._store.collections.get(self._path, {}).items())
+        if self._order:
+            field, descending = self._order
+            key = self._sort_key(field)
+            items.sort(key=key, reverse=descending)
+            if self._after is not None:
+                after = key((self._after.id, self._after.to_dict()))
+                items = [item for item in items if (key(item) < after if descending else key(item) > after)]
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            yield FakeSnapshot(FakeDocumentRef(self._store, f"{self._path}/{doc_id}"), data)
+
+    def count(self):
+        total = len(self._store.collections.get(self._path, {}))
+        return types.SimpleNamespace(get=lambda: [[FakeAggregation(total)]])
+
+
+class FakeCollectionRef(FakeQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id):
+        return FakeDocumentRef(self._store, f"{self._path}/{doc_id}")
+
+
+class FakeDocumentRef(Strict):
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollectionRef(self._store, f"{self.path}/{name}")
+
+    def get(self):
+        self._store.wait()
+        return FakeSnapshot(self, self._store.documents.get(self.path))
+
+
+class FakeFirestore(Strict):
+    """Documents keyed by full path; collections map path -> {doc_id: data}"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.documents = {}
+        self.collections = {}
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            self.reads += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add(self, collection_path, doc_id, data):
+        self.collections.setdefault(collection_path, {})[doc_id] = data
+        self.documents[f"{collection_path}/{doc_id}"] = data
+
+    def collection(self, name):
+        return FakeCollectionRef(self, name)
+
+    def get_all(self, refs):
+        self.wait()
+        return [FakeSnapshot(ref, self.documents.get(ref.path)) for ref in refs]
+
+# -------------------- Fake Storage --------------------
+
+class FakeBlob(Strict):
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self.name = name
+        self.metadata = None
+
+    def upload_from_string(self, data, content_type=None):
+        self._bucket.uploads.append(data)
+
+    def patch(self):
+        pass
+
+
+class FakeBucket(Strict):
+    name = "bench-bucket"
+
+    def __init__(self):
+        self.uploads = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return None  # No stored report, so every run renders
+
+# -------------------- Image Server --------------------
+
+def make_source_images():
+    """A few noisy JPEGs, so decoding and resizing cost what real photos do"""
+    from PIL import Image
+
+    variants = []
+    for i in range(SOURCE_IMAGE_VARIANTS):
+        noise = Image.effect_noise(SOURCE_IMAGE_SIZE, 40 + i * 10)
+        image = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        variants.append(buffer.getvalue())
+    return variants
+
+
+def start_image_server(latency):
+    variants = make_source_images()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            match = re.match(r"^/images/(\d+)\.jpg$", self.path)
+            if not match:
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            body = variants[int(match.group(1)) % len(variants)]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/images"
+
+# -------------------- Synthetic Patient --------------------
+
+def build_patient(store, scenario, image_base):
+    rng = random.Random(42)
+    user_path = f"Users/{PATIENT_ID}"
+    indicators = f"{user_path}/ClinicalIndicators"
+    start = datetime(2020, 1, 1, 8, 0, 0)
+    image_ids = iter(range(10 ** 9))
+
+    def timestamp_id(i, step):
+        return (start + timedelta(minutes=step * i)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def image_urls(count):
+        return [f"{image_base}/{next(image_ids)}.jpg" for _ in range(count)]
+
+    store.add("Users", PATIENT_ID, {
+        "full_name": "Benchmark Patient", "national_id": PATIENT_ID, "age": 54, "gender": "male",
+        "phone_number": "+201000000000", "email": "bench@example.com", "city": "Cairo",
+        "blood_type": "A+", "smoker_status": "Non-smoker", "marital_status": "Married"
+    })
+    store.add(indicators, "measurements", {"height": 172, "weight": 88, "bmi": 29.7, "added_by": "bench"})
+
+    for i in range(3):
+        store.add(f"{indicators}/allergies/Records", timestamp_id(i, 60), {
+            "allergen_name": f"Allergen {i}", "reaction_type": "Rash", "severity": "Mild", "notes": ""})
+        store.add(f"{user_path}/diagnoses", timestamp_id(i, 60), {
+            "disease_name": f"Condition {i}", "diagnosis_date": "2021-03-01", "diagnosed_by": "Dr. Bench",
+            "is_chronic": i == 0, "details_notes": "Stable"})
+        store.add(f"{user_path}/surgeries", timestamp_id(i, 60), {
+            "procedure_name": f"Procedure {i}", "surgeon_name": "Dr. Bench", "surgery_date": "2019-06-01"})
+        store.add(f"{user_path}/family_history", timestamp_id(i, 60), {
+            "disease_name": "Diabetes", "age_of_onset": 50 + i, "relative_relationship": "Parent"})
+    store.add(f"{user_path}/emergency_contacts", "1", {
+        "full_name": "Contact Person", "relationship": "Sibling", "phone_number": "+201000000001"})
+
+    for i in range(scenario["bp_readings"]):
+        store.add(f"{indicators}/Hypertension/Records", timestamp_id(i, 180), {
+            "sys_value": rng.randint(105, 165), "dia_value": rng.randint(65, 105),
+            "timestamp": timestamp_id(i, 180), "added_by": PATIENT_ID})
+
+    for i in range(scenario["medications"]):
+        store.add(f"{user_path}/medications", timestamp_id(i, 1440), {
+            "trade_name": f"Trade {i}", "scientific_name": f"Compound {i}", "dosage": "10 mg",
+            "frequency": "Once daily", "certain_duration": False, "current": True,
+            "prescribing_doctor": "Dr. Bench", "timestamp": timestamp_id(i, 1440)})
+
+    for i in range(scenario["blood_tests"]):
+        urls = image_urls(scenario["images_per_test"])
+        store.add(f"{indicators}/bloodbiomarkers/Records", timestamp_id(i, 10080), {
+            "extracted_date": timestamp_id(i, 10080), "added_date": timestamp_id(i, 10080),
+            "added_by": "facility-bench", "image_url": urls[0], "images": urls[1:],
+            "results": [{
+                "item": f"Analyte {j}", "value": round(rng.uniform(1, 200), 1), "unit": "mg/dL",
+                "reference_range": "10-150", "flag": rng.random() < 0.2
+            } for j in range(scenario["results_per_test"])]})
+
+    for i in range(scenario["radiology_exams"]):
+        store.add(f"{indicators}/radiology/Records", timestamp_id(i, 20160), {
+            "radiology_name": "Chest X-ray", "date": timestamp_id(i, 20160)[:10],
+            "report_notes": "No acute findings.", "added_by": "facility-bench",
+            "images": image_urls(scenario["images_per_exam"])})
+
+    store.add(f"{user_path}/risk_predictions", "latest", {
+        "timestamp": start.isoformat(), "diabetes_risk": 0.42, "hypertension_risk": 0.67,
+        "diabetes_level": "Moderate", "hypertension_level": "High"})
+
+# -------------------- Scenario Runner --------------------
+
+def run_scenario(name, firestore_latency, image_latency, mode):
+    """Run one scenario in this process and return its measurements"""
+    store = FakeFirestore(firestore_latency)
+    bucket = FakeBucket()
+    sys.modules["firebase_config"] = types.SimpleNamespace(db=store, bucket=bucket)
+    cache_dir = tempfile.mkdtemp(prefix="pdf_bench_cache_")
+    os.environ["PDF_IMAGE_CACHE_DIR"] = cache_dir
+    sys.path.insert(0, REPO_ROOT)
+
+    from fastapi import BackgroundTasks
+    from routers import pdf_generator
+
+    build_patient(store, SCENARIOS[name], start_image_server(image_latency))
+    store.reads = 0
+
+    async def generate():
+        background_tasks = BackgroundTasks()
+        response = await pdf_generator.generate_medical_report_pdf(PATIENT_ID, background_tasks, mode)
+        if mode == "stream":
+            chunks = [chunk async for chunk in response.body_iterator]
+            await background_tasks()
+            return b"".join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in chunks)
+        return bucket.uploads[-1]
+
+    started = time.perf_counter()
+    try:
+        pdf_bytes = asyncio.run(generate())
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - started
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024  # Linux reports KiB
+    return {
+        "scenario": name,
+        "mode": mode,
+        "wall_seconds": round(elapsed, 3),
+        "pages": len(re.findall(rb"/Type /Page\b", pdf_bytes)),
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+        "uploaded_bytes": sum(len(data) for data in bucket.uploads),
+        "firestore_reads": store.reads,
+    }
+
+
+def run_isolated(name, args):
+    """Run a scenario in a fresh interpreter so its peak RSS is its own"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", name,
+               "--firestore-latency", str(args.firestore_latency),
+               "--image-latency", str(args.image_latency), "--mode", args.mode]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=REPO_ROOT)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    columns = ["scenario", "mode", "wall_seconds", "pages", "peak_rss_mb", "uploaded_bytes", "firestore_reads"]
+    widths = {column: max(len(column), *(len(str(result[column])) for result in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(widths[column]) for column in columns))
+
+# -------------------- Main Execution --------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF report generation on synthetic patients")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--firestore-latency", type=float, default=0.005, help="Seconds added to every Firestore read")
+    parser.add_argument("--image-latency", type=float, default=0.05, help="Seconds added to every image download")
+    parser.add_argument("--mode", choices=["url", "stream"], default="url")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Report output goes to stderr; the last stdout line is the result
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_scenario(args.child, args.firestore_latency, args.image_latency, args.mode)
+        print(json.dumps(result), file=stdout)
+        return
+
+    results = []
+    for name in args.scenarios:
+        results.append(run_isolated(name, args))
+        print(f"{name}: {results[-1]['wall_seconds']}s", file=sys.stderr)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
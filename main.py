@@ -37,8 +37,10 @@ from routers import (
     users, pending_approvals, doctor_assignments,
     surgeries, bloodbiomarkers, measurements, radiology, hypertension,
     medications, diagnoses, allergies, family_history,
-    emergency_contacts, risk_assessment, admin, user_role, auth, facilities, qrcode, send_email,translate
+    emergency_contacts, risk_assessment, admin, user_role, auth, facilities, qrcode, send_email,translate,
+    pdf_generator
 )
+from routers import ocr_engine, ocr_jobs, pdf_scheduler
 
 app = FastAPI(title="MediGO Backend", version="1.0")
 
@@ -49,8 +51,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-PDF-URL"],  # Readable by the browser dashboard
 )
 
+# ✅ تشغيل محرك OCR مع تحميل النماذج مسبقًا
+@app.on_event("startup")
+def start_ocr_engine():
+    ocr_engine.start_engine()
+
+# ✅ إنهاء مهام OCR التي توقفت بسبب إعادة التشغيل
+@app.on_event("startup")
+def recover_ocr_jobs():
+    try:
+        ocr_jobs.recover_orphaned_jobs()
+    except Exception as e:
+        print(f"Error recovering orphaned OCR jobs: {str(e)}")
+
+@app.on_event("shutdown")
+def stop_ocr_engine():
+    ocr_engine.stop_engine()
+
+# ✅ إعادة إنشاء تقارير PDF القديمة في الخلفية (تضيفها مسارات الكتابة إلى PdfRebuildQueue)
+@app.on_event("startup")
+def start_pdf_scheduler():
+    pdf_scheduler.start_scheduler(pdf_generator.get_or_build_report)
+
+@app.on_event("shutdown")
+def stop_pdf_scheduler():
+    pdf_scheduler.stop_scheduler()
+
 # ✅ تسجيل الروترات
 app.include_router(auth.router)
 app.include_router(admin.router)
@@ -73,6 +102,7 @@ app.include_router(risk_assessment.router)
 app.include_router(user_role.router)
 app.include_router(send_email.router)
 app.include_router(translate.router)
+app.include_router(pdf_generator.router)
 # ✅ مسار اختباري
 @app.get("/")
 def root():
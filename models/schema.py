@@ -2,7 +2,6 @@ from pydantic import BaseModel, Field, EmailStr, field_validator, model_validato
 from typing import Optional, List, Dict, Literal
 from datetime import date as dt_date, datetime
 import pytz
-from firebase_config import db
 # ----------------- Literal Types -----------------
 AllowedRoles = Literal["patient", "hospital", "laboratory", "radiology", "pharmacy", "clinic", "visitor"]
 Gender = Literal["male", "female"]
@@ -35,23 +34,6 @@ def calculate_age(birthdate_str: str) -> int:
     today = datetime.today().date()
     return today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
 
-def fetch_patient_name(user_ref):
-    doc = user_ref.get()
-    return doc.to_dict().get("full_name", "Unknown") if doc.exists else "Unknown"
-
-def resolve_added_by_name(added_by_id: str) -> str:
-    # Check if it's a facility
-    facility_docs = db.collection("Facilities").where("facility_id", "==", added_by_id).limit(1).stream()
-    for doc in facility_docs:
-        return doc.to_dict().get("facility_name", "Unknown Facility")
-        
-    # Check if it's a doctor
-    doctor_docs = db.collection("Doctors").where("doctor_id", "==", added_by_id).limit(1).stream()
-    for doc in doctor_docs:
-        return doc.to_dict().get("doctor_name", "Unknown Doctor")
-        
-    return "Patient"  # Fallback
-
 # ----------------- Field Validators -----------------
 def validate_phone_number(value: str) -> str:
     digits = ''.join(filter(str.isdigit, value))
@@ -412,6 +394,20 @@ class RiskPredictionOutput(BaseModel):
     top_hypertension_features: List[TopFeatures]
     biomarker_chart_data: Optional[List[BiomarkerEntry]] = None
 
+class RiskBatchRequest(BaseModel):
+    national_ids: List[str]
+
+class RiskBatchOutput(BaseModel):
+    results: Dict[str, RiskPredictionOutput]
+    errors: Dict[str, str]
+
+class PendingBulkApproveRequest(BaseModel):
+    doc_ids: List[str]
+
+class PendingBulkApproveOutput(BaseModel):
+    results: Dict[str, str]
+    errors: Dict[str, str]
+
 class RiskAssessmentEntry(BaseModel):
     risk_category: str
     prediction_date: dt_date
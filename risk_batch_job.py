@@ -0,0 +1,46 @@
+import sys
+from firebase_config import db
+from routers.risk_assessment import assess_risk_batch
+
+# -------------------- Configuration --------------------
+
+CHUNK_SIZE = 200  # Patients scored per model run / batched write
+
+# -------------------- Utility Functions --------------------
+
+def iter_national_ids():
+    """
+    Stream every user ID without downloading the user documents.
+    """
+    for doc in db.collection("Users").select([]).stream():
+        yield doc.id
+
+def chunked(ids, size):
+    chunk = []
+    for national_id in ids:
+        chunk.append(national_id)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# -------------------- Main Execution --------------------
+
+def main():
+    # Optional: score only the national IDs given on the command line
+    ids = sys.argv[1:] or iter_national_ids()
+
+    scored, failed = 0, 0
+    for chunk in chunked(ids, CHUNK_SIZE):
+        outcome = assess_risk_batch(chunk)
+        scored += len(outcome["results"])
+        failed += len(outcome["errors"])
+        for national_id, error in outcome["errors"].items():
+            print(f"Skipped {national_id}: {error}")
+        print(f"Scored {scored} patients so far")
+
+    print(f"Risk scoring completed! {scored} scored, {failed} skipped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+import pytz
+from firebase_config import db
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+ACTOR_DIRECTORY_TTL_SECONDS = float(os.environ.get("ACTOR_DIRECTORY_TTL_SECONDS", "300"))
+ACTOR_DIRECTORY_NEGATIVE_TTL_SECONDS = float(os.environ.get("ACTOR_DIRECTORY_NEGATIVE_TTL_SECONDS", "60"))  # Unknown IDs (patients)
+ACTOR_DIRECTORY_MAX_ENTRIES = int(os.environ.get("ACTOR_DIRECTORY_MAX_ENTRIES", "10000"))
+
+egypt_tz = pytz.timezone("Africa/Cairo")
+
+
+class ActorDirectory:
+    """
+    In-process cache resolving the ID a record was added by (a facility_id
+    or doctor_id) to {"kind": "facility" | "doctor", "doc_id", "name"}.
+
+    IDs that are neither, such as patients uploading their own records, are
+    cached as None for a shorter time. Entries expire after their TTL, and
+    routers/admin invalidates them when facilities and doctors change. The
+    least recently used entries are dropped beyond ACTOR_DIRECTORY_MAX_ENTRIES.
+    """
+
+    def __init__(self, ttl: float = ACTOR_DIRECTORY_TTL_SECONDS,
+                 negative_ttl: float = ACTOR_DIRECTORY_NEGATIVE_TTL_SECONDS,
+                 max_entries: int = ACTOR_DIRECTORY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # actor_id -> (expires_at, actor or None)
+        self._lock = threading.Lock()
+
+    def invalidate(self, actor_id: Optional[str] = None):
+        """Forget one actor, or every cached actor when `actor_id` is None"""
+        with self._lock:
+            if actor_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(actor_id, None)
+
+    def _fetch(self, actor_id: str) -> Optional[dict]:
+        facility = next(db.collection("Facilities").where("facility_id", "==", actor_id).limit(1).stream(), None)
+        if facility is not None:
+            name = (facility.to_dict() or {}).get("facility_name", "Unknown Facility")
+            return {"kind": "facility", "doc_id": facility.id, "name": name}
+        doctor = next(db.collection("Doctors").where("doctor_id", "==", actor_id).limit(1).stream(), None)
+        if doctor is not None:
+            name = (doctor.to_dict() or {}).get("doctor_name", "Unknown Doctor")
+            return {"kind": "doctor", "doc_id": doctor.id, "name": name}
+        return None
+
+    def resolve(self, actor_id: str) -> Optional[dict]:
+        """Return the facility or doctor behind `actor_id`, or None if it is neither"""
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(actor_id)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(actor_id)
+                return cached[1]
+
+        actor = self._fetch(actor_id)
+        expires_at = now + (self.ttl if actor is not None else self.negative_ttl)
+        with self._lock:
+            self._entries[actor_id] = (expires_at, actor)
+            self._entries.move_to_end(actor_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return actor
+
+
+# ─── Shared directory ────────────────────────────────────────────────
+actor_directory = ActorDirectory()
+
+
+def resolve_added_by_name(added_by_id: str) -> str:
+    # Facility or doctor name from the shared actor cache
+    actor = actor_directory.resolve(added_by_id)
+    return actor["name"] if actor else "Patient"  # Fallback
+
+
+def fetch_patient_name(user_ref):
+    doc = user_ref.get()
+    return doc.to_dict().get("full_name", "Unknown") if doc.exists else "Unknown"
+
+
+def fetch_patient_gender(user_ref):
+    doc = user_ref.get()
+    return doc.to_dict().get("gender") if doc.exists else None
+
+
+def is_valid_facility_or_doctor(added_by_id: str) -> bool:
+    return actor_directory.resolve(added_by_id) is not None
+
+
+def store_procedure_under_facility(facility_id: str, patient_id: str, procedure_type: str, procedure_data: dict):
+    actor = actor_directory.resolve(facility_id)
+    if actor is None or actor["kind"] != "facility":
+        return
+    timestamp = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
+    db.collection("Facilities").document(actor["doc_id"]) \
+        .collection("PatientsMadeProcedures").document(patient_id) \
+        .collection(procedure_type).document(timestamp).set(procedure_data)
@@ -1,10 +1,15 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import Optional
 import random
 import string
 from models.schema import FacilityCreateRequest, Facility, DoctorsCreateRequest, Doctors
 from firebase_config import db
 from routers.user_role import ALLOWED_ROLES
+from routers.doctor_assignments import set_patient_assignment, rename_doctor_assignments, remove_doctor_assignments
+from routers.search_index import facilities_index, doctors_index
+from routers.reviewer_directory import reviewer_directory
+from routers.actor_directory import actor_directory
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
 
@@ -24,25 +29,38 @@ app.add_middleware(
 app.include_router(router)
 
 @router.get("/facilities")
-def search_facilities(name: str = Query("", alias="name"), id: str = Query("", alias="id")):
-    facilities_ref = db.collection("Facilities").stream()
-    results = []
-    for doc in facilities_ref:
-        data = doc.to_dict()
-        if name.lower() in data.get("facility_name", "").lower() or id == data.get("facility_id"):
-            data["id"] = doc.id
-            results.append(data)
+def search_facilities(
+    response: Response,
+    name: str = Query("", alias="name"),
+    id: str = Query("", alias="id"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Facilities whose name contains `name` (case-insensitive) or whose
+    facility_id equals `id`. An empty parameter is ignored; before the search
+    index it matched every facility, so `?id=12345` returned all of them. With
+    neither parameter every facility is returned. The total match count is in
+    the X-Total-Count header (exposed to browsers via CORS).
+    """
+    total, results = facilities_index.search({"facility_name": name}, exact={"facility_id": id}, offset=offset, limit=limit)
+    response.headers["X-Total-Count"] = str(total)
     return results
 
 @router.get("/clinicians")
-def search_doctors(name: str = Query("", alias="name"), id: str = Query("", alias="id")):
-    doctors_ref = db.collection("Doctors").stream()
-    results = []
-    for doc in doctors_ref:
-        data = doc.to_dict()
-        if name.lower() in data.get("doctor_name", "").lower() or id == data.get("doctor_id"):
-            data["id"] = doc.id
-            results.append(data)
+def search_doctors(
+    response: Response,
+    name: str = Query("", alias="name"),
+    id: str = Query("", alias="id"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Doctors whose name contains `name` (case-insensitive) or whose doctor_id
+    equals `id`. Empty parameters are ignored as in search_facilities.
+    """
+    total, results = doctors_index.search({"doctor_name": name}, exact={"doctor_id": id}, offset=offset, limit=limit)
+    response.headers["X-Total-Count"] = str(total)
     return results
 
 @router.post("/facility/{admin_id}")
@@ -73,22 +91,32 @@ def create_facility(admin_id: str, data: FacilityCreateRequest):
         raise HTTPException(status_code=400, detail="Facility name already exists")
 
     doc_ref.set(facility_data.dict())
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(facility_id)  # Drop a cached "unknown" for the new ID
     return {"message": "Facility created successfully", "login_id": facility_id, "password": password}
 
 @router.put("/facility/{facility_id}")
 def update_facility(facility_id: str, updated_data: dict):
     doc_ref = db.collection("Facilities").document(facility_id)
-    if not doc_ref.get().exists:
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
         raise HTTPException(status_code=404, detail="Facility not found")
     doc_ref.update(updated_data)
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(snapshot.to_dict().get("facility_id"))
+    if updated_data.get("facility_id"):
+        actor_directory.invalidate(updated_data["facility_id"])
     return {"message": "Facility updated successfully"}
 
 @router.delete("/facility/{facility_id}")
 def delete_facility(facility_id: str):
     doc_ref = db.collection("Facilities").document(facility_id)
-    if not doc_ref.get().exists:
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
         raise HTTPException(status_code=404, detail="Facility not found")
     doc_ref.delete()
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(snapshot.to_dict().get("facility_id"))
     return {"message": "Facility deleted successfully"}
 
 @router.post("/doctors/{admin_id}")
@@ -115,6 +143,8 @@ def create_doctor(admin_id: str, data: DoctorsCreateRequest):
 
     # Save doctor
     doc_ref.set(doctor_data.dict())
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(doctor_id)
 
     # Migrate fallback assignments to new doctor record
     assignments = db.collection("DoctorAssignments") \
@@ -136,6 +166,7 @@ def create_doctor(admin_id: str, data: DoctorsCreateRequest):
             "full_name": full_name,
             "assigned_at": datetime.now().isoformat()
         })
+        set_patient_assignment(patient_id, data.email, data.doctor_name, registered=True)
 
         db.collection("DoctorAssignments").document(doc.id).delete()
         migrated.append(patient_id)
@@ -163,17 +194,28 @@ def create_doctor(admin_id: str, data: DoctorsCreateRequest):
 @router.put("/doctors/{doctor_id}")
 def update_doctor(doctor_id: str, updated_data: dict):
     doc_ref = db.collection("Doctors").document(doctor_id)
-    if not doc_ref.get().exists:
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
         raise HTTPException(status_code=404, detail="Doctor not found")
     doc_ref.update(updated_data)
+    if "doctor_name" in updated_data:
+        rename_doctor_assignments(doctor_id, updated_data["doctor_name"])  # check_doctor reads the copy in PatientAssignments
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(snapshot.to_dict().get("doctor_id"))
+    if updated_data.get("doctor_id"):
+        actor_directory.invalidate(updated_data["doctor_id"])
     return {"message": "Doctor updated successfully"}
 
 @router.delete("/doctors/{doctor_id}")
 def delete_doctor(doctor_id: str):
     doc_ref = db.collection("Doctors").document(doctor_id)
-    if not doc_ref.get().exists:
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
         raise HTTPException(status_code=404, detail="Doctor not found")
     doc_ref.delete()
+    remove_doctor_assignments(doctor_id)
+    reviewer_directory.invalidate()
+    actor_directory.invalidate(snapshot.to_dict().get("doctor_id"))
     return {"message": "Doctor deleted successfully"}
 
 @router.get("/notifications")
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Request
 from models.schema import Allergy
 from datetime import datetime
 from firebase_config import db
+from routers.report_cache import invalidate_report
 import pytz
 
 router = APIRouter(prefix="/allergies", tags=["Allergies"])
@@ -27,6 +28,7 @@ def add_allergy(national_id: str, entry: Allergy):
         .collection("Records") \
         .document(doc_id) \
         .set(data)
+    invalidate_report(national_id)
 
     return {"message": "Allergy added", "id": doc_id}
 
@@ -67,6 +69,7 @@ def update_allergy(national_id: str, record_id: str, entry: Allergy):
     updated_data["date"] = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
 
     allergy_ref.update(updated_data)
+    invalidate_report(national_id)
 
     return {"message": "Allergy updated", "id": record_id}
 
@@ -92,4 +95,5 @@ def delete_allergy(national_id: str, record_id: str, request: Request):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this record")
 
     allergy_ref.delete()
+    invalidate_report(national_id)
     return {"message": "Allergy deleted", "id": record_id}
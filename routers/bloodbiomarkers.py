@@ -1,35 +1,122 @@
 from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Body
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 import pytz, uuid
 from firebase_config import db, bucket
-from models.schema import resolve_added_by_name, fetch_patient_name
 from routers.doctor_assignments import is_doctor_assigned, auto_assign_reviewer
-from routers.ocr_utils import process_medical_report
+from routers.ocr_engine import run_ocr
+from routers.ocr_jobs import submit_ocr_job, get_job
+from routers.feature_store import mark_risk_inputs_changed
+from routers.report_cache import invalidate_report
+from routers.pending_approvals import submit_pending
+from routers.actor_directory import (
+    is_valid_facility_or_doctor, store_procedure_under_facility, resolve_added_by_name, fetch_patient_name,
+    fetch_patient_gender
+)
 
 router = APIRouter(prefix="/biomarkers", tags=["Blood BioMarkers"])
 egypt_tz = pytz.timezone("Africa/Cairo")
 
 
-def is_valid_facility_or_doctor(added_by_id: str) -> bool:
-    facilities = db.collection("Facilities").where("facility_id", "==", added_by_id).stream()
-    if any(True for _ in facilities):
-        return True
-    doctors = db.collection("Doctors").where("doctor_id", "==", added_by_id).stream()
-    if any(True for _ in doctors):
-        return True
-    return False
+def handle_ocr_report(
+    national_id: str,
+    report: dict,
+    image_bytes: bytes,
+    filename: str,
+    content_type: str,
+    added_by: str
+) -> dict:
+    if report.get("error"):
+        raise HTTPException(status_code=400, detail=report["error"])
+    if not report["is_valid"] or not report["is_medical"]:
+        raise HTTPException(status_code=422, detail="Image is not valid or not medical")
+
+    storage_path = f"lab_tests/{uuid.uuid4().hex}_{filename}"
+    blob = bucket.blob(storage_path)
+    blob.upload_from_string(image_bytes, content_type=content_type)
+    token = uuid.uuid4().hex
+    blob.metadata = {"firebaseStorageDownloadTokens": token}
+    blob.patch()
+    image_url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{storage_path.replace('/', '%2F')}?alt=media&token={token}"
+
+    extracted_tests = []
+    for test in report["results"]:
+        extracted_tests.append({
+            "item": test.get("item") or test.get("synonym", ""),
+            "value": test.get("value"),
+            "unit": test.get("unit", ""),
+            "reference_range": test.get("reference_range", ""),
+            "flag": test.get("flag", False)
+        })
+
+    extracted_date = report.get("patient_info", {}).get("date")
+    if not extracted_date:
+        extracted_date = datetime.now(egypt_tz).date()
+    elif isinstance(extracted_date, str):
+        try:
+            extracted_date = datetime.strptime(extracted_date, "%Y-%m-%d").date()
+        except ValueError:
+            extracted_date = datetime.now(egypt_tz).date()
+
+    current_timestamp = datetime.now(egypt_tz)
+
+    biomarker_entry = {
+        "extracted_date": extracted_date.isoformat(),
+        "added_date": current_timestamp.isoformat(),
+        "results": extracted_tests,
+        "added_by": added_by,
+        "image_url": image_url
+    }
 
+    if is_valid_facility_or_doctor(added_by):
+        user_ref = db.collection("Users").document(national_id)
+        if not user_ref.get().exists:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        full_record = {
+            **biomarker_entry,
+            "added_by_name": resolve_added_by_name(added_by),
+            "patient_name": fetch_patient_name(user_ref)
+        }
 
-def store_procedure_under_facility(facility_id: str, patient_id: str, procedure_type: str, procedure_data: dict):
-    facility_docs = db.collection("Facilities").where("facility_id", "==", facility_id).stream()
-    facility_doc = next(facility_docs, None)
-    if not facility_doc:
-        return
-    facility_doc_id = facility_doc.id
-    timestamp = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
-    db.collection("Facilities").document(facility_doc_id) \
-        .collection("PatientsMadeProcedures").document(patient_id) \
-        .collection(procedure_type).document(timestamp).set(procedure_data)
+        timestamp_id = current_timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        db.collection("Users").document(national_id) \
+            .collection("ClinicalIndicators").document("bloodbiomarkers") \
+            .collection("Records").document(timestamp_id).set(full_record)
+        mark_risk_inputs_changed(national_id, "biomarkers")
+        invalidate_report(national_id)
+
+        store_procedure_under_facility(added_by, national_id, "bloodbiomarkers", full_record)
+
+        return {
+            "message": "✅ Biomarker added directly by doctor/facility",
+            "image_url": image_url,
+            "timestamp": timestamp_id,
+            "added_by": added_by
+        }
+
+    doctor_name = is_doctor_assigned(national_id)
+    assigned_to = doctor_name or auto_assign_reviewer(national_id)["assigned_to"]
+    doc_id = uuid.uuid4().hex
+
+    submit_pending(assigned_to, "bloodbiomarkers", doc_id, {
+        "national_id": national_id,
+        "record": biomarker_entry,
+        "data_type": "bloodbiomarkers",
+        "assigned_to": assigned_to,
+        "assigned_doctor_name": doctor_name,
+        "submitted_at": current_timestamp  # Stored as a Firestore Timestamp
+    })
+
+    return {
+        "status": "submitted_for_approval",
+        "assigned_to": assigned_to,
+        "doc_id": doc_id,
+        "image_url": image_url,
+        "validity_score": report.get("validity_score"),
+        "domain_score": report.get("domain_score"),
+        "results": extracted_tests
+    }
 
 
 @router.post("/{national_id}/ocr")
@@ -40,105 +127,40 @@ async def add_biomarker_via_ocr(
 ):
     try:
         image_bytes = await image.read()
-        report = process_medical_report(image_bytes)
-
-        if report.get("error"):
-            raise HTTPException(status_code=400, detail=report["error"])
-        if not report["is_valid"] or not report["is_medical"]:
-            raise HTTPException(status_code=422, detail="Image is not valid or not medical")
-
-        filename = f"{uuid.uuid4().hex}_{image.filename}"
-        storage_path = f"lab_tests/{filename}"
-        blob = bucket.blob(storage_path)
-        blob.upload_from_string(image_bytes, content_type=image.content_type)
-        token = uuid.uuid4().hex
-        blob.metadata = {"firebaseStorageDownloadTokens": token}
-        blob.patch()
-        image_url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{storage_path.replace('/', '%2F')}?alt=media&token={token}"
-
-        extracted_tests = []
-        for test in report["results"]:
-            extracted_tests.append({
-                "item": test.get("item") or test.get("synonym", ""),
-                "value": test.get("value"),
-                "unit": test.get("unit", ""),
-                "reference_range": test.get("reference_range", ""),
-                "flag": test.get("flag", False)
-            })
-
-        extracted_date = report.get("patient_info", {}).get("date")
-        if not extracted_date:
-            extracted_date = datetime.now(egypt_tz).date()
-        elif isinstance(extracted_date, str):
-            try:
-                extracted_date = datetime.strptime(extracted_date, "%Y-%m-%d").date()
-            except ValueError:
-                extracted_date = datetime.now(egypt_tz).date()
-
-        current_timestamp = datetime.now(egypt_tz)
-
-        biomarker_entry = {
-            "extracted_date": extracted_date.isoformat(),
-            "added_date": current_timestamp.isoformat(),
-            "results": extracted_tests,
-            "added_by": added_by,
-            "image_url": image_url
-        }
-
-        if is_valid_facility_or_doctor(added_by):
-            user_ref = db.collection("Users").document(national_id)
-            if not user_ref.get().exists:
-                raise HTTPException(status_code=404, detail="User not found")
-
-            full_record = {
-                **biomarker_entry,
-                "added_by_name": resolve_added_by_name(added_by),
-                "patient_name": fetch_patient_name(user_ref)
-            }
-
-            timestamp_id = current_timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            db.collection("Users").document(national_id) \
-                .collection("ClinicalIndicators").document("bloodbiomarkers") \
-                .collection("Records").document(timestamp_id).set(full_record)
-
-            store_procedure_under_facility(added_by, national_id, "bloodbiomarkers", full_record)
-
-            return {
-                "message": "✅ Biomarker added directly by doctor/facility",
-                "image_url": image_url,
-                "timestamp": timestamp_id,
-                "added_by": added_by
-            }
-
-        doctor_name = is_doctor_assigned(national_id)
-        assigned_to = doctor_name or auto_assign_reviewer(national_id)["assigned_to"]
-        doc_id = uuid.uuid4().hex
-
-        db.collection("PendingApprovals").document(assigned_to) \
-            .collection("bloodbiomarkers").document(doc_id).set({
-                "national_id": national_id,
-                "record": biomarker_entry,
-                "data_type": "bloodbiomarkers",
-                "assigned_to": assigned_to,
-                "assigned_doctor_name": doctor_name,
-                "submitted_at": current_timestamp.isoformat()
-            })
-
-        return {
-            "status": "submitted_for_approval",
-            "assigned_to": assigned_to,
-            "doc_id": doc_id,
-            "image_url": image_url,
-            "validity_score": report.get("validity_score"),
-            "domain_score": report.get("domain_score"),
-            "results": extracted_tests
-        }
+        # OCR and Firestore calls are blocking; keep them off the event loop
+        gender = await run_in_threadpool(fetch_patient_gender, db.collection("Users").document(national_id))
+        report = await run_in_threadpool(run_ocr, image_bytes, None, gender)
+        return await run_in_threadpool(
+            handle_ocr_report, national_id, report, image_bytes, image.filename, image.content_type, added_by
+        )
 
     except Exception as e:
         print(f"Error processing biomarker OCR: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 
+@router.post("/{national_id}/ocr/jobs", status_code=202)
+async def submit_biomarker_ocr_job(
+    national_id: str,
+    image: UploadFile = File(...),
+    added_by: str = Form(...)
+):
+    image_bytes = await image.read()
+    gender = await run_in_threadpool(fetch_patient_gender, db.collection("Users").document(national_id))
+    job_id = await run_in_threadpool(
+        submit_ocr_job, national_id, image_bytes, image.filename, image.content_type, added_by, handle_ocr_report, gender
+    )
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/ocr/jobs/{job_id}")
+def get_biomarker_ocr_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    return job
+
+
 @router.get("/{national_id}")
 def get_biomarkers(national_id: str):
     try:
@@ -173,6 +195,8 @@ def edit_biomarker_record(
 
         # Update only the results field (other metadata like image_url remains intact)
         record_ref.update({"results": updated_results})
+        mark_risk_inputs_changed(national_id, "biomarkers")
+        invalidate_report(national_id)
 
         return {"message": "Biomarker results updated successfully", "timestamp": timestamp_id}
 
@@ -215,6 +239,8 @@ def add_manual_biomarker(
         # Append new result
         latest_data["results"].append(record)
         latest_doc_ref.set(latest_data)
+        mark_risk_inputs_changed(national_id, "biomarkers")
+        invalidate_report(national_id)
 
         return {"message": "Manual result added to latest test", "timestamp": docs[0].id}
     except Exception as e:
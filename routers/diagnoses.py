@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from models.schema import DiagnosisEntry
 from firebase_config import db
+from routers.report_cache import invalidate_report
 from datetime import datetime
 import pytz
 
@@ -23,6 +24,7 @@ def add_diagnosis(national_id: str, entry: DiagnosisEntry):
     data["user_id"] = national_id
 
     user_ref.collection("diagnoses").document(doc_id).set(data)
+    invalidate_report(national_id)
     return {"message": "Diagnosis added", "doc_id": doc_id}
 
 
@@ -55,6 +57,7 @@ def update_diagnosis(national_id: str, record_id: str, entry: DiagnosisEntry):
     data["user_id"] = national_id
 
     record_ref.set(data)
+    invalidate_report(national_id)
     return {"message": "Diagnosis updated", "record_id": record_id}
 
 
@@ -72,4 +75,5 @@ def delete_diagnosis(national_id: str, record_id: str, added_by: str):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this diagnosis.")
 
     record_ref.delete()
+    invalidate_report(national_id)
     return {"message": "Diagnosis deleted", "record_id": record_id}
@@ -3,8 +3,70 @@ from fastapi import APIRouter, HTTPException
 from typing import Optional
 from firebase_config import db
 from models.schema import DoctorAssignment
+from routers.reviewer_directory import reviewer_directory
 
 router = APIRouter(prefix="/doctor-assignments", tags=["Doctor Assignments"])
+
+
+# -------------------- Reverse Index --------------------
+# PatientAssignments/{national_id} mirrors the assignment stored under either
+# Doctors/{email}/AssignedPatients or the DoctorAssignments fallback, so a
+# patient's doctor is resolved with a single document read.
+def get_patient_assignment_ref(patient_national_id: str):
+    return db.collection("PatientAssignments").document(patient_national_id)
+
+
+def set_patient_assignment(patient_national_id: str, doctor_email: str, doctor_name: str, registered: bool, batch=None):
+    """
+    Point the patient's index entry at this doctor. The latest assignment
+    wins, so assigning a patient again moves them to the new doctor. The old
+    scan instead returned the first match (any fallback, then registered
+    doctors in email order) and ignored later assignments to other doctors.
+    """
+    data = {
+        "patient_national_id": patient_national_id,
+        "doctor_email": doctor_email,
+        "doctor_name": doctor_name or "Unknown",
+        "registered": registered,
+        "updated_at": datetime.now().isoformat()
+    }
+    ref = get_patient_assignment_ref(patient_national_id)
+    if batch is not None:
+        batch.set(ref, data)
+    else:
+        ref.set(data)
+
+
+def rename_doctor_assignments(doctor_email: str, doctor_name: str) -> int:
+    """Refresh the doctor name copied into the registered doctor's index entries."""
+    docs = db.collection("PatientAssignments").where("doctor_email", "==", doctor_email).stream()
+    renamed = 0
+    pending_writes = 0
+    batch = db.batch()
+    for doc in docs:
+        if not doc.to_dict().get("registered"):
+            continue  # Fallback entries keep the name given at assignment, as check_doctor always returned
+        batch.update(doc.reference, {"doctor_name": doctor_name or "Unknown"})
+        renamed += 1
+        pending_writes += 1
+        if pending_writes == 500:  # Firestore batch limit
+            batch.commit()
+            batch = db.batch()
+            pending_writes = 0
+    if pending_writes:
+        batch.commit()
+    return renamed
+
+
+def remove_doctor_assignments(doctor_email: str) -> int:
+    docs = db.collection("PatientAssignments").where("doctor_email", "==", doctor_email).stream()
+    removed = 0
+    for doc in docs:
+        doc.reference.delete()
+        removed += 1
+    return removed
+
+
 @router.post("/")
 def assign_doctor(assignment: DoctorAssignment):
     doc_id = f"{assignment.doctor_email}_{assignment.patient_national_id}"
@@ -24,6 +86,10 @@ def assign_doctor(assignment: DoctorAssignment):
                 "assigned_at": datetime.now().isoformat()
             })
 
+        doctor_name = doctor_doc.to_dict().get("doctor_name") or assignment.doctor_name
+        set_patient_assignment(assignment.patient_national_id, assignment.doctor_email, doctor_name, registered=True)
+        reviewer_directory.invalidate(assignment.doctor_email)  # Drop a cached "unknown" for this reviewer
+
         return {
             "assigned_to": assigned_to,
             "message": f"✅ Doctor {assignment.doctor_email} assigned to patient {assignment.patient_national_id} and saved under AssignedPatients"
@@ -40,6 +106,9 @@ def assign_doctor(assignment: DoctorAssignment):
             "timestamp": datetime.now().isoformat()
         })
 
+        set_patient_assignment(assignment.patient_national_id, assignment.doctor_email, assignment.doctor_name, registered=False)
+        reviewer_directory.invalidate(assignment.doctor_email)  # Now a fallback reviewer; drop a cached "unknown"
+
         db.collection("AdminNotifications").document("unregistered_doctors") \
             .collection("Notifications").document(doc_id).set({
                 "patient_national_id": assignment.patient_national_id,
@@ -56,57 +125,66 @@ def assign_doctor(assignment: DoctorAssignment):
 
 
 def is_doctor_assigned(patient_national_id: str) -> Optional[str]:
-    # First check fallback DoctorAssignments
-    docs = db.collection("DoctorAssignments") \
-        .where("patient_national_id", "==", patient_national_id) \
-        .stream()
-    for doc in docs:
-        return doc.to_dict().get("doctor_email")
-
-    # If not found, check all registered doctors
-    doctors = db.collection("Doctors").stream()
-    for doctor in doctors:
-        doctor_email = doctor.id
-        assigned_doc = db.collection("Doctors") \
-            .document(doctor_email) \
-            .collection("AssignedPatients") \
-            .document(patient_national_id).get()
-        if assigned_doc.exists:
-            return doctor_email
-
+    assignment_doc = get_patient_assignment_ref(patient_national_id).get()
+    if assignment_doc.exists:
+        return assignment_doc.to_dict().get("doctor_email")
     return None
 
 @router.get("/check")
 def check_doctor(patient_national_id: str):
-    # First, check fallback DoctorAssignments
-    docs = db.collection("DoctorAssignments") \
-        .where("patient_national_id", "==", patient_national_id) \
-        .stream()
-
-    for doc in docs:
+    assignment_doc = get_patient_assignment_ref(patient_national_id).get()
+    if not assignment_doc.exists:
+        raise HTTPException(status_code=404, detail="No doctor assigned to this patient.")
+
+    assignment = assignment_doc.to_dict()
+    return {
+        "email": assignment.get("doctor_email"),
+        "name": assignment.get("doctor_name", "Unknown")
+    }
+
+
+@router.post("/backfill-index")
+def backfill_patient_assignments():
+    """
+    Rebuild PatientAssignments from AssignedPatients and DoctorAssignments,
+    picking the doctor the old lookup found first for patients assigned more
+    than once: a fallback assignment, else the first registered doctor by email.
+    """
+    doctor_names = {doc.id: doc.to_dict().get("doctor_name", "Unknown") for doc in db.collection("Doctors").stream()}
+    entries = {}
+
+    for doc in db.collection_group("AssignedPatients").stream():
+        doctor_email = doc.reference.parent.parent.id
+        if doctor_email not in doctor_names:
+            continue
+        previous = entries.get(doc.id)
+        if previous is None or doctor_email < previous[0]:
+            entries[doc.id] = (doctor_email, doctor_names[doctor_email], True)
+
+    for doc in db.collection("DoctorAssignments").stream():
         fallback = doc.to_dict()
-        return {
-            "email": fallback.get("doctor_email"),
-            "name": fallback.get("doctor_name", "Unknown")
-        }
-
-    # Second, check registered doctors' AssignedPatients
-    doctors = db.collection("Doctors").stream()
-    for doctor in doctors:
-        doctor_email = doctor.id
-        assigned_doc = db.collection("Doctors") \
-            .document(doctor_email) \
-            .collection("AssignedPatients") \
-            .document(patient_national_id).get()
-
-        if assigned_doc.exists:
-            doctor_data = db.collection("Doctors").document(doctor_email).get().to_dict()
-            return {
-                "email": doctor_email,
-                "name": doctor_data.get("doctor_name", "Unknown")
-            }
-
-    raise HTTPException(status_code=404, detail="No doctor assigned to this patient.")
+        patient_id = fallback.get("patient_national_id")
+        if not patient_id or not fallback.get("doctor_email"):
+            continue
+        entries[patient_id] = (fallback["doctor_email"], fallback.get("doctor_name", "Unknown"), False)
+
+    batch = db.batch()
+    pending_writes = 0
+    for patient_id, (doctor_email, doctor_name, registered) in entries.items():
+        set_patient_assignment(patient_id, doctor_email, doctor_name, registered, batch=batch)
+        pending_writes += 1
+        if pending_writes == 500:  # Firestore batch limit
+            batch.commit()
+            batch = db.batch()
+            pending_writes = 0
+    if pending_writes:
+        batch.commit()
+    reviewer_directory.invalidate()  # Resync reviewers with the assignments just re-read
+
+    return {
+        "indexed": len(entries),
+        "message": f"✅ Indexed {len(entries)} patient assignments."
+    }
 
 
 def auto_assign_reviewer(patient_national_id: str) -> dict:
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from models.schema import EmergencyContact
 from firebase_config import db
+from routers.report_cache import invalidate_report
 from datetime import datetime
 import pytz
 
@@ -21,6 +22,7 @@ def add_contact(national_id: str, entry: EmergencyContact):
     data["timestamp"] = record_id
 
     user_ref.collection("emergency_contacts").document(record_id).set(data)
+    invalidate_report(national_id)
     return {"message": "Emergency contact added", "record_id": record_id}
 
 # ---------------------- Get All Emergency Contacts ----------------------
@@ -48,6 +50,7 @@ def update_contact(national_id: str, record_id: str, entry: EmergencyContact):
     data["timestamp"] = record_id
 
     record_ref.set(data)
+    invalidate_report(national_id)
     return {"message": "Emergency contact updated", "record_id": record_id}
 
 # ---------------------- Delete Emergency Contact ----------------------
@@ -60,4 +63,5 @@ def delete_contact(national_id: str, record_id: str):
         raise HTTPException(status_code=404, detail="Record not found")
 
     record_ref.delete()
+    invalidate_report(national_id)
     return {"message": "Emergency contact deleted"}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from models.schema import FamilyHistoryEntry
 from firebase_config import db
+from routers.report_cache import invalidate_report
 from datetime import datetime
 import pytz
 
@@ -22,6 +23,7 @@ def add_family_history(national_id: str, entry: FamilyHistoryEntry):
     data["timestamp"] = record_id
 
     user_ref.collection("family_history").document(record_id).set(data)
+    invalidate_report(national_id)
     return {"message": "Family history entry added", "record_id": record_id}
 
 
@@ -57,6 +59,7 @@ def update_family_history(national_id: str, record_id: str, entry: FamilyHistory
     data["timestamp"] = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
 
     record_ref.set(data)
+    invalidate_report(national_id)
     return {"message": "Family history entry updated", "record_id": record_id}
 
 
@@ -77,4 +80,5 @@ def delete_family_history(national_id: str, record_id: str, request: Request):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this record.")
 
     record_ref.delete()
+    invalidate_report(national_id)
     return {"message": "Family history entry deleted", "record_id": record_id}
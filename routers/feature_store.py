@@ -0,0 +1,74 @@
+from datetime import datetime
+import pytz
+from firebase_admin import firestore
+from firebase_config import db
+
+egypt_tz = pytz.timezone("Africa/Cairo")
+
+# Sources the risk features are derived from (see risk_assessment.fetch_risk_inputs)
+RISK_SOURCES = ("user", "measurements", "hypertension", "biomarkers", "medications")
+
+
+def get_feature_snapshot_ref(national_id: str):
+    return db.collection("Users").document(national_id).collection("FeatureStore").document("risk")
+
+
+def mark_risk_inputs_changed(national_id: str, source: str):
+    """
+    Record that one of a patient's risk inputs was written.
+
+    Called by the write paths of the source's router. The next risk assessment
+    re-reads only the sources listed in `changed_sources`; everything else is
+    taken from the cached snapshot.
+    """
+    if source not in RISK_SOURCES:
+        raise ValueError(f"Unknown risk input source: {source}")
+    try:
+        get_feature_snapshot_ref(national_id).set({
+            "changed_sources": firestore.ArrayUnion([source]),
+            "version": firestore.Increment(1),
+            "changed_at": datetime.now(egypt_tz).isoformat()
+        }, merge=True)
+    except Exception as e:
+        # The record itself is already saved; a lost marker must not fail the request
+        print(f"Error marking risk inputs changed for {national_id}: {str(e)}")
+        try:
+            get_feature_snapshot_ref(national_id).delete()  # Force a full rebuild instead
+        except Exception:
+            pass
+
+
+def load_feature_snapshot(national_id: str):
+    """Return the snapshot document (or None) as a DocumentSnapshot, for its update_time."""
+    snapshot = get_feature_snapshot_ref(national_id).get()
+    return snapshot if snapshot.exists else None
+
+
+def save_feature_snapshot(national_id: str, snapshot, source_features: dict, features: dict, bmi: float, prediction: dict) -> bool:
+    """
+    Store the per-source model inputs, features and prediction of a fresh
+    assessment and clear `changed_sources`. Only derived model inputs are
+    kept, never the patient's documents. The write is conditional on the
+    snapshot not having changed since it was read, so a record written
+    meanwhile keeps its marker. Returns False when the snapshot was skipped
+    for that reason.
+    """
+    data = {
+        "source_features": source_features,
+        "features": features,
+        "bmi": bmi,
+        "prediction": prediction,
+        "changed_sources": [],
+        "computed_at": datetime.now(egypt_tz).isoformat()
+    }
+    ref = get_feature_snapshot_ref(national_id)
+    try:
+        if snapshot is None:
+            ref.create({**data, "version": 0})
+        else:
+            # Also drops the raw "inputs" copy older snapshots stored
+            ref.update({**data, "inputs": firestore.DELETE_FIELD}, option=db.write_option(last_update_time=snapshot.update_time))
+        return True
+    except Exception as e:
+        print(f"Feature snapshot for {national_id} not saved: {str(e)}")
+        return False
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Request
 from models.schema import HypertensionEntry
 from firebase_config import db
+from routers.feature_store import mark_risk_inputs_changed
+from routers.report_cache import invalidate_report
 from datetime import datetime
 import pytz
 
@@ -31,6 +33,8 @@ def add_bp(national_id: str, entry: HypertensionEntry):
         .collection("Records") \
         .document(timestamp_id) \
         .set(data)
+    mark_risk_inputs_changed(national_id, "hypertension")
+    invalidate_report(national_id)
 
     return {"message": "Blood pressure record added", "id": timestamp_id}
 
@@ -72,6 +76,8 @@ def update_bp(national_id: str, record_id: str, entry: HypertensionEntry):
         "dia_value": entry.dia_value,
         "pulse_pressure": pulse_pressure
     })
+    mark_risk_inputs_changed(national_id, "hypertension")
+    invalidate_report(national_id)
 
     return {"message": "Blood pressure record updated", "id": record_id}
 
@@ -95,4 +101,6 @@ def delete_bp(national_id: str, record_id: str, request: Request):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this record")
 
     record_ref.delete()
+    mark_risk_inputs_changed(national_id, "hypertension")
+    invalidate_report(national_id)
     return {"message": "Record deleted", "id": record_id}
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+from urllib.parse import urlparse, parse_qs, unquote
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+PDF_IMAGE_CACHE_DIR = os.environ.get("PDF_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_image_cache"))
+PDF_IMAGE_CACHE_MAX_BYTES = int(os.environ.get("PDF_IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PDF_IMAGE_CACHE_EVICT_TO = 0.9  # Evict down to this fraction of the limit, so the next writes do not rescan
+
+_evict_lock = threading.Lock()
+_size_lock = threading.Lock()
+_total_bytes = None  # Running size of the cache, from one scan on first use; resynced by every eviction
+
+
+def cache_key(image_url: str, max_width: float, max_height: float) -> str:
+    """
+    Key a processed image by what determines its content: the Storage object
+    path, its download token (a new upload gets a new token) and the target
+    size. Other URLs are keyed by the full URL.
+    """
+    parsed = urlparse(image_url)
+    if "/o/" in parsed.path:
+        storage_path = unquote(parsed.path.split("/o/", 1)[1])
+        token = parse_qs(parsed.query).get("token", [""])[0]
+        source = f"{parsed.netloc}|{storage_path}|{token}"
+    else:
+        source = image_url
+    return hashlib.sha256(f"{source}|{max_width:.1f}x{max_height:.1f}".encode()).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(PDF_IMAGE_CACHE_DIR, key[:2], key + ".jpg")
+
+
+def get(key: str) -> Optional[bytes]:
+    """Return the cached bytes for `key`, marking the entry recently used, or None."""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # mtime is the LRU clock
+        return data
+    except OSError:
+        return None
+
+
+def put(key: str, data: bytes):
+    """
+    Store an entry, writing to a temporary name and atomically moving it into
+    place so other requests and worker processes never see a partial file.
+    Cache failures are logged and otherwise ignored.
+    """
+    path = _path(key)
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error caching image {key}: {str(e)}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return
+    if _add_bytes(len(data) - replaced) > PDF_IMAGE_CACHE_MAX_BYTES:
+        evict()
+
+
+def _scan():
+    """Return ([(mtime, size, path)], total size) for every cached entry"""
+    entries, total = [], 0
+    for root, _, files in os.walk(PDF_IMAGE_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".jpg"):
+                continue
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+            total += st.st_size
+    return entries, total
+
+
+def _add_bytes(delta: int) -> int:
+    global _total_bytes
+    with _size_lock:
+        if _total_bytes is None:
+            _total_bytes = _scan()[1]
+        else:
+            _total_bytes += delta
+        return _total_bytes
+
+
+def evict(max_bytes: Optional[int] = None):
+    """
+    Delete least recently used entries until the cache fits in
+    PDF_IMAGE_CACHE_EVICT_TO of `max_bytes`. This is the only full scan of
+    the cache; it also resets the running total, which other processes
+    sharing the directory can make drift.
+    """
+    global _total_bytes
+    max_bytes = PDF_IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not _evict_lock.acquire(blocking=False):
+        return  # Another thread is already evicting
+    try:
+        entries, total = _scan()
+        target = int(max_bytes * PDF_IMAGE_CACHE_EVICT_TO)
+        if total > max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        with _size_lock:
+            _total_bytes = total
+    finally:
+        _evict_lock.release()
@@ -1,21 +1,27 @@
 import io
 import numpy as np
 from PIL import Image
-from main import load_multitask_model, model
+import main
+from routers.inference_batcher import BatchPredictor
+
+def load_radiology_model():
+    # Ensure the model is loaded before prediction; read it off the module so the loaded instance is used
+    main.load_multitask_model()
+    return main.model
+
+# Concurrent uploads share one batched predict
+_classifier = BatchPredictor(load_radiology_model)
 
 def classify_radiology_image(image_bytes, img_size=(224, 224)):
     try:
-        # Ensure the model is loaded before prediction
-        load_multitask_model()
-
         # Preprocess the image
         image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
         image = image.resize(img_size)
-        img_array = np.expand_dims(np.array(image) / 255.0, axis=0)
+        img_array = np.array(image) / 255.0
 
         # Predict
-        prediction = model.predict(img_array)
-        confidence = float(prediction[0][0])
+        prediction = _classifier.predict(img_array)
+        confidence = float(np.ravel(prediction[0])[0])
         is_valid = confidence > 0.5
 
         return {
@@ -0,0 +1,79 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+import numpy as np
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_LATENCY_MS = float(os.environ.get("INFERENCE_MAX_LATENCY_MS", "5"))
+
+
+class BatchPredictor:
+    """
+    Micro-batching wrapper around a Keras model.
+
+    `predict` takes one sample (no batch axis) and blocks until its scores are
+    ready. A single background thread waits up to `max_latency_ms` after the
+    first queued sample for up to `max_batch_size` samples, stacks them into one
+    `model.predict` call and fans each row back to its caller. Multi-output
+    models return a list with one row per output, like `model.predict` does.
+    """
+
+    def __init__(self, load_model: Callable, max_batch_size: Optional[int] = None,
+                 max_latency_ms: Optional[float] = None):
+        self._load_model = load_model
+        self.max_batch_size = max_batch_size or INFERENCE_MAX_BATCH_SIZE
+        self.max_latency = (max_latency_ms if max_latency_ms is not None else INFERENCE_MAX_LATENCY_MS) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def predict(self, sample: np.ndarray):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((np.asarray(sample), future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        model = None
+        while True:
+            batch = self._collect()
+
+            # Images of different shapes/modes cannot share a tensor
+            groups = {}
+            for sample, future in batch:
+                groups.setdefault(sample.shape, []).append((sample, future))
+
+            for items in groups.values():
+                try:
+                    if model is None:
+                        model = self._load_model()
+                    outputs = model.predict(np.stack([sample for sample, _ in items]), verbose=0)
+                    for i, (_, future) in enumerate(items):
+                        if isinstance(outputs, (list, tuple)):
+                            future.set_result([output[i] for output in outputs])
+                        else:
+                            future.set_result(outputs[i])
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
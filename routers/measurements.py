@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from models.schema import HeightWeightCreate
 from firebase_config import db
+from routers.feature_store import mark_risk_inputs_changed
+from routers.report_cache import invalidate_report
 from datetime import datetime
 import pytz
 
@@ -43,6 +45,8 @@ def add_or_update_height_weight(national_id: str, entry: HeightWeightCreate):
     }
 
     measurements_doc.set(data)
+    mark_risk_inputs_changed(national_id, "measurements")
+    invalidate_report(national_id)
     return {"message": "Body measurement saved", "bmi": bmi}
 
 
@@ -3,6 +3,8 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException, Request, Depends
 from models.schema import MedicationEntry
 from firebase_config import db
+from routers.feature_store import mark_risk_inputs_changed
+from routers.report_cache import invalidate_report
 import pytz
 
 router = APIRouter(prefix="/medications", tags=["Medications"])
@@ -39,6 +41,8 @@ def add_medication(national_id: str, entry: MedicationEntry):
     medication_data["timestamp"] = timestamp_id
 
     user_ref.collection("medications").document(timestamp_id).set(medication_data)
+    mark_risk_inputs_changed(national_id, "medications")
+    invalidate_report(national_id)
     return {"message": "Medication added", "doc_id": timestamp_id}
 
 
@@ -82,6 +86,8 @@ def update_medication(national_id: str, record_id: str, entry: MedicationEntry):
             updated_data.pop("start_date", None)
 
     med_ref.update(updated_data)
+    mark_risk_inputs_changed(national_id, "medications")
+    invalidate_report(national_id)
     return {"message": "Medication updated", "id": record_id}
 
 
@@ -100,4 +106,6 @@ def delete_medication(national_id: str, record_id: str, request: Request):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this record")
 
     med_ref.delete()
+    mark_risk_inputs_changed(national_id, "medications")
+    invalidate_report(national_id)
     return {"message": "Medication deleted", "id": record_id}
@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+# Each worker process imports its own TensorFlow and loads its own EasyOCR reader and
+# Keras model, on top of the API process, which already imports TensorFlow in main.py
+# and holds the radiology model. That does not fit the 1 GB fly.io VM, so the default
+# runs OCR in-process, one image at a time. Only raise it on VMs with room for a second
+# TensorFlow process; a replaced worker is reaped before its successor starts, so
+# recycling never holds two copies at once.
+OCR_ENGINE_WORKERS = int(os.environ.get("OCR_ENGINE_WORKERS", "0"))                    # 0 runs OCR in-process
+OCR_ENGINE_TIMEOUT = float(os.environ.get("OCR_ENGINE_TIMEOUT", "120"))                # Seconds per job, including waits
+OCR_ENGINE_LOAD_TIMEOUT = float(os.environ.get("OCR_ENGINE_LOAD_TIMEOUT", "600"))      # Seconds to preload models
+OCR_ENGINE_MAX_JOBS_PER_WORKER = int(os.environ.get("OCR_ENGINE_MAX_JOBS_PER_WORKER", "50"))  # Recycle after K jobs
+
+_READY = "ready"
+
+
+def _failure(message: str) -> dict:
+    # Same shape process_medical_report returns when processing fails
+    return {
+        "error": message,
+        "is_valid": False,
+        "domain_score": 0,
+        "validity_score": 0,
+        "is_medical": False,
+        "results": [],
+        "patient_info": {}
+    }
+
+
+def _worker_main(conn):
+    # Runs in the child process: preload EasyOCR and the Keras model once, then serve jobs
+    from routers import ocr_utils
+    ocr_utils.get_reader()
+    ocr_utils.get_model()
+    conn.send(_READY)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        image_bytes, gender = job
+        conn.send(ocr_utils.process_medical_report(image_bytes, gender))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.load_deadline = time.monotonic() + OCR_ENGINE_LOAD_TIMEOUT
+        self.ready = False
+        self.jobs_done = 0
+
+    def wait_ready(self, timeout: float) -> Optional[bool]:
+        """
+        Wait up to `timeout` seconds for the models to load. Returns True once
+        loaded, False if loading failed or passed OCR_ENGINE_LOAD_TIMEOUT, and
+        None if `timeout` ran out first and the worker is still loading.
+        """
+        if self.ready:
+            return True
+        load_left = self.load_deadline - time.monotonic()
+        if self.conn.poll(max(0.0, min(timeout, load_left))):
+            self.ready = self.conn.recv() == _READY
+            return self.ready
+        return None if timeout < load_left else False
+
+    def stop(self, graceful: bool = True):
+        if graceful:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        # Always reap, even after a crash, so the models' memory is released before a replacement loads
+        self.process.join()
+        self.process.close()
+        self.conn.close()
+
+
+class OCREngine:
+    """
+    Fixed set of OCR worker processes, each with its own preloaded models.
+
+    Callers block until a worker is idle, so at most `workers` images are
+    processed at once. A call's timeout covers the wait for an idle worker,
+    the wait for its models and the OCR itself, which is also capped at the
+    engine's own timeout. A worker that runs out of time while processing,
+    dies, or has served `max_jobs_per_worker` jobs is replaced with a fresh
+    process.
+    """
+
+    def __init__(self, workers: int, timeout: float, max_jobs_per_worker: int):
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._ctx = multiprocessing.get_context("spawn")  # No forked TensorFlow state
+        self._idle = queue.Queue()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx)
+        with self._workers_lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker, graceful: bool = False) -> _Worker:
+        with self._workers_lock:
+            self._workers.remove(worker)
+        worker.stop(graceful)  # Returns only once the old process has exited
+        return self._spawn()
+
+    def run(self, image_bytes: bytes, timeout: Optional[float] = None, gender: Optional[str] = None) -> dict:
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            return _failure(f"No OCR worker became free within {timeout:.0f}s")
+        try:
+            ready = worker.wait_ready(deadline - time.monotonic())
+            if ready is None:
+                return _failure(f"OCR models were still loading after {timeout:.0f}s")
+            if not ready:
+                worker = self._replace(worker)
+                return _failure("OCR engine failed to load models")
+
+            worker.conn.send((image_bytes, gender))
+            if not worker.conn.poll(max(0.0, min(deadline - time.monotonic(), self.timeout))):
+                worker = self._replace(worker)
+                return _failure(f"OCR timed out after {timeout:.0f}s")
+
+            result = worker.conn.recv()
+            worker.jobs_done += 1
+            if worker.jobs_done >= self.max_jobs_per_worker:
+                worker = self._replace(worker, graceful=True)
+            return result
+
+        except (EOFError, OSError) as e:
+            print(f"OCR worker crashed: {str(e)}")
+            worker = self._replace(worker)
+            return _failure(f"OCR worker crashed: {str(e)}")
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_in_process_lock = threading.Lock()  # One in-process OCR at a time, as a single worker would
+
+
+def start_engine() -> Optional[OCREngine]:
+    global _engine
+    with _engine_lock:
+        if _engine is None and OCR_ENGINE_WORKERS > 0:
+            _engine = OCREngine(OCR_ENGINE_WORKERS, OCR_ENGINE_TIMEOUT, OCR_ENGINE_MAX_JOBS_PER_WORKER)
+    return _engine
+
+
+def stop_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+            _engine = None
+
+
+def run_ocr(image_bytes: bytes, timeout: Optional[float] = None, gender: Optional[str] = None) -> dict:
+    engine = start_engine()
+    if engine is None:
+        # In-process OCR cannot be interrupted, so the timeout only bounds the wait for a turn
+        timeout = timeout or OCR_ENGINE_TIMEOUT
+        if not _in_process_lock.acquire(timeout=timeout):
+            return _failure(f"OCR was busy for {timeout:.0f}s")
+        try:
+            from routers.ocr_utils import process_medical_report
+            return process_medical_report(image_bytes, gender)
+        finally:
+            _in_process_lock.release()
+    return engine.run(image_bytes, timeout, gender)
@@ -0,0 +1,194 @@
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import pytz
+from fastapi import HTTPException
+from firebase_admin import firestore
+from firebase_config import db
+from routers.ocr_engine import run_ocr
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "2"))                    # Jobs processed at the same time
+OCR_MAX_PENDING_JOBS = int(os.environ.get("OCR_MAX_PENDING_JOBS", "20"))  # Queued + running jobs before submit is refused
+OCR_JOB_TIMEOUT_SECONDS = float(os.environ.get("OCR_JOB_TIMEOUT_SECONDS", "600"))  # Queue wait + OCR before a job is failed
+OCR_JOB_SAVE_GRACE_SECONDS = float(os.environ.get("OCR_JOB_SAVE_GRACE_SECONDS", "60"))  # Past expires_at before a stuck save is failed
+
+# Stable across restarts of the same machine, so its orphaned jobs can be found on startup
+OCR_INSTANCE_ID = os.environ.get("FLY_MACHINE_ID") or socket.gethostname()
+# queued -> running -> saving -> completed; any of the first three can become failed.
+# "saving" marks a job whose record is being written, so it is no longer expired on read.
+_ACTIVE_STATUSES = ["queued", "running", "saving"]
+
+egypt_tz = pytz.timezone("Africa/Cairo")
+
+_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr-job")
+_slots = threading.BoundedSemaphore(OCR_MAX_PENDING_JOBS)
+
+
+def get_job_ref(job_id: str):
+    return db.collection("OCRJobs").document(job_id)
+
+
+def submit_ocr_job(
+    national_id: str,
+    image_bytes: bytes,
+    filename: str,
+    content_type: str,
+    added_by: str,
+    on_report: Callable[..., dict],
+    gender: Optional[str] = None
+) -> str:
+    """
+    Queue an OCR job and return its ID immediately.
+
+    `on_report(national_id, report, image_bytes, filename, content_type, added_by)`
+    runs on the worker once OCR finishes and hands the report to the normal
+    direct-write / PendingApprovals flow; its return value becomes the job result.
+    `gender` selects sex-specific reference ranges when flagging results.
+    """
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="OCR queue is full, please retry shortly")
+
+    job_id = uuid.uuid4().hex
+    now = datetime.now(egypt_tz)
+    expires_at = now + timedelta(seconds=OCR_JOB_TIMEOUT_SECONDS)
+    try:
+        get_job_ref(job_id).set({
+            "job_id": job_id,
+            "national_id": national_id,
+            "added_by": added_by,
+            "filename": filename,
+            "status": "queued",
+            "instance_id": OCR_INSTANCE_ID,
+            "submitted_at": now.isoformat(),
+            "expires_at": expires_at.isoformat()
+        })
+        _executor.submit(
+            _run_job, job_id, expires_at, national_id, image_bytes, filename, content_type, added_by, on_report, gender
+        )
+    except Exception:
+        _slots.release()
+        raise
+
+    return job_id
+
+
+def _failed(status_code: int, error) -> dict:
+    return {
+        "status": "failed",
+        "status_code": status_code,
+        "error": error,
+        "finished_at": datetime.now(egypt_tz).isoformat()
+    }
+
+
+@firestore.transactional
+def _transition_in_transaction(transaction, job_ref, from_status: str, update: dict) -> bool:
+    snapshot = job_ref.get(transaction=transaction)
+    if not snapshot.exists or (snapshot.to_dict() or {}).get("status") != from_status:
+        return False
+    transaction.update(job_ref, update)
+    return True
+
+
+def _transition(job_ref, from_status: str, update: dict) -> bool:
+    """
+    Apply `update` only if the job is still in `from_status`, so a job that
+    get_job or recover_orphaned_jobs already failed is never revived.
+    """
+    return _transition_in_transaction(db.transaction(), job_ref, from_status, update)
+
+
+def _run_job(job_id, expires_at, national_id, image_bytes, filename, content_type, added_by, on_report, gender):
+    job_ref = get_job_ref(job_id)
+    status = "queued"
+    try:
+        remaining = (expires_at - datetime.now(egypt_tz)).total_seconds()
+        if remaining <= 0:
+            _transition(job_ref, status, _failed(504, "OCR job timed out while queued"))
+            return
+
+        if not _transition(job_ref, status, {"status": "running", "started_at": datetime.now(egypt_tz).isoformat()}):
+            return
+        status = "running"
+        # The engine's waits for a free worker and for its models count against the job deadline too
+        report = run_ocr(image_bytes, timeout=remaining, gender=gender)
+
+        # Claim the job before writing the record; if it expired meanwhile the
+        # client was told it failed and may resubmit, so the report is dropped
+        if not _transition(job_ref, status, {"status": "saving"}):
+            print(f"OCR job {job_id} expired before its report was saved")
+            return
+        status = "saving"
+        result = on_report(national_id, report, image_bytes, filename, content_type, added_by)
+        _transition(job_ref, status, {
+            "status": "completed",
+            "result": result,
+            "finished_at": datetime.now(egypt_tz).isoformat()
+        })
+    except HTTPException as e:
+        _transition(job_ref, status, _failed(e.status_code, e.detail))
+    except Exception as e:
+        print(f"Error running OCR job {job_id}: {str(e)}")
+        _transition(job_ref, status, _failed(500, str(e)))
+    finally:
+        _slots.release()
+
+
+def recover_orphaned_jobs() -> int:
+    """
+    Fail the queued, running and saving jobs this machine owned before it restarted.
+
+    They lived on the in-memory executor, so nothing will ever finish them.
+    Jobs orphaned by machines that never come back are failed by get_job
+    once they pass their expires_at. Returns the number of jobs failed.
+    """
+    orphans = db.collection("OCRJobs") \
+        .where("instance_id", "==", OCR_INSTANCE_ID) \
+        .where("status", "in", _ACTIVE_STATUSES) \
+        .stream()
+
+    failed = 0
+    pending_writes = 0
+    batch = db.batch()
+    for doc in orphans:
+        batch.update(doc.reference, _failed(503, "OCR job was interrupted by a server restart, please resubmit"))
+        failed += 1
+        pending_writes += 1
+        if pending_writes == 500:  # Firestore batch limit
+            batch.commit()
+            batch = db.batch()
+            pending_writes = 0
+    if pending_writes:
+        batch.commit()
+    if failed:
+        print(f"Failed {failed} OCR jobs orphaned by a restart")
+    return failed
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job_ref = get_job_ref(job_id)
+    doc = job_ref.get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+
+    # A job whose worker is gone never finishes, so expire it here. A job
+    # that is saving its record gets a grace period to finish writing it.
+    expires_at = job.get("expires_at")
+    status = job.get("status")
+    if status in _ACTIVE_STATUSES and expires_at:
+        deadline = datetime.fromisoformat(expires_at)
+        if status == "saving":
+            deadline += timedelta(seconds=OCR_JOB_SAVE_GRACE_SECONDS)
+        if deadline < datetime.now(egypt_tz):
+            update = _failed(504, "OCR job timed out")
+            if _transition(job_ref, status, update):
+                job.update(update)
+            else:
+                job = job_ref.get().to_dict()  # The worker moved it on first
+    return job
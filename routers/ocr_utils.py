@@ -8,6 +8,7 @@ from io import BytesIO
 from datetime import datetime
 import numpy as np
 import re
+from functools import lru_cache
 import arabic_reshaper
 from bidi.algorithm import get_display
 from typing import Dict, List, Tuple, Optional, Union
@@ -177,6 +178,181 @@ PATIENT_INFO_PATTERNS = {
     "date": [r"(?:Date|تاريخ|التاريخ)\s*[:\-=\]\s]*\s*(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})", r"\b\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\b"],  # Date pattern
 }
 
+# ─── Compiled Synonym Matcher ───────────────────────────────────────
+class SynonymMatcher:
+    """
+    Aho-Corasick automaton over the lower-cased synonyms in MEDICAL_TESTS.
+
+    One pass over a line reports every canonical test with a synonym occurring
+    anywhere in it (the same hits as testing each synonym with `in`), so
+    matching cost is linear in the text length rather than in text × synonyms.
+    """
+
+    def __init__(self, tests: Dict[str, dict]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        outputs = [set()]
+        for canon, test_data in tests.items():
+            for synonym in test_data["synonyms"]:
+                state = 0
+                for ch in synonym.lower():
+                    if ch not in self._goto[state]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        outputs.append(set())
+                        self._goto[state][ch] = len(self._goto) - 1
+                    state = self._goto[state][ch]
+                outputs[state].add(canon)
+
+        # Breadth-first failure links; each state inherits its fallback's matches
+        frontier = list(self._goto[0].values())
+        while frontier:
+            next_frontier = []
+            for state in frontier:
+                for ch, child in self._goto[state].items():
+                    fallback = self._fail[state]
+                    while fallback and ch not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    self._fail[child] = self._goto[fallback].get(ch, 0)
+                    outputs[child] |= outputs[self._fail[child]]
+                    next_frontier.append(child)
+            frontier = next_frontier
+        self._out = [frozenset(o) for o in outputs]
+
+    def _states(self, text: str):
+        goto, fail = self._goto, self._fail
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            yield state
+
+    def find(self, text_lower: str) -> set:
+        found = set()
+        for state in self._states(text_lower):
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+    def contains_any(self, text_lower: str) -> bool:
+        return any(self._out[state] for state in self._states(text_lower))
+
+
+SYNONYM_MATCHER = SynonymMatcher(MEDICAL_TESTS)
+TEST_ORDER = {canon: i for i, canon in enumerate(MEDICAL_TESTS)}
+MEDICAL_INDICATORS = [
+    "medical report", "lab results", "test results",
+    "تقرير طبي", "نتائج التحليل", "مختبر", "تحليل"
+]
+VALUE_PATTERN = re.compile(r"([\d\.,]+)")
+RANGE_PATTERN = re.compile(r"(\d+\.?\d*)\s*[-–~]\s*(\d+\.?\d*)\s*(.*)")
+
+
+# ─── Compiled Reference Ranges ──────────────────────────────────────
+SEX_PREFIX_PATTERN = re.compile(r"^\s*(male|female)\s*:\s*", re.IGNORECASE)
+SEX_SUFFIX_PATTERN = re.compile(r"\((male|female)\)", re.IGNORECASE)
+QUALIFIER_PREFIX_PATTERN = re.compile(r"^\s*([A-Za-z]+)\s*:\s*")
+QUALIFIER_SUFFIX_PATTERN = re.compile(r"\(([^)]*)\)")
+BOUNDS_PATTERN = re.compile(r"(\d+\.?\d*)\s*%?\s*[-–]\s*(\d+\.?\d*)")
+LIMIT_PATTERN = re.compile(r"([<>])\s*(\d+\.?\d*)")
+MICRO_PREFIX_PATTERN = re.compile(r"(^|/)u(?=l$|g/)")  # "ug/dl", "cells/ul" -> μ; "u/l" is enzyme units
+
+# Words on the report that state a range's qualifier; otherwise the qualifier itself
+QUALIFIER_ALIASES = {
+    "fasting": ["fasting", "fbs", "fbg"],
+    "postprandial": ["postprandial", "post prandial", "ppbs"],
+}
+
+
+def parse_reference_range(range_str: str, unit: str = "") -> List[Dict]:
+    """
+    Parse a free-text range ("Male: 13.5-17.5 g/dL", "<200 mg/dL", ">40 mg/dL (Male)")
+    into entries of {sex, qualifier, unit, low, high, low_inclusive, high_inclusive}.
+    A missing bound is None; `<x` / `>x` give exclusive bounds.
+    """
+    entries = []
+    for line in (range_str or "").replace(",", "").split("\n"):
+        sex, qualifier = None, None
+
+        prefix = SEX_PREFIX_PATTERN.match(line) or QUALIFIER_PREFIX_PATTERN.match(line)
+        if prefix:
+            if prefix.re is SEX_PREFIX_PATTERN:
+                sex = prefix.group(1).lower()
+            else:
+                qualifier = prefix.group(1).lower()
+            line = line[prefix.end():]
+
+        suffix = SEX_SUFFIX_PATTERN.search(line)
+        if suffix:
+            sex = suffix.group(1).lower()
+        elif QUALIFIER_SUFFIX_PATTERN.search(line):
+            qualifier = QUALIFIER_SUFFIX_PATTERN.search(line).group(1).strip().lower()
+
+        bounds = BOUNDS_PATTERN.search(line)
+        limit = LIMIT_PATTERN.search(line)
+        if bounds:
+            low, high, low_inclusive, high_inclusive = float(bounds.group(1)), float(bounds.group(2)), True, True
+        elif limit and limit.group(1) == "<":
+            low, high, low_inclusive, high_inclusive = None, float(limit.group(2)), True, False
+        elif limit:
+            low, high, low_inclusive, high_inclusive = float(limit.group(2)), None, False, True
+        else:
+            continue
+
+        entries.append({
+            "sex": sex,
+            "qualifier": qualifier,
+            "unit": unit,
+            "low": low,
+            "high": high,
+            "low_inclusive": low_inclusive,
+            "high_inclusive": high_inclusive
+        })
+    return entries
+
+
+# canonical test -> parsed entries, built once from MEDICAL_TESTS
+REFERENCE_RANGES = {
+    canon: parse_reference_range(test_data.get("normal_range", ""), test_data.get("unit", ""))
+    for canon, test_data in MEDICAL_TESTS.items()
+}
+
+
+def _unit_key(unit: str) -> str:
+    unit = (unit or "").replace(" ", "").replace("µ", "μ").lower()
+    return MICRO_PREFIX_PATTERN.sub(r"\1μ", unit)
+
+
+def _qualifier_stated(qualifier: str, context: str) -> bool:
+    words = QUALIFIER_ALIASES.get(qualifier, [qualifier])
+    return any(re.search(rf"\b{re.escape(word)}\b", context) for word in words)
+
+
+def lookup_reference_range(canon: str, gender: Optional[str] = None, unit: str = "", context: str = "") -> Optional[Dict]:
+    """
+    Pick the table range for a test from what the report itself states.
+
+    `unit` is the unit read from the report and must match the table's unit,
+    so a value printed in other units (e.g. WBC in x10^3/μL) is never compared
+    against it. Entries tied to a qualifier (fasting, postprandial, optimal,
+    low risk) are only used when `context`, the report text naming the test,
+    states it; sex-specific entries only when the patient's gender is known.
+    """
+    if not unit:
+        return None
+    gender = (gender or "").lower() or None
+    context = (context or "").lower()
+    for entry in REFERENCE_RANGES.get(canon, []):
+        if not entry["unit"] or _unit_key(unit) != _unit_key(entry["unit"]):
+            return None
+        if entry["qualifier"] and not _qualifier_stated(entry["qualifier"], context):
+            continue
+        if entry["sex"] is None or entry["sex"] == gender:
+            return entry
+    return None
+
+
 # ─── Initialize EasyOCR Reader ──────────────────────────────────────
 _reader_instance = None
 def get_reader():
@@ -235,17 +411,59 @@ def normalize_unit(unit: str) -> str:
     return unit
 
 
-def is_abnormal(value_str: str, range_str: str) -> Optional[bool]:
+@lru_cache(maxsize=1024)
+def _parse_printed_range(range_str: str) -> Optional[Dict]:
+    entries = parse_reference_range(range_str)
+    return entries[0] if entries else None
+
+
+def _to_float(value_str) -> float:
     try:
-        val = float(value_str)
-        match = re.search(r"(\d+\.?\d*)\s*[-–]\s*(\d+\.?\d*)", range_str.replace(",", ""))
-        if match:
-            low = float(match.group(1))
-            high = float(match.group(2))
-            return not (low <= val <= high)
-    except:
-        pass
-    return None
+        return float(value_str)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def flag_results(
+    results: List[Dict],
+    gender: Optional[str] = None,
+    report_units: Optional[List[str]] = None,
+    contexts: Optional[List[str]] = None
+) -> List[Optional[bool]]:
+    """
+    Abnormal flags for a whole report in one vectorized comparison.
+    The range printed on the report wins; otherwise the REFERENCE_RANGES table
+    is used with the patient's gender, but only for results whose unit was read
+    from the report (`report_units`) and whose qualifiers appear in `contexts`.
+    None means no usable value or range.
+    """
+    if not results:
+        return []
+    report_units = report_units or [""] * len(results)
+    contexts = contexts or [""] * len(results)
+
+    ranges = []
+    for r, unit, context in zip(results, report_units, contexts):
+        printed = _parse_printed_range(r.get("reference_range") or "")
+        ranges.append(printed or lookup_reference_range(r.get("item", ""), gender, unit, context))
+
+    values = np.array([_to_float(r.get("value")) for r in results], dtype=float)
+    lows = np.array([rng["low"] if rng and rng["low"] is not None else np.nan for rng in ranges], dtype=float)
+    highs = np.array([rng["high"] if rng and rng["high"] is not None else np.nan for rng in ranges], dtype=float)
+    low_inclusive = np.array([bool(rng and rng["low_inclusive"]) for rng in ranges])
+    high_inclusive = np.array([bool(rng and rng["high_inclusive"]) for rng in ranges])
+
+    with np.errstate(invalid="ignore"):
+        below = np.where(low_inclusive, values < lows, values <= lows)
+        above = np.where(high_inclusive, values > highs, values >= highs)
+    abnormal = below | above
+    known = ~np.isnan(values) & np.array([rng is not None for rng in ranges])
+
+    return [bool(a) if k else None for a, k in zip(abnormal, known)]
+
+
+def is_abnormal(value_str: str, range_str: str) -> Optional[bool]:
+    return flag_results([{"value": value_str, "reference_range": range_str}])[0]
 
 # ─── EXTRACTION FUNCTIONS ───────────────
 def extract_patient_name(text: str) -> str:
@@ -278,58 +496,57 @@ def extract_patient_id(text: str) -> Optional[str]:
 # ─── IS MEDICAL REPORT CHECK ────────────
 def is_medical_report(text: str) -> bool:
     text_lower = text.lower()
-    for test_data in MEDICAL_TESTS.values():
-        for syn in test_data["synonyms"]:
-            if syn.lower() in text_lower:
-                return True
-    medical_indicators = [
-        "medical report", "lab results", "test results",
-        "تقرير طبي", "نتائج التحليل", "مختبر", "تحليل"
-    ]
-    return any(ind in text_lower for ind in medical_indicators)
-
-def extract_medical_tests(text: str) -> List[Dict[str, str]]:
+    if SYNONYM_MATCHER.contains_any(text_lower):
+        return True
+    return any(ind in text_lower for ind in MEDICAL_INDICATORS)
+
+def extract_medical_tests(text: str, gender: Optional[str] = None) -> List[Dict[str, str]]:
     results = []
+    report_units = []  # Unit as printed on the report, "" when none was read
+    contexts = []
     seen = set()
     lines = [line.strip() for line in text.split("\n") if line.strip()]
     for i in range(len(lines) - 2):
-        current_line = lines[i].lower()
-        next_line = lines[i + 1]
-        third_line = lines[i + 2]
-
-        for canon, test_data in MEDICAL_TESTS.items():
-            for synonym in test_data["synonyms"]:
-                if synonym.lower() in current_line:
-                    # Try to extract numeric value from next line
-                    value_match = re.search(r"([\d\.,]+)", next_line)
-                    value = value_match.group(1).replace(",", ".") if value_match else ""
-
-                    # Try to extract reference range and unit from third line
-                    range_match = re.search(r"(\d+\.?\d*)\s*[-–~]\s*(\d+\.?\d*)\s*(.*)", third_line.replace(",", ""))
-                    if not value:
-                        continue
-
-                    # Extract unit and range if possible
-                    unit = normalize_unit(range_match.group(3)) if range_match else test_data.get("unit", "")
-                    reference_range = f"{range_match.group(1)} - {range_match.group(2)}" if range_match else ""
-                    flag = is_abnormal(value, reference_range)
-
-                    key = f"{canon}-{value}-{reference_range}"
-                    if key not in seen:
-                        seen.add(key)
-                        results.append({
-                            "item": canon,
-                            "value": value,
-                            "reference_range": reference_range,
-                            "unit": unit,
-                            "flag": flag if flag is not None else False
-                        })
+        matched_tests = SYNONYM_MATCHER.find(lines[i].lower())
+        if not matched_tests:
+            continue
+
+        # Try to extract numeric value from next line
+        value_match = VALUE_PATTERN.search(lines[i + 1])
+        value = value_match.group(1).replace(",", ".") if value_match else ""
+        if not value:
+            continue
+
+        # Try to extract reference range and unit from third line
+        range_match = RANGE_PATTERN.search(lines[i + 2].replace(",", ""))
+        reference_range = f"{range_match.group(1)} - {range_match.group(2)}" if range_match else ""
+        printed_unit = range_match.group(3) if range_match else lines[i + 1][value_match.end():]
+        report_unit = normalize_unit(printed_unit) if printed_unit.strip() else ""
+
+        for canon in sorted(matched_tests, key=TEST_ORDER.get):
+            # Extract unit if possible
+            unit = normalize_unit(range_match.group(3)) if range_match else MEDICAL_TESTS[canon].get("unit", "")
+
+            key = f"{canon}-{value}-{reference_range}"
+            if key not in seen:
+                seen.add(key)
+                results.append({
+                    "item": canon,
+                    "value": value,
+                    "reference_range": reference_range,
+                    "unit": unit
+                })
+                report_units.append(report_unit)
+                contexts.append(lines[i])
+
+    for result, flag in zip(results, flag_results(results, gender, report_units, contexts)):
+        result["flag"] = flag if flag is not None else False
     return results
 
 
 
 # ─── MAIN PROCESSING FUNCTION ───────────
-def process_medical_report(image_source: Union[str, bytes, object]) -> Dict:
+def process_medical_report(image_source: Union[str, bytes, object], gender: Optional[str] = None) -> Dict:
     try:
 
         # Open image depending on input type
@@ -371,7 +588,7 @@ def process_medical_report(image_source: Union[str, bytes, object]) -> Dict:
 
         text = extract_text_with_easyocr(image)
         result["ocr_text"] = text
-        result["is_medical"] = any(syn.lower() in text.lower() for test in MEDICAL_TESTS.values() for syn in test["synonyms"])
+        result["is_medical"] = SYNONYM_MATCHER.contains_any(text.lower())
 
         if not result["is_medical"]:
             result["error"] = "No medical content detected"
@@ -380,7 +597,7 @@ def process_medical_report(image_source: Union[str, bytes, object]) -> Dict:
         # Extract patient info + medical tests
         result["patient_info"]["patient_name"] = extract_patient_name(text)
         result["patient_info"]["date"] = extract_date(text)
-        result["results"] = extract_medical_tests(text)
+        result["results"] = extract_medical_tests(text, gender)
 
         return result
 
@@ -1,124 +1,415 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from firebase_config import db, bucket
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import Table, TableStyle
+from reportlab.platypus import Table, LongTable, TableStyle
+from reportlab.pdfbase import pdfmetrics
 from io import BytesIO
 import uuid
 from datetime import datetime
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.platypus import Paragraph
 from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.utils import ImageReader
 import requests
 from PIL import Image
-import tempfile
+from routers import image_cache
+from routers.report_cache import report_fingerprint
 import os
+import time
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 router = APIRouter(prefix="/pdf", tags=["PDF Generator"])
+logger = logging.getLogger(__name__)
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+PDF_FETCH_WORKERS = int(os.environ.get("PDF_FETCH_WORKERS", "16"))         # Firestore reads in flight across requests
+PDF_FETCH_TIMEOUT = float(os.environ.get("PDF_FETCH_TIMEOUT", "10"))       # Seconds per source, from the start of the fetch
+PDF_IMAGE_WORKERS = int(os.environ.get("PDF_IMAGE_WORKERS", "6"))          # Image downloads in flight across requests
+PDF_IMAGE_MAX_DOWNLOAD_BYTES = int(os.environ.get("PDF_IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))  # Per source image
+PDF_RECORD_PAGE_SIZE = int(os.environ.get("PDF_RECORD_PAGE_SIZE", "100"))    # Records read and drawn per chunk
+PDF_BIOMARKER_PAGE_SIZE = int(os.environ.get("PDF_BIOMARKER_PAGE_SIZE", "10"))  # Smaller: each test carries images
+PDF_MAX_RECORDS_PER_SECTION = int(os.environ.get("PDF_MAX_RECORDS_PER_SECTION", "0"))  # Newest N only; 0 = all
+
+_fetch_executor = ThreadPoolExecutor(max_workers=PDF_FETCH_WORKERS, thread_name_prefix="pdf-fetch")
+_image_executor = ThreadPoolExecutor(max_workers=PDF_IMAGE_WORKERS, thread_name_prefix="pdf-image")
+
+# Report section -> Firestore path under Users/{id}
+DIRECT_COLLECTIONS = [
+    ("diagnoses", "diagnoses"),
+    ("emergency_contacts", "emergency_contacts"),
+    ("family_history", "family_history"),
+    ("medications", "medications"),
+    ("surgeries", "surgeries")
+]
+# Every write path stores these under ClinicalIndicators/{name}/Records; there is no other layout to fall back to
+CLINICAL_SUBCOLLECTIONS = [
+    ("allergies", "allergies"),
+    ("biomarkers", "bloodbiomarkers"),
+    ("hypertension", "Hypertension"),
+    ("radiology", "radiology")
+]
+# Sections with unbounded histories, read and drawn page by page
+STREAMED_SECTIONS = {"biomarkers": PDF_BIOMARKER_PAGE_SIZE, "hypertension": PDF_RECORD_PAGE_SIZE,
+                     "medications": PDF_RECORD_PAGE_SIZE}
+
+
+class RecordStream:
+    """
+    Pages through a record collection in document-ID order (record IDs are
+    timestamps), `page_size` documents per read, so a section never holds
+    more than one page of records. With `cap`, only the newest `cap` records
+    are read, newest first, and `omitted` is set to the number of older
+    records left out (None if they could not be counted). A page that fails
+    to load ends the stream and is reported in `error`.
+    """
+
+    def __init__(self, collection_ref, page_size=PDF_RECORD_PAGE_SIZE, cap=PDF_MAX_RECORDS_PER_SECTION):
+        self._ref = collection_ref
+        self.page_size = page_size
+        self.cap = cap
+        self.omitted = 0
+        self.error = None
+        self._first_page = []
+
+    def _limit(self, read):
+        return min(self.page_size, self.cap - read) if self.cap else self.page_size
+
+    def _read(self, after, limit):
+        query = self._ref.order_by("__name__", direction="DESCENDING" if self.cap else "ASCENDING")
+        if after is not None:
+            query = query.start_after(after)
+        return list(query.limit(limit).stream())
+
+    def load(self):
+        """Read the first page. Returns self, so it can be a fetch plan entry"""
+        self._first_page = self._read(None, self._limit(0))
+        return self
+
+    def __bool__(self):
+        return bool(self._first_page)
+
+    @property
+    def first_page_size(self):
+        return len(self._first_page)
+
+    def pages(self):
+        """Yield the records as lists of dicts, reading each page when the previous one is done"""
+        page, limit, read = self._first_page, self._limit(0), 0
+        try:
+            while page:
+                read += len(page)
+                yield [doc.to_dict() for doc in page]
+                if len(page) < limit:
+                    return
+                limit = self._limit(read)
+                if limit <= 0:
+                    self.omitted = self._count_older(read)
+                    return
+                page = self._read(page[-1], limit)
+        except Exception as e:
+            self.error = str(e)
+            logger.warning("Error reading records after %d: %s", read, self.error)
+
+    def _count_older(self, read):
+        try:
+            total = self._ref.count().get()[0][0].value
+        except Exception as e:
+            logger.warning("Error counting omitted records: %s", e)
+            return None
+        return max(0, total - read)
+
+
+def record_pages(records):
+    """Yield a section's records page by page; a plain list is a single page"""
+    if isinstance(records, RecordStream):
+        yield from records.pages()
+    elif records:
+        yield records
+
+
+def section_size(records):
+    """Number of records for layout estimates (the first page of a stream)"""
+    return records.first_page_size if isinstance(records, RecordStream) else len(records)
+
+
+def plan_user_data_fetch(user_ref):
+    """
+    Return {source: callable} for every read the report needs. Each callable
+    performs exactly one Firestore request so they can all be issued at once.
+    Streamed sections only read their first page here (see RecordStream).
+    """
+    clinical_indicators_ref = user_ref.collection("ClinicalIndicators")
+
+    def stream(ref):
+        return lambda: [doc.to_dict() for doc in ref.stream()]
+
+    def get(ref):
+        return lambda: (lambda doc: doc.to_dict() if doc.exists else None)(ref.get())
+
+    def read(collection_name, ref):
+        if collection_name in STREAMED_SECTIONS:
+            return RecordStream(ref, STREAMED_SECTIONS[collection_name]).load
+        return stream(ref)
+
+    def latest_risk():
+        risk_docs = user_ref.collection("risk_predictions") \
+            .order_by("timestamp", direction="DESCENDING").limit(1).stream()
+        risk_data = next(risk_docs, None)
+        return risk_data.to_dict() if risk_data else None
+
+    plan = {"basic_info": get(user_ref)}
+    for collection_name, path in DIRECT_COLLECTIONS:
+        plan[collection_name] = read(collection_name, user_ref.collection(path))
+    plan["measurements"] = get(clinical_indicators_ref.document("measurements"))
+    for collection_name, subcoll_name in CLINICAL_SUBCOLLECTIONS:
+        plan[collection_name] = read(collection_name, clinical_indicators_ref.document(subcoll_name).collection("Records"))
+    plan["risk_assessment"] = latest_risk
+    return plan
+
+
+def run_fetch_plan(plan: dict, timeout: float = None):
+    """
+    Issue every read in `plan` concurrently. Returns (results, errors): a read
+    that fails or is still running `timeout` seconds after the plan started is
+    reported in `errors` instead of failing the whole fetch.
+    """
+    deadline = time.monotonic() + (timeout or PDF_FETCH_TIMEOUT)
+    futures = {source: _fetch_executor.submit(fetch) for source, fetch in plan.items()}
+    results, errors = {}, {}
+    for source, future in futures.items():
+        try:
+            results[source] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            future.cancel()
+            errors[source] = f"timed out after {timeout or PDF_FETCH_TIMEOUT:g}s"
+        except Exception as e:
+            errors[source] = str(e)
+    return results, errors
+
+
+# ─── TABLE STYLES ────────────────────────────────────────────────────
+# Built once at import and shared by every table of that kind
+TABLE_STYLES = {
+    "key_value": TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
+    ]),
+    "risk_scores": TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
+        ('TEXTCOLOR', (2, 1), (2, 2), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#CBD5E0")),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]),
+    "diabetes_features": TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#E53E3E")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]),
+    "hypertension_features": TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#D53F8C")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]),
+    "profile_summary": TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
+        ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ]),
+    "medications": TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#CBD5E0")),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]),
+    "record_details": TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0"))
+    ]),
+    "biomarker_results": TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5E0")),
+    ]),
+}
+
+@lru_cache(maxsize=None)
+def risk_level_style(diabetes_color, hypertension_color):
+    return TableStyle([
+        ('BACKGROUND', (2, 1), (2, 1), diabetes_color),
+        ('BACKGROUND', (2, 2), (2, 2), hypertension_color),
+    ])
+
+@lru_cache(maxsize=4096)
+def string_width(text, font_name, font_size):
+    """Memoized pdfmetrics.stringWidth for repeated labels, captions and footers"""
+    return pdfmetrics.stringWidth(text, font_name, font_size)
+
+PAGE_TOP = 10.5 * inch
+PDF_LONG_TABLE_ROWS = int(os.environ.get("PDF_LONG_TABLE_ROWS", "40"))  # Larger tables are built as LongTable
+
+def new_page(c):
+    """Finish the current page and return the y position at the top of the next one"""
+    draw_footer(c, c.getPageNumber())
+    c.showPage()
+    return PAGE_TOP
+
+def draw_table(c, rows, col_widths, style, x, y_pos, bottom=1.5 * inch, repeat_rows=0, gap=0.3 * inch):
+    """
+    Draw a table whose top is at y_pos and return the y position below it.
+
+    A table that fits on one page is moved to a new page if it does not fit in
+    the remaining space. Taller tables are split by row across as many pages
+    as needed, repeating the first `repeat_rows` rows. Rows are measured once
+    and each page is drawn as its own small table, so layout time stays
+    linear in the row count (Table.split re-measures the whole remainder on
+    every page).
+    """
+    table_class = LongTable if len(rows) > PDF_LONG_TABLE_ROWS else Table
+    table = table_class(rows, colWidths=col_widths, repeatRows=repeat_rows, splitByRow=1)
+    table.setStyle(style)
+    width = sum(col_widths)
+    _, height = table.wrapOn(c, width, PAGE_TOP - bottom)
+
+    if height > y_pos - bottom and height <= PAGE_TOP - bottom:
+        y_pos = new_page(c)  # Keep tables that fit on a page together
+    if height <= y_pos - bottom:
+        table.drawOn(c, x, y_pos - height)
+        return y_pos - height - gap
+
+    row_heights = table._rowHeights
+    header_height = sum(row_heights[:repeat_rows])
+    start = 0
+    while start < len(rows):
+        header = rows[:repeat_rows] if start else []
+        available = y_pos - bottom - (header_height if start else 0)
+        end, used = start, 0
+        while end < len(rows) and used + row_heights[end] <= available:
+            used += row_heights[end]
+            end += 1
+        if end <= max(start, repeat_rows if not start else 0):
+            if y_pos < PAGE_TOP:
+                y_pos = new_page(c)  # Not even one data row fits here
+                continue
+            end = max(start, repeat_rows) + 1  # Row taller than a page; draw it anyway
+
+        part = Table(header + rows[start:end], colWidths=col_widths,
+                     rowHeights=(row_heights[:repeat_rows] if start else []) + row_heights[start:end])
+        part.setStyle(style)
+        _, part_height = part.wrapOn(c, width, y_pos - bottom)
+        part.drawOn(c, x, y_pos - part_height)
+        y_pos -= part_height
+        start = end
+        if start < len(rows):
+            y_pos = new_page(c)
+
+    return y_pos - gap
 
 def fetch_all_user_data(user_id: str):
     """Fetch all medical data for a user from Firestore"""
     user_ref = db.collection("Users").document(user_id)
-    doc = user_ref.get()
-    if not doc.exists:
+    results, errors = run_fetch_plan(plan_user_data_fetch(user_ref))
+
+    if "basic_info" in errors:
+        raise HTTPException(status_code=503, detail=f"Error fetching user: {errors['basic_info']}")
+    if results["basic_info"] is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     data = {
-        "basic_info": doc.to_dict(),
+        "basic_info": results["basic_info"],
         "allergies": [],
         "biomarkers": [],
         "diagnoses": [],
         "emergency_contacts": [],
         "family_history": [],
         "hypertension": [],
-        "measurements": None,
+        "measurements": results.get("measurements"),
         "medications": [],
         "radiology": [],
         "surgeries": [],
-        "risk_assessment": None  # ADD THIS LINE
+        "risk_assessment": results.get("risk_assessment"),
+        "fetch_errors": {}
     }
-    
-    # Fetch direct collections (not under ClinicalIndicators)
-    direct_collections = [
-        ("diagnoses", "diagnoses"),
-        ("emergency_contacts", "emergency_contacts"),
-        ("family_history", "family_history"),
-        ("medications", "medications"),
-        ("surgeries", "surgeries")
-    ]
-    
-    for collection_name, path in direct_collections:
-        try:
-            coll_ref = user_ref.collection(path)
-            docs = coll_ref.stream()
-            data[collection_name] = [doc.to_dict() for doc in docs]
-            print(f"Fetched {len(data[collection_name])} records from {collection_name}")
-        except Exception as e:
-            print(f"Error fetching {collection_name}: {str(e)}")
-            continue
-    
-    # Fetch ClinicalIndicators subcollections
-    clinical_indicators_ref = user_ref.collection("ClinicalIndicators")
-    
-    # Fetch measurements (document under ClinicalIndicators)
-    try:
-        measurements_doc = clinical_indicators_ref.document("measurements").get()
-        if measurements_doc.exists:
-            data["measurements"] = measurements_doc.to_dict()
-            print(f"Fetched measurements data")
-    except Exception as e:
-        print(f"Error fetching measurements: {str(e)}")
-    
-    # Fetch subcollections under ClinicalIndicators
-    clinical_subcollections = [
-        ("allergies", "allergies"),
-        ("biomarkers", "bloodbiomarkers"),
-        ("hypertension", "Hypertension"),
-        ("radiology", "radiology")
-    ]
-    
-    for collection_name, subcoll_name in clinical_subcollections:
-        try:
-            # Try to get the Records subcollection
-            records_ref = clinical_indicators_ref.document(subcoll_name).collection("Records")
-            docs = list(records_ref.stream())
-            
-            if docs:
-                data[collection_name] = [doc.to_dict() for doc in docs]
-                print(f"Fetched {len(data[collection_name])} records from ClinicalIndicators/{subcoll_name}/Records")
-            else:
-                # If no Records subcollection, try direct documents under the subcollection
-                direct_docs = list(clinical_indicators_ref.collection(subcoll_name).stream())
-                if direct_docs:
-                    data[collection_name] = [doc.to_dict() for doc in direct_docs]
-                    print(f"Fetched {len(data[collection_name])} records from ClinicalIndicators/{subcoll_name}")
-                else:
-                    print(f"No data found in ClinicalIndicators/{subcoll_name}")
-                    
-        except Exception as e:
-            print(f"Error fetching {collection_name} from ClinicalIndicators/{subcoll_name}: {str(e)}")
-            continue
-    # Fetch risk assessment data
-    try:
-        risk_docs = user_ref.collection("risk_predictions") \
-            .order_by("timestamp", direction="DESCENDING").limit(1).stream()
-        risk_data = next(risk_docs, None)
-        if risk_data:
-            data["risk_assessment"] = risk_data.to_dict()
-            print(f"Fetched risk assessment data")
-    except Exception as e:
-        print(f"Error fetching risk assessment: {str(e)}")
-    # Debug: Print data summary
-    for key, value in data.items():
-        if isinstance(value, list):
-            print(f"{key}: {len(value)} items")
-        elif isinstance(value, dict):
-            print(f"{key}: {len(value)} fields")
-        else:
-            print(f"{key}: {type(value)}")
-    
+
+    for collection_name, _ in DIRECT_COLLECTIONS:
+        data[collection_name] = results.get(collection_name) or []
+
+    for collection_name, _ in CLINICAL_SUBCOLLECTIONS:
+        data[collection_name] = results.get(collection_name) or []
+
+    for section, error in errors.items():
+        data["fetch_errors"][section] = error
+        logger.warning("Error fetching %s for the report of %s: %s", section, user_id, error)
+
     return data
 
 def download_and_process_image(image_url, max_width=4*inch, max_height=3*inch):
@@ -131,22 +422,32 @@ def download_and_process_image(image_url, max_width=4*inch, max_height=3*inch):
         if not (image_url.startswith('http://') or image_url.startswith('https://')):
             return None
             
-        # Download image
+        # Processed images are cached on disk, shared across requests and workers
+        key = image_cache.cache_key(image_url, max_width, max_height)
+        cached = image_cache.get(key)
+        if cached:
+            try:
+                with Image.open(BytesIO(cached)) as img:
+                    width, height = img.size
+                return {'data': cached, 'width': width, 'height': height}
+            except OSError:
+                pass  # Unreadable entry, download again
+
+        # Download image into memory, refusing anything over the size limit
         response = requests.get(image_url, timeout=10, stream=True)
         response.raise_for_status()
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
-            temp_path = temp_file.name
-        
+        if int(response.headers.get('Content-Length') or 0) > PDF_IMAGE_MAX_DOWNLOAD_BYTES:
+            raise ValueError(f"image larger than {PDF_IMAGE_MAX_DOWNLOAD_BYTES} bytes")
+
+        downloaded = BytesIO()
+        for chunk in response.iter_content(chunk_size=65536):
+            downloaded.write(chunk)
+            if downloaded.tell() > PDF_IMAGE_MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"image larger than {PDF_IMAGE_MAX_DOWNLOAD_BYTES} bytes")
+        downloaded.seek(0)
+
         # Process image with PIL - IMPROVED FOR BETTER QUALITY
-        with Image.open(temp_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
+        with Image.open(downloaded) as img:
             # Get original dimensions
             original_width, original_height = img.size
             aspect_ratio = original_width / original_height
@@ -160,37 +461,120 @@ def download_and_process_image(image_url, max_width=4*inch, max_height=3*inch):
                 new_width = new_height * aspect_ratio
             
             # Only resize if the image is significantly larger than target
-            if original_width > max_width * 1.5 or original_height > max_height * 1.5:
-                # Resize with high quality resampling
-                img_resized = img.resize((int(new_width), int(new_height)), Image.Resampling.LANCZOS)
+            resize = original_width > max_width * 1.5 or original_height > max_height * 1.5
+            if resize:
+                # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding (no-op for other formats)
+                img.draft('RGB', (int(new_width), int(new_height)))
+
+            # Convert to RGB if necessary
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+
+            if resize:
+                # Resize with high quality resampling; reducing_gap shrinks large non-JPEGs cheaply first
+                img_resized = img.resize((int(new_width), int(new_height)), Image.Resampling.LANCZOS, reducing_gap=3.0)
             else:
                 # Keep original size if it's not too large
                 img_resized = img
-                new_width = original_width
-                new_height = original_height
             
             # Save with higher quality
-            processed_path = temp_path.replace('.jpg', '_processed.jpg')
-            img_resized.save(processed_path, 'JPEG', quality=95, optimize=False)  # Higher quality
-        
-        # Clean up original temp file
-        os.unlink(temp_path)
+            processed = BytesIO()
+            img_resized.save(processed, 'JPEG', quality=95, optimize=False)  # Higher quality
+            new_width, new_height = img_resized.size
+
+        data = processed.getvalue()
+        image_cache.put(key, data)
         
         return {
-            'path': processed_path,
+            'data': data,
             'width': new_width,
             'height': new_height
         }
         
     except Exception as e:
-        print(f"Error processing image {image_url}: {str(e)}")
+        logger.warning("Error processing image %s: %s", image_url, e)
         return None
 
-def draw_image_if_available(c, image_url, x, y, max_width=4*inch, max_height=3*inch, caption=""):
+def load_image(image_url, max_width=4*inch, max_height=3*inch):
+    """Download/process an image and wrap it in an in-memory ImageReader"""
+    image_info = download_and_process_image(image_url, max_width, max_height)
+    if not image_info:
+        return None
+    return {'reader': ImageReader(BytesIO(image_info['data'])), 'width': image_info['width'], 'height': image_info['height']}
+
+def biomarker_image_urls(test):
+    image_urls = []
+    if test.get("image_url"):
+        image_urls.append(test["image_url"])
+    if test.get("images"):
+        image_urls.extend(test["images"])
+    return image_urls
+
+def radiology_image_urls(exam):
+    image_urls = []
+    for key in ["image_url", "images", "report_images"]:
+        if isinstance(exam.get(key), list):
+            image_urls.extend(exam.get(key))
+        elif exam.get(key):
+            image_urls.append(exam.get(key))
+    return image_urls
+
+def start_image_prefetch(urls):
+    """Start downloading `urls` on the image pool. Returns {image_url: future}"""
+    return {url: _image_executor.submit(load_image, url)
+            for url in dict.fromkeys(urls) if isinstance(url, str)}
+
+def collect_images(futures):
+    """Wait for a prefetch; failed images are left out and drawn as missing"""
+    images = {}
+    for url, future in futures.items():
+        image_info = future.result()
+        if image_info:
+            images[url] = image_info
+    return images
+
+def prefetch_report_images(data):
+    """
+    Download and resize every biomarker and radiology image concurrently before
+    layout starts. Returns {image_url: image_info} for the renderers. Streamed
+    biomarkers are prefetched page by page while drawing instead (see
+    pages_with_images).
+    """
+    urls = []
+    if isinstance(data.get("biomarkers"), list):
+        for test in data["biomarkers"]:
+            urls.extend(biomarker_image_urls(test))
+    for exam in data.get("radiology") or []:
+        urls.extend(radiology_image_urls(exam))
+
+    futures = start_image_prefetch(urls)
+    images = collect_images(futures)
+    logger.debug("Prefetched %d/%d report images", len(images), len(futures))
+    return images
+
+def pages_with_images(records, image_urls):
+    """
+    Yield (page, images) for a streamed section. The next page's images
+    download while the current page is drawn, so at most two pages of
+    images are held in memory.
+    """
+    previous = None
+    for page in record_pages(records):
+        futures = start_image_prefetch(url for record in page for url in image_urls(record))
+        if previous is not None:
+            yield previous[0], collect_images(previous[1])
+        previous = (page, futures)
+    if previous is not None:
+        yield previous[0], collect_images(previous[1])
+
+def draw_image_if_available(c, image_url, x, y, max_width=4*inch, max_height=3*inch, caption="", images=None):
     if not image_url:
         return y
 
-    image_info = download_and_process_image(image_url, max_width, max_height)
+    if images is not None:
+        image_info = images.get(image_url)  # Prefetched; missing means it failed
+    else:
+        image_info = load_image(image_url, max_width, max_height)
     if not image_info:
         return y
 
@@ -211,24 +595,20 @@ def draw_image_if_available(c, image_url, x, y, max_width=4*inch, max_height=3*i
         if actual_width < max_width:
             draw_x = x + (max_width - actual_width) / 2
 
-        c.drawImage(image_info['path'], draw_x, y - actual_height,
+        c.drawImage(image_info['reader'], draw_x, y - actual_height,
                     width=actual_width, height=actual_height)
 
         if caption:
             c.setFont("Helvetica", 10)
             c.setFillColor(colors.HexColor("#4A5568"))
-            caption_width = c.stringWidth(caption, "Helvetica", 10)
+            caption_width = string_width(caption, "Helvetica", 10)
             caption_x = x + (max_width - caption_width) / 2
             c.drawString(caption_x, y - actual_height - 0.25 * inch, caption)
 
-        os.unlink(image_info['path'])
-
         return y - actual_height - (0.4 * inch if caption else 0.3 * inch)
 
     except Exception as e:
-        print(f"Error drawing image: {str(e)}")
-        if image_info and os.path.exists(image_info['path']):
-            os.unlink(image_info['path'])
+        logger.warning("Error drawing image: %s", e)
         return y
 
 
@@ -300,7 +680,7 @@ def draw_patient_info_card(c, user_data, y_pos):
     date_text = f"Report Date: {report_date}"
     c.setFont("Helvetica-Bold", 10)
     c.setFillColor(colors.HexColor("#2C5282"))
-    date_width = c.stringWidth(date_text, "Helvetica-Bold", 10)
+    date_width = string_width(date_text, "Helvetica-Bold", 10)
     c.drawString(card_x + card_width - date_width - 0.3 * inch, card_y + 0.1 * inch, date_text)
 
 
@@ -323,6 +703,29 @@ def draw_section_header(c, title, y_pos, icon="", min_space_needed=1.5*inch):
 
     return y_pos - 0.7 * inch
 
+def draw_stream_summary(c, records, y_pos):
+    """Note the records a streamed section left out: older ones past the cap, or ones that failed to load"""
+    if not isinstance(records, RecordStream):
+        return y_pos
+
+    notes = []
+    if records.omitted is None:
+        notes.append((f"Showing the {records.cap} most recent records; older records are not included.", "#718096"))
+    elif records.omitted:
+        notes.append((f"Showing the {records.cap} most recent records; "
+                      f"{records.omitted} older records are not included.", "#718096"))
+    if records.error:
+        notes.append(("Some records could not be loaded and are missing from this section.", "#C53030"))
+
+    for note, color in notes:
+        if y_pos < 1.5 * inch:
+            y_pos = new_page(c)
+        c.setFont("Helvetica-Oblique", 9)
+        c.setFillColor(colors.HexColor(color))
+        c.drawString(0.9 * inch, y_pos, note)
+        y_pos -= 0.3 * inch
+    return y_pos
+
 def create_enhanced_table(c, data, y_pos, table_type="data"):
     if not data:
         return y_pos
@@ -345,34 +748,8 @@ def create_enhanced_table(c, data, y_pos, table_type="data"):
     if not table_data:
         return y_pos
 
-    row_height = 0.22 * inch
-    estimated_height = len(table_data) * row_height + 0.3 * inch
-    if y_pos - estimated_height < 1.2 * inch:
-        draw_footer(c, c.getPageNumber())
-        c.showPage()
-        y_pos = 10.5 * inch
-
-    table = Table(table_data, colWidths=[2.2 * inch, 4.5 * inch])
-    table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
-    ]))
-
-    table.wrapOn(c, 6.7 * inch, 8 * inch)
-    table.drawOn(c, 0.9 * inch, y_pos - table._height)
-    return y_pos - table._height - 0.3 * inch
+    return draw_table(c, table_data, [2.2 * inch, 4.5 * inch], TABLE_STYLES["key_value"],
+                      0.9 * inch, y_pos, bottom=1.2 * inch)
 
 def create_risk_assessment_table(c, risk_data, y_pos):
     """Create a specialized table for risk assessment with visual indicators"""
@@ -406,22 +783,8 @@ def create_risk_assessment_table(c, risk_data, y_pos):
     ]
     
     risk_table = Table(risk_scores_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
-    risk_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
-        ('BACKGROUND', (2, 1), (2, 1), diabetes_color),
-        ('BACKGROUND', (2, 2), (2, 2), hypertension_color),
-        ('TEXTCOLOR', (2, 1), (2, 2), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#CBD5E0")),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    risk_table.setStyle(TABLE_STYLES["risk_scores"])
+    risk_table.setStyle(risk_level_style(diabetes_color, hypertension_color))
     
     risk_table.wrapOn(c, 5 * inch, 4 * inch)
     risk_table.drawOn(c, 1 * inch, y_pos - risk_table._height)
@@ -449,20 +812,7 @@ def create_risk_assessment_table(c, risk_data, y_pos):
             ])
         
         diabetes_table = Table(diabetes_data, colWidths=[3*inch, 1.5*inch])
-        diabetes_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#E53E3E")),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
+        diabetes_table.setStyle(TABLE_STYLES["diabetes_features"])
         
         diabetes_table.wrapOn(c, 4.5 * inch, 4 * inch)
         diabetes_table.drawOn(c, 1 * inch, y_pos - diabetes_table._height)
@@ -484,20 +834,7 @@ def create_risk_assessment_table(c, risk_data, y_pos):
             ])
         
         hypertension_table = Table(hypertension_data, colWidths=[3*inch, 1.5*inch])
-        hypertension_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#D53F8C")),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
+        hypertension_table.setStyle(TABLE_STYLES["hypertension_features"])
         
         hypertension_table.wrapOn(c, 4.5 * inch, 4 * inch)
         hypertension_table.drawOn(c, 1 * inch, y_pos - hypertension_table._height)
@@ -523,21 +860,7 @@ def create_risk_assessment_table(c, risk_data, y_pos):
         
         if summary_data:
             summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
-            summary_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
-                ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0")),
-                ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
-                ('TOPPADDING', (0, 0), (-1, -1), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ]))
+            summary_table.setStyle(TABLE_STYLES["profile_summary"])
             
             summary_table.wrapOn(c, 4.5 * inch, 6 * inch)
             summary_table.drawOn(c, 1 * inch, y_pos - summary_table._height)
@@ -559,31 +882,8 @@ def create_medication_table(c, medications, y_pos):
         ]
         table_data.append(row)
 
-    estimated_height = len(table_data) * 0.3 * inch + 0.4 * inch
-    if y_pos - estimated_height < 1.5 * inch:
-        draw_footer(c, c.getPageNumber())
-        c.showPage()
-        y_pos = 10.5 * inch
-
-    table = Table(table_data, colWidths=[1.8 * inch, 1.3 * inch, 1.3 * inch, 2.3 * inch])
-    table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor("#2D3748")),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#CBD5E0")),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8F9FA")]),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-
-    table.wrapOn(c, 6.7 * inch, 8 * inch)
-    table.drawOn(c, 0.9 * inch, y_pos - table._height)
-    return y_pos - table._height - 0.3 * inch
+    return draw_table(c, table_data, [1.8 * inch, 1.3 * inch, 1.3 * inch, 2.3 * inch], TABLE_STYLES["medications"],
+                      0.9 * inch, y_pos, repeat_rows=1)
 
 def should_start_new_page_for_section(section_data, section_type, current_y):
     """Determine if a section needs a new page based on its content"""
@@ -603,115 +903,89 @@ def should_start_new_page_for_section(section_data, section_type, current_y):
     return current_y - estimated_space < 2 * inch
 
 
-def create_biomarker_table_with_images(c, biomarkers, y_pos):
+def create_biomarker_table_with_images(c, biomarkers, y_pos, images=None):
     if not biomarkers:
         return y_pos
 
-    for i, test in enumerate(biomarkers):
-        # Ensure enough space before drawing new biomarker block
-        if y_pos < 4 * inch:
-            draw_footer(c, c.getPageNumber())
-            c.showPage()
-            y_pos = 10.5 * inch
-
-        c.setFillColor(colors.HexColor("#2C5282"))
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(1 * inch, y_pos, f"Blood Test #{i+1}")
-        y_pos -= 0.15 * inch
-
-        # Draw test info table
-        test_data = []
-        for key, value in test.items():
-            if key not in ["results", "images", "image_url"] and value:
-                test_data.append([key.replace('_', ' ').title(), str(value)])
-
-        table = Table(test_data, colWidths=[1.8 * inch, 4 * inch])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0"))
-        ]))
-
-        table.wrapOn(c, 5.8 * inch, 6 * inch)
-        if y_pos - table._height < 1.5 * inch:
-            draw_footer(c, c.getPageNumber())
-            c.showPage()
-            y_pos = 10.5 * inch
-        table.drawOn(c, 1 * inch, y_pos - table._height)
-        y_pos -= table._height + 0.2 * inch
-
-        # Draw results
-        results = test.get("results", [])
-        if results:
-            c.setFillColor(colors.HexColor("#4A5568"))
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(1 * inch, y_pos, "Test Results:")
-            y_pos -= 0.2 * inch
-
-            results_data = [["Test Item", "Value", "Unit", "Reference Range", "Status"]]
-            for result in results:
-                status = "⚠️ Abnormal" if result.get("flag") else "✓ Normal"
-                results_data.append([
-                    result.get('item', 'N/A'),
-                    str(result.get('value', 'N/A')),
-                    result.get('unit', ''),
-                    result.get('reference_range', 'N/A'),
-                    status
-                ])
-
-            results_table = Table(results_data, colWidths=[1.5*inch, 0.8*inch, 0.6*inch, 1.2*inch, 1*inch])
-            results_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C5282")),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5E0")),
-            ]))
-
-            results_table.wrapOn(c, 5.1 * inch, 6 * inch)
-            if y_pos - results_table._height < 1.5 * inch:
+    if isinstance(biomarkers, RecordStream):
+        pages = pages_with_images(biomarkers, biomarker_image_urls)
+    else:
+        pages = [(biomarkers, images)]
+
+    i = 0
+    for page, page_images in pages:
+        for test in page:
+            i += 1
+            # Ensure enough space before drawing new biomarker block
+            if y_pos < 4 * inch:
                 draw_footer(c, c.getPageNumber())
                 c.showPage()
                 y_pos = 10.5 * inch
-            results_table.drawOn(c, 1 * inch, y_pos - results_table._height)
-            y_pos -= results_table._height + 0.2 * inch
-
-        # Draw Images
-        image_urls = []
-        if test.get("image_url"):
-            image_urls.append(test["image_url"])
-        if test.get("images"):
-            image_urls.extend(test["images"])
 
-        if image_urls:
-            c.setFillColor(colors.HexColor("#4A5568"))
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(1 * inch, y_pos, "Test Images:")
+            c.setFillColor(colors.HexColor("#2C5282"))
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(1 * inch, y_pos, f"Blood Test #{i}")
             y_pos -= 0.15 * inch
 
-            for idx, img_url in enumerate(image_urls):
-                if y_pos < 4 * inch:
-                    draw_footer(c, c.getPageNumber())
-                    c.showPage()
-                    y_pos = 10.5 * inch
-
-                y_pos = draw_image_if_available(c, img_url, 2 * inch, y_pos, caption=f"Test Image {idx+1}")
+            # Draw test info table
+            test_data = []
+            for key, value in test.items():
+                if key not in ["results", "images", "image_url"] and value:
+                    test_data.append([key.replace('_', ' ').title(), str(value)])
+
+            y_pos = draw_table(c, test_data, [1.8 * inch, 4 * inch], TABLE_STYLES["record_details"],
+                               1 * inch, y_pos, gap=0.2 * inch)
+
+            # Draw results
+            results = test.get("results", [])
+            if results:
+                c.setFillColor(colors.HexColor("#4A5568"))
+                c.setFont("Helvetica-Bold", 11)
+                c.drawString(1 * inch, y_pos, "Test Results:")
                 y_pos -= 0.2 * inch
 
-        c.setStrokeColor(colors.HexColor("#E2E8F0"))
-        c.setLineWidth(1)
-        c.line(1 * inch, y_pos, 7.5 * inch, y_pos)
-        y_pos -= 0.15 * inch
+                results_data = [["Test Item", "Value", "Unit", "Reference Range", "Status"]]
+                for result in results:
+                    status = "⚠️ Abnormal" if result.get("flag") else "✓ Normal"
+                    results_data.append([
+                        result.get('item', 'N/A'),
+                        str(result.get('value', 'N/A')),
+                        result.get('unit', ''),
+                        result.get('reference_range', 'N/A'),
+                        status
+                    ])
+
+                y_pos = draw_table(c, results_data, [1.5*inch, 0.8*inch, 0.6*inch, 1.2*inch, 1*inch],
+                                   TABLE_STYLES["biomarker_results"], 1 * inch, y_pos, repeat_rows=1, gap=0.2 * inch)
+
+            # Draw Images
+            image_urls = biomarker_image_urls(test)
+
+            if image_urls:
+                c.setFillColor(colors.HexColor("#4A5568"))
+                c.setFont("Helvetica-Bold", 11)
+                c.drawString(1 * inch, y_pos, "Test Images:")
+                y_pos -= 0.15 * inch
+
+                for idx, img_url in enumerate(image_urls):
+                    if y_pos < 4 * inch:
+                        draw_footer(c, c.getPageNumber())
+                        c.showPage()
+                        y_pos = 10.5 * inch
+
+                    y_pos = draw_image_if_available(c, img_url, 2 * inch, y_pos, caption=f"Test Image {idx+1}", images=page_images)
+                    y_pos -= 0.2 * inch
+
+            c.setStrokeColor(colors.HexColor("#E2E8F0"))
+            c.setLineWidth(1)
+            c.line(1 * inch, y_pos, 7.5 * inch, y_pos)
+            y_pos -= 0.15 * inch
 
     return y_pos
 
 
 
-def create_radiology_table_with_images(c, radiology_data, y_pos):
+def create_radiology_table_with_images(c, radiology_data, y_pos, images=None):
     if not radiology_data:
         return y_pos
 
@@ -731,31 +1005,10 @@ def create_radiology_table_with_images(c, radiology_data, y_pos):
             if key not in ["images", "image_url", "report_images"] and value:
                 exam_data.append([key.replace('_', ' ').title(), str(value)])
 
-        table = Table(exam_data, colWidths=[1.8 * inch, 4 * inch])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor("#2C5282")),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor("#2D3748")),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#E2E8F0"))
-        ]))
-
-        table.wrapOn(c, 5.8 * inch, 6 * inch)
-        if y_pos - table._height < 1.5 * inch:
-            draw_footer(c, c.getPageNumber())
-            c.showPage()
-            y_pos = 10.5 * inch
-        table.drawOn(c, 1 * inch, y_pos - table._height)
-        y_pos -= table._height + 0.3 * inch
+        y_pos = draw_table(c, exam_data, [1.8 * inch, 4 * inch], TABLE_STYLES["record_details"], 1 * inch, y_pos)
 
         # Images
-        image_urls = []
-        for key in ["image_url", "images", "report_images"]:
-            if isinstance(exam.get(key), list):
-                image_urls.extend(exam.get(key))
-            elif exam.get(key):
-                image_urls.append(exam.get(key))
+        image_urls = radiology_image_urls(exam)
 
         if image_urls:
             c.setFillColor(colors.HexColor("#4A5568"))
@@ -769,7 +1022,7 @@ def create_radiology_table_with_images(c, radiology_data, y_pos):
                     c.showPage()
                     y_pos = 10.5 * inch
 
-                y_pos = draw_image_if_available(c, img_url, 2 * inch, y_pos, caption=f"Radiology Image {idx+1}")
+                y_pos = draw_image_if_available(c, img_url, 2 * inch, y_pos, caption=f"Radiology Image {idx+1}", images=images)
                 y_pos -= 0.2 * inch
 
         c.setStrokeColor(colors.HexColor("#E2E8F0"))
@@ -817,7 +1070,7 @@ def draw_footer(c, page_num):
     
     # Center - confidentiality notice
     conf_text = "CONFIDENTIAL MEDICAL DOCUMENT"
-    conf_width = c.stringWidth(conf_text, "Helvetica", 9)
+    conf_width = string_width(conf_text, "Helvetica", 9)
     c.drawString((letter[0] - conf_width) / 2, 0.5 * inch, conf_text)
     
     # Right side - page number
@@ -881,7 +1134,7 @@ def draw_patient_info_card(c, user_data, y_pos):
     patient_name = user_data.get("full_name", "Unknown Patient")
     c.setFillColor(colors.HexColor("#1A365D"))
     c.setFont("Helvetica-Bold", 18)
-    name_width = c.stringWidth(patient_name, "Helvetica-Bold", 18)
+    name_width = string_width(patient_name, "Helvetica-Bold", 18)
     c.drawString(card_x + (card_width - name_width) / 2, card_y + 0.75 * inch, patient_name)
     
     # ID and Date row
@@ -896,13 +1149,13 @@ def draw_patient_info_card(c, user_data, y_pos):
     age = user_data.get('age', 'N/A')
     gender = user_data.get('gender', 'N/A')
     center_text = f"Age: {age} | Gender: {gender.title()}"
-    center_width = c.stringWidth(center_text, "Helvetica-Bold", 11)
+    center_width = string_width(center_text, "Helvetica-Bold", 11)
     c.drawString(card_x + (card_width - center_width) / 2, card_y + 0.4 * inch, center_text)
     
     # Report date (right aligned)
     report_date = datetime.now().strftime('%B %d, %Y')
     date_text = f"Report Date: {report_date}"
-    date_width = c.stringWidth(date_text, "Helvetica-Bold", 11)
+    date_width = string_width(date_text, "Helvetica-Bold", 11)
     c.drawString(card_x + card_width - date_width - 0.3 * inch, card_y + 0.4 * inch, date_text)
     
     # Contact info (bottom center)
@@ -911,85 +1164,163 @@ def draw_patient_info_card(c, user_data, y_pos):
     contact = user_data.get('phone_number', '')
     email = user_data.get('email', '')
     contact_text = f"📞 {contact} | ✉ {email}"
-    contact_width = c.stringWidth(contact_text, "Helvetica", 10)
+    contact_width = string_width(contact_text, "Helvetica", 10)
     c.drawString(card_x + (card_width - contact_width) / 2, card_y + 0.1 * inch, contact_text)
 
+def render_report(data, images=None):
+    """Lay out the whole report into an in-memory PDF"""
+    # Create in-memory buffer
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    page_num = 1
+    
+    # Page 1 - Header and Basic Info
+    draw_header_with_logo(c, 10.5 * inch)
+    draw_patient_info_card(c, data["basic_info"], 10.5 * inch)
+    y_position = 8.5 * inch
+
+    # Sections that could not be loaded must not read as "no records"
+    if data["fetch_errors"]:
+        c.setFont("Helvetica-Bold", 10)
+        c.setFillColor(colors.HexColor("#C53030"))
+        missing = ", ".join(section.replace("_", " ").title() for section in data["fetch_errors"])
+        c.drawString(0.75 * inch, y_position, f"Some sections could not be loaded: {missing}")
+        y_position -= 0.4 * inch
+
+    # Basic Information
+    if data["basic_info"]:
+        filtered_info = {
+            k: v for k, v in data["basic_info"].items() 
+            if k not in ["full_name", "national_id", "age", "gender", "phone_number", "email", "password"]
+        }
+        if filtered_info:
+            y_position = draw_section_header(c, "Personal Information", y_position, "👤", 1.5*inch)
+            y_position = create_enhanced_table(c, filtered_info, y_position)
+    
+    # Measurements
+    if data["measurements"]:
+        estimated_space = len(data["measurements"]) * 0.25 * inch + 1.5 * inch
+        if y_position - estimated_space > 1.5 * inch:
+            y_position = draw_section_header(c, "Body Measurements", y_position, "📏", estimated_space)
+            y_position = create_enhanced_table(c, data["measurements"], y_position)
+        else:
+            draw_footer(c, c.getPageNumber())
+            c.showPage()
+            y_position = 10.5 * inch
+            y_position = draw_section_header(c, "Body Measurements", y_position, "📏", estimated_space)
+            y_position = create_enhanced_table(c, data["measurements"], y_position)
+    
+    # Emergency Contacts
+    if data["emergency_contacts"]:
+        estimated_space = len(data["emergency_contacts"]) * 0.3 * inch + 1.5 * inch
+        if y_position - estimated_space < 1.5 * inch:
+            draw_footer(c, c.getPageNumber())
+            c.showPage()
+            y_position = 10.5 * inch
+        
+        y_position = draw_section_header(c, "Emergency Contacts", y_position, "🚨", estimated_space)
+        y_position = create_enhanced_table(c, data["emergency_contacts"], y_position, "list")
+    
+    draw_footer(c, c.getPageNumber())
+    
+    # Add remaining sections
+    page_num = generate_sections_optimized(c, data, page_num, images)
+    
+    # Save the PDF
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+def report_blob_name(user_id: str) -> str:
+    return f"pdfs/{user_id}_medical_report.pdf"
+
+def report_url(blob_name: str, token: str) -> str:
+    return (
+        f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/"
+        f"{blob_name.replace('/', '%2F')}?alt=media&token={token}"
+    )
+
+def build_report(user_id: str):
+    """Fetch the patient's data and images and render the report. Returns (data, pdf_bytes)"""
+    data = fetch_all_user_data(user_id)
+
+    # Download all report images at once, before layout
+    images = prefetch_report_images(data)
+    return data, render_report(data, images).getvalue()
+
+def upload_report(user_id: str, pdf_bytes: bytes, token: str, fingerprint: str = None):
+    """
+    Upload a rendered report to Firebase Storage. Reusing `token` keeps the
+    download URL stable across rebuilds; `fingerprint` is stored in the blob
+    metadata so unchanged reports are not rebuilt.
+    """
+    blob = bucket.blob(report_blob_name(user_id))
+    metadata = {"firebaseStorageDownloadTokens": token}
+    if fingerprint:
+        metadata["report_fingerprint"] = fingerprint
+    blob.metadata = metadata
+    blob.upload_from_string(pdf_bytes, content_type='application/pdf')
+    blob.patch()
+    return report_url(blob.name, token)
+
+def find_stored_report(user_id: str):
+    """
+    Returns (fingerprint, token, blob). `blob` is the stored report when it
+    matches the patient's current data, else None; `token` is the stored
+    report's download token (or a new one) to keep its URL stable.
+    """
+    blob_future = _fetch_executor.submit(bucket.get_blob, report_blob_name(user_id))
+    fingerprint = report_fingerprint(user_id)
+    blob = blob_future.result()
+
+    metadata = (blob.metadata or {}) if blob is not None else {}
+    token = (metadata.get("firebaseStorageDownloadTokens") or "").split(",")[0]
+    if token and metadata.get("report_fingerprint") == fingerprint:
+        return fingerprint, token, blob
+    return fingerprint, token or str(uuid.uuid4()), None
+
+def get_or_build_report(user_id: str):
+    """Return the stored report if it matches the patient's current data, else rebuild it"""
+    fingerprint, token, blob = find_stored_report(user_id)
+    if blob is not None:
+        return {"pdf_url": report_url(blob.name, token)}
+
+    data, pdf_bytes = build_report(user_id)
+    # Partial reports are not fingerprinted, so they are rebuilt next time
+    pdf_url = upload_report(user_id, pdf_bytes, token, None if data["fetch_errors"] else fingerprint)
+
+    if data["fetch_errors"]:
+        return {"pdf_url": pdf_url, "fetch_errors": data["fetch_errors"]}
+    return {"pdf_url": pdf_url}
+
+def stream_report(user_id: str, background_tasks: BackgroundTasks):
+    """Return the report bytes now; a fresh build is uploaded after the response is sent"""
+    fingerprint, token, blob = find_stored_report(user_id)
+    if blob is not None:
+        pdf_bytes = blob.download_as_bytes()
+    else:
+        data, pdf_bytes = build_report(user_id)
+        background_tasks.add_task(upload_report, user_id, pdf_bytes, token, None if data["fetch_errors"] else fingerprint)
+    return pdf_bytes, report_url(report_blob_name(user_id), token)
+
 @router.get("/{user_id}")
-async def generate_medical_report_pdf(user_id: str):
+async def generate_medical_report_pdf(user_id: str, background_tasks: BackgroundTasks, mode: str = "url"):
+    if mode not in ("url", "stream"):
+        raise HTTPException(status_code=400, detail="mode must be 'url' or 'stream'")
     try:
-        # Fetch all user data
-        data = fetch_all_user_data(user_id)
-        
-        # Create in-memory buffer
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        page_num = 1
-        
-        # Page 1 - Header and Basic Info
-        draw_header_with_logo(c, 10.5 * inch)
-        draw_patient_info_card(c, data["basic_info"], 10.5 * inch)
-        y_position = 8.5 * inch
-
-        # Basic Information
-        if data["basic_info"]:
-            filtered_info = {
-                k: v for k, v in data["basic_info"].items() 
-                if k not in ["full_name", "national_id", "age", "gender", "phone_number", "email", "password"]
+        if mode == "url":
+            return await run_in_threadpool(get_or_build_report, user_id)
+
+        # Stream the PDF bytes directly; the caller does not wait for the upload
+        pdf_bytes, pdf_url = await run_in_threadpool(stream_report, user_id, background_tasks)
+        return StreamingResponse(
+            BytesIO(pdf_bytes),
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f'inline; filename="{user_id}_medical_report.pdf"',
+                "X-PDF-URL": pdf_url
             }
-            if filtered_info:
-                y_position = draw_section_header(c, "Personal Information", y_position, "👤", 1.5*inch)
-                y_position = create_enhanced_table(c, filtered_info, y_position)
-        
-        # Measurements
-        if data["measurements"]:
-            estimated_space = len(data["measurements"]) * 0.25 * inch + 1.5 * inch
-            if y_position - estimated_space > 1.5 * inch:
-                y_position = draw_section_header(c, "Body Measurements", y_position, "📏", estimated_space)
-                y_position = create_enhanced_table(c, data["measurements"], y_position)
-            else:
-                draw_footer(c, page_num)
-                c.showPage()
-                page_num += 1
-                y_position = 10.5 * inch
-                y_position = draw_section_header(c, "Body Measurements", y_position, "📏", estimated_space)
-                y_position = create_enhanced_table(c, data["measurements"], y_position)
-        
-        # Emergency Contacts
-        if data["emergency_contacts"]:
-            estimated_space = len(data["emergency_contacts"]) * 0.3 * inch + 1.5 * inch
-            if y_position - estimated_space < 1.5 * inch:
-                draw_footer(c, page_num)
-                c.showPage()
-                page_num += 1
-                y_position = 10.5 * inch
-            
-            y_position = draw_section_header(c, "Emergency Contacts", y_position, "🚨", estimated_space)
-            y_position = create_enhanced_table(c, data["emergency_contacts"], y_position, "list")
-        
-        draw_footer(c, page_num)
-        
-        # Add remaining sections
-        page_num = generate_sections_optimized(c, data, page_num)
-        
-        # Save the PDF
-        c.save()
-        buffer.seek(0)
-        
-        # Upload to Firebase Storage
-        file_name = f"{user_id}_medical_report.pdf"
-        blob = bucket.blob(f"pdfs/{file_name}")
-        token = str(uuid.uuid4())
-        blob.metadata = {"firebaseStorageDownloadTokens": token}
-        blob.upload_from_file(buffer, content_type='application/pdf')
-        blob.patch()
-        
-        # Generate public URL
-        pdf_url = (
-            f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/"
-            f"{blob.name.replace('/', '%2F')}?alt=media&token={token}"
         )
-        
-        return {"pdf_url": pdf_url}
 
     except HTTPException:
         raise
@@ -997,7 +1328,7 @@ async def generate_medical_report_pdf(user_id: str):
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 
-def generate_sections_optimized(c, data, page_num):
+def generate_sections_optimized(c, data, page_num, images=None):
     """Generate sections with optimized page usage"""
     y_position = 8.5 * inch
 
@@ -1022,45 +1353,53 @@ def generate_sections_optimized(c, data, page_num):
     # Simple Sections
     for section_title, section_data, icon, section_type in simple_sections:
         if section_data:
-            estimated_space = len(section_data) * 0.25 * inch + 1.5 * inch
+            estimated_space = section_size(section_data) * 0.25 * inch + 1.5 * inch
             if y_position - estimated_space < 1.5 * inch:
-                draw_footer(c, page_num)
+                draw_footer(c, c.getPageNumber())
                 c.showPage()
-                page_num += 1
                 y_position = 10.5 * inch
                 
             y_position = draw_section_header(c, section_title, y_position, icon, estimated_space)
-            y_position = create_enhanced_table(c, section_data, y_position, "list")
+            # Long histories are drawn one page of records at a time
+            for records in record_pages(section_data):
+                y_position = create_enhanced_table(c, records, y_position, "list")
+            y_position = draw_stream_summary(c, section_data, y_position)
 
     # Medium Sections
     for section_title, section_data, icon, section_type in medium_sections:
         if section_data:
-            estimated_space = len(section_data) * 0.35 * inch + 1.5 * inch
+            estimated_space = section_size(section_data) * 0.35 * inch + 1.5 * inch
             if y_position - estimated_space < 2 * inch:
-                draw_footer(c, page_num)
+                draw_footer(c, c.getPageNumber())
                 c.showPage()
-                page_num += 1
                 y_position = 10.5 * inch
                 
             y_position = draw_section_header(c, section_title, y_position, icon, estimated_space)
-            y_position = create_medication_table(c, section_data, y_position)
+            for records in record_pages(section_data):
+                y_position = create_medication_table(c, records, y_position)
+            y_position = draw_stream_summary(c, section_data, y_position)
 
     # Complex Sections
     for section_title, section_data, icon, section_type in complex_sections:
         if section_data:
-            draw_footer(c, page_num)
+            draw_footer(c, c.getPageNumber())
             c.showPage()
-            page_num += 1
             y_position = 10.5 * inch
             y_position = draw_section_header(c, section_title, y_position, icon, 4 * inch)
             
             if section_type == "biomarkers":
-                y_position = create_biomarker_table_with_images(c, section_data, y_position)
+                y_position = create_biomarker_table_with_images(c, section_data, y_position, images)
+                y_position = draw_stream_summary(c, section_data, y_position)
             elif section_type == "radiology":
-                y_position = create_radiology_table_with_images(c, section_data, y_position)
+                y_position = create_radiology_table_with_images(c, section_data, y_position, images)
             elif section_type == "risk_assessment":
                 y_position = create_risk_assessment_table(c, section_data, y_position)
             
-            draw_footer(c, page_num)
+            draw_footer(c, c.getPageNumber())
+
+    # A page that failed mid-stream makes this a partial report
+    for section in STREAMED_SECTIONS:
+        if isinstance(data[section], RecordStream) and data[section].error:
+            data["fetch_errors"][section] = data[section].error
 
-    return page_num
+    return c.getPageNumber()
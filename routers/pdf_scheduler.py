@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from fastapi import HTTPException
+from firebase_config import db
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+PDF_SCHEDULER_WORKERS = int(os.environ.get("PDF_SCHEDULER_WORKERS", "2"))            # Concurrent rebuilds; 0 disables
+PDF_SCHEDULER_POLL_SECONDS = float(os.environ.get("PDF_SCHEDULER_POLL_SECONDS", "10"))
+PDF_REBUILD_LEASE_SECONDS = float(os.environ.get("PDF_REBUILD_LEASE_SECONDS", "300"))  # Claim expiry if a worker dies
+PDF_REBUILD_MAX_ATTEMPTS = int(os.environ.get("PDF_REBUILD_MAX_ATTEMPTS", "5"))         # Failed rebuilds before an entry is dropped
+PDF_REBUILD_BACKOFF_SECONDS = float(os.environ.get("PDF_REBUILD_BACKOFF_SECONDS", "60"))  # Doubles after each failure
+PDF_REBUILD_MAX_BACKOFF_SECONDS = float(os.environ.get("PDF_REBUILD_MAX_BACKOFF_SECONDS", "3600"))
+
+
+class PdfRebuildScheduler:
+    """
+    Rebuilds stale PDF reports in the background.
+
+    Write paths queue patients in PdfRebuildQueue via report_cache.invalidate_report.
+    Entries become due once edits have been quiet for the debounce period. The
+    poller claims due entries with a lease (an optimistic update, so several
+    processes can share the queue) and rebuilds at most `workers` reports at
+    once. Claiming also moves `due_at` to the end of the lease, so leased
+    entries drop out of the due query instead of taking its slots. An entry is
+    only removed if it was not edited again during the rebuild; otherwise it
+    stays queued for another pass. A failed rebuild is retried with
+    exponential backoff and dropped after PDF_REBUILD_MAX_ATTEMPTS; the report
+    is then rebuilt on its next request, as its fingerprint is already stale.
+    """
+
+    def __init__(self, build: Callable[[str], dict], workers: int):
+        self._build = build
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-rebuild")
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pdf-scheduler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.wait(PDF_SCHEDULER_POLL_SECONDS):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"PDF scheduler poll failed: {str(e)}")
+
+    def poll(self):
+        with self._in_flight_lock:
+            free = self.workers - self._in_flight
+        if free <= 0:
+            return
+
+        now = time.time()
+        due = db.collection("PdfRebuildQueue").where("due_at", "<=", now) \
+            .order_by("due_at").limit(free * 2).stream()
+        for entry in due:
+            if free <= 0:
+                break
+            data = entry.to_dict() or {}
+            if data.get("lease_until", 0) > now:
+                continue  # Edited while another worker rebuilds it; due again once that lease ends
+            claimed_at = self._claim(entry, now)
+            if claimed_at is None:
+                continue
+            with self._in_flight_lock:
+                self._in_flight += 1
+            free -= 1
+            self._executor.submit(self._rebuild, entry.reference, claimed_at, data.get("attempts", 0))
+
+    def _claim(self, entry, now: float):
+        lease_until = now + PDF_REBUILD_LEASE_SECONDS
+        try:
+            result = entry.reference.update(
+                {"lease_until": lease_until, "due_at": lease_until},
+                option=db.write_option(last_update_time=entry.update_time)
+            )
+            return result.update_time
+        except Exception:
+            return None  # Claimed by someone else or edited since the query
+
+    def _rebuild(self, entry_ref, claimed_at, attempts: int):
+        national_id = entry_ref.id
+        try:
+            try:
+                self._build(national_id)
+            except HTTPException as e:
+                if e.status_code != 404:
+                    raise
+                print(f"Dropping PDF rebuild for missing user {national_id}")
+            try:
+                entry_ref.delete(option=db.write_option(last_update_time=claimed_at))
+            except Exception:
+                # Edited during the rebuild: release the lease so the new due_at applies
+                entry_ref.update({"lease_until": 0})
+        except Exception as e:
+            print(f"PDF rebuild for {national_id} failed (attempt {attempts + 1}): {str(e)}")
+            self._retry_later(entry_ref, claimed_at, attempts + 1)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _retry_later(self, entry_ref, claimed_at, attempts: int):
+        # Conditional on the claim: an edit during the rebuild already re-queued the entry with attempts reset
+        option = db.write_option(last_update_time=claimed_at)
+        try:
+            if attempts >= PDF_REBUILD_MAX_ATTEMPTS:
+                print(f"Giving up on PDF rebuild for {entry_ref.id} after {attempts} attempts")
+                entry_ref.delete(option=option)
+                return
+            backoff = min(PDF_REBUILD_BACKOFF_SECONDS * 2 ** (attempts - 1), PDF_REBUILD_MAX_BACKOFF_SECONDS)
+            entry_ref.update({"attempts": attempts, "lease_until": 0, "due_at": time.time() + backoff}, option=option)
+        except Exception:
+            try:
+                entry_ref.update({"lease_until": 0})  # Release the lease so the edit's due_at applies
+            except Exception:
+                pass  # Deleted meanwhile
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(build: Callable[[str], dict]) -> Optional[PdfRebuildScheduler]:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and PDF_SCHEDULER_WORKERS > 0:
+            _scheduler = PdfRebuildScheduler(build, PDF_SCHEDULER_WORKERS)
+            _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
+from firebase_admin import firestore
 from firebase_config import db
-from datetime import datetime
+from routers.feature_store import mark_risk_inputs_changed
+from routers.report_cache import invalidate_report
+from routers.reviewer_directory import reviewer_directory
+from models.schema import PendingBulkApproveRequest, PendingBulkApproveOutput
+from datetime import datetime, timedelta
+from typing import Optional
+import base64
+import json
+import os
 import pytz
 
 from routers.doctor_assignments import auto_assign_reviewer
@@ -8,155 +17,436 @@ from routers.doctor_assignments import auto_assign_reviewer
 egypt_tz = pytz.timezone("Africa/Cairo")
 router = APIRouter(prefix="/pending", tags=["Pending Approvals"])
 
-# 🔎 Resolve Firestore doc ID from reviewer ID (doctor_email, facility_name, or 'admin')
-def resolve_reviewer_doc_id(assigned_to_id: str) -> str:
-    # Check for facility_name match
-    facility_docs = db.collection("Facilities").stream()
-    for doc in facility_docs:
-        if doc.to_dict().get("facility_name") == assigned_to_id:
-            return doc.id
-
-    # Check for registered doctor email
-    doctor_doc = db.collection("Doctors").document(assigned_to_id).get()
-    if doctor_doc.exists:
-        return assigned_to_id
+PENDING_BULK_MAX = int(os.environ.get("PENDING_BULK_MAX", "50"))  # Keeps a bulk approval under the 500-write commit limit
+PENDING_DECISION_RETENTION_DAYS = int(os.environ.get("PENDING_DECISION_RETENTION_DAYS", "30"))  # Decided locators kept for replays
+PENDING_PAGE_MAX = int(os.environ.get("PENDING_PAGE_MAX", "500"))  # Largest page GET /pending returns
 
-    # Check fallback doctor assignment email
-    fallback_doc = db.collection("DoctorAssignments") \
-        .where("doctor_email", "==", assigned_to_id).limit(1).stream()
-    for _ in fallback_doc:
-        return assigned_to_id
+# PendingApprovals subcollections, one per data type that goes through review
+PENDING_DATA_TYPES = ("bloodbiomarkers", "radiology")
 
-    if assigned_to_id == "admin":
-        return "admin"
-
-    raise HTTPException(status_code=404, detail=f"Reviewer with ID '{assigned_to_id}' not found")
+# 🔎 Resolve Firestore doc ID from reviewer ID (doctor_email, facility_name, or 'admin')
+def resolve_reviewer_doc_id(assigned_to_id: str) -> str:
+    doc_id = reviewer_directory.resolve(assigned_to_id)
+    if doc_id is None:
+        raise HTTPException(status_code=404, detail=f"Reviewer with ID '{assigned_to_id}' not found")
+    return doc_id
+
+
+# -------------------- Pending Queries --------------------
+# Each data type is its own collection group (PendingApprovals/{reviewer}/{data_type});
+# one reviewer's queue is that reviewer's subcollection. Ordering by submitted_at
+# also leaves out the Approved/RejectedApprovals collections of the same name,
+# which have no submitted_at. The indexes these queries need are in
+# firestore.indexes.json (deploy with `firebase deploy --only firestore:indexes`).
+#
+# submitted_at is a Firestore Timestamp. Records queued before that stored a
+# string (ISO 8601 for biomarkers, "%Y-%m-%d %H:%M:%S" Cairo time for
+# radiology); POST /pending/backfill-submitted-at converts them.
+def _as_submitted_at(value) -> Optional[datetime]:
+    """Return a stored or requested submitted_at as an aware datetime; naive values are Cairo time"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return egypt_tz.localize(value) if value.tzinfo is None else value
+
+
+def _parse_bound(value: str, name: str, end: bool = False) -> datetime:
+    bound = _as_submitted_at(value)
+    if bound is None:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 date or datetime")
+    if end and len(value) == 10:
+        bound = egypt_tz.localize(datetime.combine(bound.date() + timedelta(days=1), datetime.min.time()))
+    return bound
+
+
+def _sort_key(entry: dict):
+    # Same order as order_by("submitted_at").order_by("__name__"): document
+    # names compare segment by segment, ending with the document id
+    submitted_at = _as_submitted_at(entry.get("submitted_at")) or datetime.min.replace(tzinfo=pytz.utc)
+    return submitted_at, tuple(entry["path"].split("/"))
+
+
+def _encode_cursor(entry: dict) -> str:
+    submitted_at = _as_submitted_at(entry["submitted_at"]).isoformat()
+    return base64.urlsafe_b64encode(json.dumps([submitted_at, entry["path"]]).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        submitted_at, path = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return _as_submitted_at(submitted_at), db.document(path)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def query_pending(reviewer_doc_id: Optional[str] = None, data_type: Optional[str] = None,
+                  national_id: Optional[str] = None, submitted_from: Optional[str] = None,
+                  submitted_to: Optional[str] = None, order: str = "desc", limit: Optional[int] = None,
+                  cursor: Optional[str] = None):
+    """
+    Return (entries, next_cursor): pending records, newest first by default,
+    across every reviewer (one collection-group query per data type) or in
+    `reviewer_doc_id`'s queue. Without a data_type filter the per-type results
+    are merged. With a `limit` this is one page and next_cursor is None on the
+    last one; without it every matching record is returned.
+    """
+    if data_type is not None and data_type not in PENDING_DATA_TYPES:
+        raise HTTPException(status_code=400, detail=f"data_type must be one of {', '.join(PENDING_DATA_TYPES)}")
+    direction = "DESCENDING" if order == "desc" else "ASCENDING"
+    start_after = _decode_cursor(cursor) if cursor else None
+    if submitted_from:
+        submitted_from = _parse_bound(submitted_from, "submitted_from")
+    if submitted_to:
+        to_op = "<" if len(submitted_to) == 10 else "<="  # A bare date includes that whole day
+        submitted_to = _parse_bound(submitted_to, "submitted_to", end=True)
+
+    entries, more = [], False
+    for collection in [data_type] if data_type else PENDING_DATA_TYPES:
+        if reviewer_doc_id is not None:
+            query = db.collection("PendingApprovals").document(reviewer_doc_id).collection(collection)
+        else:
+            query = db.collection_group(collection)
+        if national_id:
+            query = query.where("national_id", "==", national_id)
+        if submitted_from:
+            query = query.where("submitted_at", ">=", submitted_from)
+        if submitted_to:
+            query = query.where("submitted_at", to_op, submitted_to)
+        query = query.order_by("submitted_at", direction=direction).order_by("__name__", direction=direction)
+        if start_after is not None:
+            query = query.start_after(list(start_after))
+
+        if limit is not None:
+            query = query.limit(limit)
+        docs = list(query.stream())
+        more = more or (limit is not None and len(docs) == limit)
+        for doc in docs:
+            if not doc.reference.path.startswith("PendingApprovals/"):
+                continue
+            entry = doc.to_dict()
+            entry["id"] = doc.id
+            entry["collection"] = collection
+            entry["assigned_to"] = doc.reference.parent.parent.id
+            entry["path"] = doc.reference.path
+            entry["submitted_at"] = _as_submitted_at(entry.get("submitted_at"))
+            entries.append(entry)
+
+    entries.sort(key=_sort_key, reverse=order == "desc")
+    page = entries
+    if limit is not None:
+        more = more or len(entries) > limit
+        page = entries[:limit]
+    next_cursor = _encode_cursor(page[-1]) if more and page else None
+    for entry in page:
+        del entry["path"]
+    return page, next_cursor
 
 
 @router.get("/reviewer/{assigned_to}")
-def get_pending_approvals_for_reviewer(assigned_to: str):
+def get_pending_approvals_for_reviewer(
+    assigned_to: str,
+    response: Response,
+    data_type: Optional[str] = None,
+    national_id: Optional[str] = None,
+    submitted_from: Optional[str] = None,
+    submitted_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=PENDING_PAGE_MAX),
+    cursor: Optional[str] = None
+):
     doc_id = resolve_reviewer_doc_id(assigned_to)
-    pending_ref = db.collection("PendingApprovals").document(doc_id)
-    results = []
-
-    for col in pending_ref.collections():
-        for doc in col.stream():
-            doc_data = doc.to_dict()
-            doc_data["id"] = doc.id
-            doc_data["collection"] = col.id
-            results.append(doc_data)
-
+    results, next_cursor = query_pending(doc_id, data_type, national_id, submitted_from, submitted_to,
+                                         order, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return results
 
 
-@router.post("/approve/{assigned_to}/{doc_id}")
-def approve_pending(assigned_to: str, doc_id: str, reviewer_name: str = ""):
-    reviewer_doc_id = resolve_reviewer_doc_id(assigned_to)
-    pending_doc = db.collection("PendingApprovals").document(reviewer_doc_id)
+@router.post("/backfill-submitted-at")
+def backfill_submitted_at():
+    """Convert string submitted_at values on queued records to Timestamps, so they sort and filter with new ones."""
+    converted, skipped = 0, []
+    batch = db.batch()
+    pending_writes = 0
+    for collection in PENDING_DATA_TYPES:
+        for doc in db.collection_group(collection).stream():
+            if not doc.reference.path.startswith("PendingApprovals/"):
+                continue
+            value = (doc.to_dict() or {}).get("submitted_at")
+            if not isinstance(value, str):
+                continue
+            submitted_at = _as_submitted_at(value)
+            if submitted_at is None:
+                skipped.append(doc.reference.path)
+                continue
+            batch.update(doc.reference, {"submitted_at": submitted_at})
+            converted += 1
+            pending_writes += 1
+            if pending_writes == 500:  # Firestore batch limit
+                batch.commit()
+                batch = db.batch()
+                pending_writes = 0
+    if pending_writes:
+        batch.commit()
+
+    return {
+        "converted": converted,
+        "skipped": skipped,
+        "message": f"✅ Converted submitted_at on {converted} pending records."
+    }
+
+
+# -------------------- Pending Record Locator --------------------
+# PendingIndex/{doc_id} lists every PendingApprovals path a record was queued
+# under, so deciding it touches exactly those documents.
+def get_pending_index_ref(doc_id: str):
+    return db.collection("PendingIndex").document(doc_id)
+
+
+def submit_pending(assigned_to: str, data_type: str, doc_id: str, entry: dict):
+    """Queue a record for review and record its path in PendingIndex, in one batch."""
+    pending_ref = db.collection("PendingApprovals").document(assigned_to) \
+        .collection(data_type).document(doc_id)
+    batch = db.batch()
+    batch.set(pending_ref, entry)
+    batch.set(get_pending_index_ref(doc_id), {
+        "paths": firestore.ArrayUnion([pending_ref.path]),
+        "national_id": entry.get("national_id"),
+        "data_type": data_type
+    }, merge=True)
+    batch.commit()
+
+
+def _legacy_pending_copies(collection: str, doc_id: str, reviewer_name: str = ""):
+    # Records queued before PendingIndex existed: probe every reviewer's queue
+    reviewers = {ref.id for ref in db.collection("PendingApprovals").list_documents()}
+    if reviewer_name:
+        reviewers.add(reviewer_name)
+    copies = []
+    for reviewer_id in reviewers:
+        doc_ref = db.collection("PendingApprovals").document(reviewer_id).collection(collection).document(doc_id)
+        if doc_ref.get().exists:
+            copies.append(doc_ref)
+    return copies
 
-    found_snapshot = None
-    found_collection = None
 
+def _locate_pending(reviewer_doc_id: str, doc_id: str, locator, reviewer_name: str = ""):
+    """
+    Return (pending_ref, copies): the reviewer's queued copy of the record, or
+    None, and every queued copy to delete once the record is decided.
+    """
+    if locator.exists:
+        copies = [db.document(path) for path in (locator.to_dict() or {}).get("paths", [])]
+        pending_ref = next((ref for ref in copies if ref.parent.parent.id == reviewer_doc_id), None)
+        return pending_ref, copies
+
+    pending_doc = db.collection("PendingApprovals").document(reviewer_doc_id)
     for col in pending_doc.collections():
         doc_ref = col.document(doc_id)
-        snapshot = doc_ref.get()
-        if snapshot.exists:
-            found_snapshot = snapshot
-            found_collection = col.id
-            break
+        if doc_ref.get().exists:
+            copies = _legacy_pending_copies(col.id, doc_id, reviewer_name)
+            if doc_ref.path not in {ref.path for ref in copies}:
+                copies.append(doc_ref)
+            return doc_ref, copies
+    return None, []
+
+
+def _get_all(transaction, refs):
+    if not refs:
+        return {}
+    return {snapshot.reference.path: snapshot for snapshot in transaction.get_all(refs)}
+
+
+def _record_ids(timestamp: str, count: int):
+    # Records are keyed by approval time; records approved together get a
+    # sub-second suffix so they do not overwrite each other
+    return [timestamp if i == 0 else f"{timestamp}.{i:03d}" for i in range(count)]
+
+
+@firestore.transactional
+def _decide_in_transaction(transaction, reviewer_doc_id: str, assigned_to: str, doc_ids, status: str,
+                           reviewer_name: str = ""):
+    """
+    Approve or reject `doc_ids` from one reviewer's queue in a single commit.
+
+    The PendingIndex locator is the idempotency key: it is read in the
+    transaction and replaced by the decision, so a retried or concurrent
+    request sees the stored decision instead of writing the record twice.
+    Returns {doc_id: outcome}, where outcome is the decision plus `applied`
+    (False if it was made before), or {"status": "not_found" | "user_not_found"}.
+    """
+    # All reads come first; Firestore transactions do not allow reads after writes
+    locators = _get_all(transaction, [get_pending_index_ref(doc_id) for doc_id in doc_ids])
+    located = {}
+    for doc_id in doc_ids:
+        locator = locators[get_pending_index_ref(doc_id).path]
+        if not (locator.exists and (locator.to_dict() or {}).get("decision")):
+            located[doc_id] = _locate_pending(reviewer_doc_id, doc_id, locator, reviewer_name)
+    snapshots = _get_all(transaction, [pending_ref for pending_ref, _ in located.values() if pending_ref is not None])
+
+    pending = {}
+    for doc_id, (pending_ref, copies) in located.items():
+        snapshot = snapshots.get(pending_ref.path) if pending_ref is not None else None
+        if snapshot is not None and snapshot.exists:
+            pending[doc_id] = (snapshot, copies)
+    users = {}
+    if status == "approved":
+        national_ids = {snapshot.to_dict().get("national_id") for snapshot, _ in pending.values()} - {None}
+        user_snapshots = _get_all(transaction, [db.collection("Users").document(nid) for nid in national_ids])
+        users = {snapshot.id: snapshot.exists for snapshot in user_snapshots.values()}
+
+    now = datetime.now(egypt_tz)
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S") if status == "approved" else now.isoformat()
+    record_ids = iter(_record_ids(timestamp, len(pending)))
+    outcomes, invalidated = {}, set()
+
+    for doc_id in doc_ids:
+        if doc_id not in located:
+            outcomes[doc_id] = {**locators[get_pending_index_ref(doc_id).path].to_dict()["decision"], "applied": False}
+            continue
+        if doc_id not in pending:
+            outcomes[doc_id] = {"status": "not_found"}
+            continue
+
+        snapshot, copies = pending[doc_id]
+        data = snapshot.to_dict()
+        collection = snapshot.reference.parent.id
+        national_id = data.get("national_id")
+        data_type = data.get("data_type", collection)
+        decision = {
+            "status": status,
+            "reviewer": reviewer_doc_id,
+            "by": assigned_to,
+            "at": timestamp,
+            "collection": collection,
+            "national_id": national_id,
+            "data_type": data_type
+        }
+
+        if status == "approved":
+            if not users.get(national_id):
+                outcomes[doc_id] = {"status": "user_not_found"}
+                continue
+            record = data["record"]
+            record["date_added"] = timestamp
+            decision["record_id"] = next(record_ids)
+            transaction.set(db.collection("Users").document(national_id)
+                            .collection("ClinicalIndicators").document(data_type)
+                            .collection("Records").document(decision["record_id"]), record)
+            transaction.set(db.collection("ApprovedApprovals").document(reviewer_doc_id)
+                            .collection(collection).document(doc_id), {
+                "national_id": national_id,
+                "record": record,
+                "data_type": data_type,
+                "approved_at": timestamp,
+                "approved_by": assigned_to
+            })
+            if national_id not in invalidated:
+                invalidate_report(national_id, batch=transaction)
+                invalidated.add(national_id)
+        else:
+            transaction.set(db.collection("RejectedApprovals").document(reviewer_doc_id)
+                            .collection(collection).document(doc_id), {
+                "national_id": national_id,
+                "record": data.get("record"),
+                "data_type": data_type,
+                "rejected_at": timestamp,
+                "rejected_by": assigned_to
+            })
+
+        for doc_ref in copies:
+            transaction.delete(doc_ref)
+        transaction.set(get_pending_index_ref(doc_id), {
+            "paths": [],
+            "national_id": national_id,
+            "data_type": data_type,
+            "decision": decision,
+            "expire_at": now + timedelta(days=PENDING_DECISION_RETENTION_DAYS)  # For a Firestore TTL policy
+        })
+        outcomes[doc_id] = {**decision, "applied": True}
 
-    if not found_snapshot:
-        raise HTTPException(status_code=404, detail="Pending record not found")
+    return outcomes
 
-    data = found_snapshot.to_dict()
-    national_id = data["national_id"]
-    record = data["record"]
-    data_type = data.get("data_type", found_collection)
 
-    user_ref = db.collection("Users").document(national_id)
-    if not user_ref.get().exists:
-        raise HTTPException(status_code=404, detail="User not found")
+def _mark_approved_inputs(outcomes: dict):
+    # Outside the transaction: the feature store marker is a separate best-effort write
+    for national_id in {o["national_id"] for o in outcomes.values()
+                        if o.get("applied") and o["status"] == "approved" and o["data_type"] == "bloodbiomarkers"}:
+        mark_risk_inputs_changed(national_id, "biomarkers")
 
-    timestamp = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
-    record["date_added"] = timestamp
 
-    user_ref.collection("ClinicalIndicators") \
-        .document(data_type).collection("Records") \
-        .document(timestamp).set(record)
+def _approval_message(outcome: dict) -> str:
+    return f"Approved and saved under {outcome['national_id']}/{outcome['data_type']} with ID {outcome['record_id']}"
 
-    db.collection("ApprovedApprovals").document(reviewer_doc_id) \
-        .collection(found_collection).document(doc_id).set({
-            "national_id": national_id,
-            "record": record,
-            "data_type": data_type,
-            "approved_at": timestamp,
-            "approved_by": assigned_to
-        })
 
-    if reviewer_name:
-        doc_ref = db.collection("PendingApprovals").document(reviewer_name).collection(found_collection).document(doc_id)
-        if doc_ref.get().exists:
-            doc_ref.delete()
+def _outcome_error(outcome: dict) -> HTTPException:
+    if outcome["status"] == "not_found":
+        return HTTPException(status_code=404, detail="Pending record not found")
+    if outcome["status"] == "user_not_found":
+        return HTTPException(status_code=404, detail="User not found")
+    return HTTPException(status_code=409, detail=f"Pending record was already {outcome['status']}")
 
-    all_reviewers = db.collection("PendingApprovals").stream()
-    for reviewer in all_reviewers:
-        doc_ref = db.collection("PendingApprovals").document(reviewer.id).collection(found_collection).document(doc_id)
-        if doc_ref.get().exists:
-            doc_ref.delete()
 
-    return {"message": f"Approved and saved under {national_id}/{data_type} with ID {timestamp}"}
+@router.post("/approve/{assigned_to}/{doc_id}")
+def approve_pending(assigned_to: str, doc_id: str, reviewer_name: str = ""):
+    reviewer_doc_id = resolve_reviewer_doc_id(assigned_to)
+    outcomes = _decide_in_transaction(db.transaction(), reviewer_doc_id, assigned_to, [doc_id], "approved", reviewer_name)
+    outcome = outcomes[doc_id]
+    if outcome["status"] != "approved":
+        raise _outcome_error(outcome)
 
+    _mark_approved_inputs(outcomes)
+    return {"message": _approval_message(outcome)}
 
-@router.delete("/reject/{assigned_to}/{doc_id}")
-def reject_pending(assigned_to: str, doc_id: str, reviewer_name: str = ""):
-    reviewer_doc_id = resolve_reviewer_doc_id(assigned_to)
-    pending_doc = db.collection("PendingApprovals").document(reviewer_doc_id)
 
-    for col in pending_doc.collections():
-        doc_ref = col.document(doc_id)
-        snapshot = doc_ref.get()
-        if snapshot.exists:
-            data = snapshot.to_dict()
-            timestamp = datetime.now(egypt_tz).isoformat()
+@router.post("/approve-bulk/{assigned_to}", response_model=PendingBulkApproveOutput)
+def approve_pending_bulk(assigned_to: str, request: PendingBulkApproveRequest, reviewer_name: str = ""):
+    doc_ids = list(dict.fromkeys(request.doc_ids))
+    if not doc_ids:
+        raise HTTPException(status_code=400, detail="doc_ids must not be empty")
+    if len(doc_ids) > PENDING_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {PENDING_BULK_MAX} records per request")
 
-            db.collection("RejectedApprovals").document(reviewer_doc_id) \
-                .collection(col.id).document(doc_id).set({
-                    "national_id": data.get("national_id"),
-                    "record": data.get("record"),
-                    "data_type": data.get("data_type", col.id),
-                    "rejected_at": timestamp,
-                    "rejected_by": assigned_to
-                })
+    reviewer_doc_id = resolve_reviewer_doc_id(assigned_to)
+    outcomes = _decide_in_transaction(db.transaction(), reviewer_doc_id, assigned_to, doc_ids, "approved", reviewer_name)
+    _mark_approved_inputs(outcomes)
 
-            if reviewer_name:
-                doc_ref = db.collection("PendingApprovals").document(reviewer_name).collection(col.id).document(doc_id)
-                if doc_ref.get().exists:
-                    doc_ref.delete()
+    results, errors = {}, {}
+    for doc_id, outcome in outcomes.items():
+        if outcome["status"] == "approved":
+            results[doc_id] = _approval_message(outcome)
+        else:
+            errors[doc_id] = _outcome_error(outcome).detail
+    return {"results": results, "errors": errors}
 
-            all_reviewers = db.collection("PendingApprovals").stream()
-            for reviewer in all_reviewers:
-                doc_ref = db.collection("PendingApprovals").document(reviewer.id).collection(col.id).document(doc_id)
-                if doc_ref.get().exists:
-                    doc_ref.delete()
 
-            return {"message": f"Rejected and removed {doc_id} from {col.id}"}
+@router.delete("/reject/{assigned_to}/{doc_id}")
+def reject_pending(assigned_to: str, doc_id: str, reviewer_name: str = ""):
+    reviewer_doc_id = resolve_reviewer_doc_id(assigned_to)
+    outcome = _decide_in_transaction(db.transaction(), reviewer_doc_id, assigned_to, [doc_id], "rejected", reviewer_name)[doc_id]
+    if outcome["status"] != "rejected":
+        raise _outcome_error(outcome)
 
-    raise HTTPException(status_code=404, detail="Pending record not found")
+    return {"message": f"Rejected and removed {doc_id} from {outcome['collection']}"}
 
 
 @router.get("/")
-def get_all_pending():
-    root = db.collection("PendingApprovals")
-    all_docs = []
-
-    for doc in root.stream():
-        reviewer_id = doc.id
-        for col in root.document(reviewer_id).collections():
-            for entry in col.stream():
-                entry_data = entry.to_dict()
-                entry_data["id"] = entry.id
-                entry_data["collection"] = col.id
-                entry_data["assigned_to"] = reviewer_id
-                all_docs.append(entry_data)
-
-    return all_docs
+def get_all_pending(
+    response: Response,
+    data_type: Optional[str] = None,
+    national_id: Optional[str] = None,
+    submitted_from: Optional[str] = None,
+    submitted_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=PENDING_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    results, next_cursor = query_pending(None, data_type, national_id, submitted_from, submitted_to,
+                                         order, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return results
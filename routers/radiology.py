@@ -1,9 +1,15 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from datetime import date, datetime
 import pytz, uuid
-from models.schema import RadiologyTest, resolve_added_by_name, fetch_patient_name
+from models.schema import RadiologyTest
 from routers.doctor_assignments import is_doctor_assigned, auto_assign_reviewer
 from firebase_config import db, bucket
+from routers.report_cache import invalidate_report
+from routers.pending_approvals import submit_pending
+from routers.actor_directory import (
+    is_valid_facility_or_doctor, store_procedure_under_facility, resolve_added_by_name, fetch_patient_name
+)
 from routers.image_classifier import classify_radiology_image
 from main import load_multitask_model, model
 
@@ -21,26 +27,6 @@ def convert_dates(obj):
     else:
         return obj
 
-def is_valid_facility_or_doctor(added_by_id: str) -> bool:
-    facilities = db.collection("Facilities").where("facility_id", "==", added_by_id).stream()
-    if any(True for _ in facilities):
-        return True
-    doctors = db.collection("Doctors").where("doctor_id", "==", added_by_id).stream()
-    if any(True for _ in doctors):
-        return True
-    return False
-
-def store_procedure_under_facility(facility_id: str, patient_id: str, procedure_type: str, procedure_data: dict):
-    facility_docs = db.collection("Facilities").where("facility_id", "==", facility_id).stream()
-    facility_doc = next(facility_docs, None)
-    if not facility_doc:
-        return
-    facility_doc_id = facility_doc.id
-    timestamp = datetime.now(egypt_tz).strftime("%Y-%m-%d %H:%M:%S")
-    db.collection("Facilities").document(facility_doc_id) \
-        .collection("PatientsMadeProcedures").document(patient_id) \
-        .collection(procedure_type).document(timestamp).set(procedure_data)
-
 @router.post("/{national_id}")
 async def add_radiology(
     national_id: str,
@@ -60,7 +46,8 @@ async def add_radiology(
 
     # Classify the image
     try:
-        classification = classify_radiology_image(image_bytes=image_bytes)
+        # Off the event loop, so concurrent uploads can share a batched predict
+        classification = await run_in_threadpool(classify_radiology_image, image_bytes=image_bytes)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Classification error: {str(e)}")
 
@@ -114,6 +101,7 @@ async def add_radiology(
         db.collection("Users").document(national_id) \
             .collection("ClinicalIndicators").document("radiology") \
             .collection("Records").document(timestamp_id).set(full_record)
+        invalidate_report(national_id)
 
         store_procedure_under_facility(added_by, national_id, "radiology", full_record)
 
@@ -133,13 +121,13 @@ async def add_radiology(
     assigned_to = doctor_name or auto_assign_reviewer(national_id)["assigned_to"]
     doc_id = uuid.uuid4().hex
 
-    db.collection("PendingApprovals").document(assigned_to).collection("radiology").document(doc_id).set({
+    submit_pending(assigned_to, "radiology", doc_id, {
         "national_id": national_id,
         "record": entry_dict,
         "data_type": "radiology",
         "assigned_to": assigned_to,
         "assigned_doctor_name": doctor_name,
-        "submitted_at": current_timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        "submitted_at": current_timestamp  # Stored as a Firestore Timestamp
     })
 
     return {
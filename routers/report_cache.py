@@ -0,0 +1,82 @@
+import hashlib
+import os
+import time
+from datetime import datetime
+from typing import Optional
+import pytz
+from fastapi import HTTPException
+from firebase_admin import firestore
+from firebase_config import db
+from routers.pdf_scheduler import PDF_SCHEDULER_WORKERS
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+REPORT_LAYOUT_VERSION = "1"  # Bump when the report layout changes so every cached PDF is rebuilt
+PDF_REBUILD_DEBOUNCE_SECONDS = float(os.environ.get("PDF_REBUILD_DEBOUNCE_SECONDS", "30"))  # Quiet time before a rebuild
+
+egypt_tz = pytz.timezone("Africa/Cairo")
+
+
+def get_report_state_ref(national_id: str):
+    return db.collection("Users").document(national_id).collection("ReportState").document("pdf")
+
+
+def get_rebuild_queue_ref(national_id: str):
+    return db.collection("PdfRebuildQueue").document(national_id)
+
+
+def invalidate_report(national_id: str, batch=None):
+    """
+    Mark a patient's cached PDF report as stale and queue it for a background
+    rebuild (see pdf_scheduler).
+
+    Called by every write path for data that appears in the report (records
+    under the user document; the user document itself is covered by its own
+    update time). Bumping the marker changes its update time and therefore
+    the report fingerprint. Each call pushes the queue entry's `due_at` back,
+    so a burst of edits results in one rebuild. Nothing is queued when the
+    scheduler is disabled (PDF_SCHEDULER_WORKERS=0), since nothing would
+    drain the queue. With `batch`, the writes are added to it instead.
+    """
+    now = datetime.now(egypt_tz).isoformat()
+    commit = batch is None
+    batch = db.batch() if commit else batch
+    batch.set(get_report_state_ref(national_id), {
+        "version": firestore.Increment(1),
+        "invalidated_at": now
+    }, merge=True)
+    if PDF_SCHEDULER_WORKERS > 0:
+        batch.set(get_rebuild_queue_ref(national_id), {
+            "national_id": national_id,
+            "dirty_at": now,
+            "due_at": time.time() + PDF_REBUILD_DEBOUNCE_SECONDS,
+            "attempts": 0  # New data gets a fresh set of retries
+        }, merge=True)
+    if not commit:
+        return
+    try:
+        batch.commit()
+    except Exception as e:
+        print(f"Error invalidating PDF report for {national_id}: {str(e)}")
+
+
+def report_fingerprint(national_id: str) -> Optional[str]:
+    """
+    Fingerprint of everything the report is built from: the update times of
+    the user document and the invalidation marker, read in one round trip.
+    Raises 404 when the user does not exist.
+    """
+    user_ref = db.collection("Users").document(national_id)
+    state_ref = get_report_state_ref(national_id)
+    snapshots = {snapshot.reference.path: snapshot for snapshot in db.get_all([user_ref, state_ref])}
+
+    user_snapshot = snapshots.get(user_ref.path)
+    if user_snapshot is None or not user_snapshot.exists:
+        raise HTTPException(status_code=404, detail="User not found")
+    state_snapshot = snapshots.get(state_ref.path)
+
+    parts = [
+        REPORT_LAYOUT_VERSION,
+        user_snapshot.update_time.isoformat() if user_snapshot.update_time else "",
+        state_snapshot.update_time.isoformat() if state_snapshot is not None and state_snapshot.exists else ""
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
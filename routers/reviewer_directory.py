@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Set
+from firebase_config import db
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+REVIEWER_DIRECTORY_TTL_SECONDS = float(os.environ.get("REVIEWER_DIRECTORY_TTL_SECONDS", "300"))  # Full reload interval
+REVIEWER_DIRECTORY_NEGATIVE_TTL_SECONDS = float(os.environ.get("REVIEWER_DIRECTORY_NEGATIVE_TTL_SECONDS", "60"))  # Unknown IDs
+REVIEWER_DIRECTORY_MAX_UNKNOWN = 10000  # Cached unknown IDs before they are all dropped
+
+
+class ReviewerDirectory:
+    """
+    Cached map from a reviewer ID (facility_name, registered doctor email or
+    fallback doctor email) to the PendingApprovals document ID.
+
+    The three collections are loaded together (names only) and reused until
+    the TTL expires, so resolving a known reviewer costs no reads. In this
+    process, the admin facility/doctor endpoints and the doctor assignment
+    endpoints call invalidate(); changes made through another process are
+    only seen after the TTL, except that an ID missing from the cache is
+    looked up directly and remembered if found. IDs that resolve to nothing
+    are remembered as unknown for the shorter negative TTL.
+    """
+
+    def __init__(self, ttl: float = REVIEWER_DIRECTORY_TTL_SECONDS,
+                 negative_ttl: float = REVIEWER_DIRECTORY_NEGATIVE_TTL_SECONDS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._facilities: Dict[str, str] = {}
+        self._doctors: Set[str] = set()
+        self._fallback_doctors: Set[str] = set()
+        self._unknown: Dict[str, float] = {}  # reviewer_id -> expires_at
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self, reviewer_id: Optional[str] = None):
+        """Reload everything on the next lookup, or only forget that `reviewer_id` was unknown"""
+        if reviewer_id is None:
+            self._loaded_at = 0.0
+        self._unknown.pop(reviewer_id, None)
+
+    def _load(self):
+        facilities = {}
+        for doc in db.collection("Facilities").select(["facility_name"]).stream():
+            name = (doc.to_dict() or {}).get("facility_name")
+            if name is not None:
+                facilities.setdefault(name, doc.id)  # First match wins, as with the old scan
+        doctors = {doc.id for doc in db.collection("Doctors").select([]).stream()}
+        fallback_doctors = {
+            (doc.to_dict() or {}).get("doctor_email")
+            for doc in db.collection("DoctorAssignments").select(["doctor_email"]).stream()
+        }
+        fallback_doctors.discard(None)
+
+        self._facilities, self._doctors, self._fallback_doctors = facilities, doctors, fallback_doctors
+        self._unknown = {}
+        self._loaded_at = time.time()
+
+    def _ensure_loaded(self):
+        if time.time() - self._loaded_at <= self.ttl:
+            return
+        with self._lock:
+            if time.time() - self._loaded_at > self.ttl:
+                self._load()
+
+    def _lookup(self, reviewer_id: str) -> Optional[str]:
+        # Same precedence as the direct lookup below
+        if reviewer_id in self._facilities:
+            return self._facilities[reviewer_id]
+        if reviewer_id in self._doctors or reviewer_id in self._fallback_doctors:
+            return reviewer_id
+        return None
+
+    def _fetch(self, reviewer_id: str) -> Optional[str]:
+        facility = next(db.collection("Facilities").where("facility_name", "==", reviewer_id).limit(1).stream(), None)
+        if facility is not None:
+            self._facilities[reviewer_id] = facility.id
+            return facility.id
+        if db.collection("Doctors").document(reviewer_id).get().exists:
+            self._doctors.add(reviewer_id)
+            return reviewer_id
+        fallback = db.collection("DoctorAssignments").where("doctor_email", "==", reviewer_id).limit(1).stream()
+        if next(fallback, None) is not None:
+            self._fallback_doctors.add(reviewer_id)
+            return reviewer_id
+        return None
+
+    def resolve(self, reviewer_id: str) -> Optional[str]:
+        """Return the reviewer's document ID, 'admin' for the admin queue, or None if unknown"""
+        self._ensure_loaded()
+        doc_id = self._lookup(reviewer_id)
+        if doc_id is not None:
+            return doc_id
+        if reviewer_id == "admin":
+            return "admin"
+        if self._unknown.get(reviewer_id, 0) > time.time():
+            return None
+
+        doc_id = self._fetch(reviewer_id)
+        if doc_id is None:
+            if len(self._unknown) >= REVIEWER_DIRECTORY_MAX_UNKNOWN:
+                self._unknown = {}
+            self._unknown[reviewer_id] = time.time() + self.negative_ttl
+        return doc_id
+
+
+# ─── Shared directory ────────────────────────────────────────────────
+reviewer_directory = ReviewerDirectory()
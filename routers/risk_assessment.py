@@ -1,13 +1,26 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import time
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from firebase_config import db
 import pandas as pd
 import numpy as np
 import joblib
-from models.schema import RiskPredictionOutput, DerivedFeatures, TopFeatures
+from routers.report_cache import invalidate_report
+from routers.feature_store import RISK_SOURCES, load_feature_snapshot, save_feature_snapshot
+from models.schema import RiskPredictionOutput, DerivedFeatures, TopFeatures, RiskBatchRequest, RiskBatchOutput
 
 router = APIRouter(prefix="/risk", tags=["Risk Assessment"])
 
+RISK_BATCH_WORKERS = int(os.environ.get("RISK_BATCH_WORKERS", "8"))            # Patients gathered concurrently
+RISK_BATCH_MAX_PATIENTS = int(os.environ.get("RISK_BATCH_MAX_PATIENTS", "500"))  # Per /risk/batch request
+RISK_FETCH_WORKERS = int(os.environ.get("RISK_FETCH_WORKERS", "16"))            # Concurrent Firestore reads
+
+_fetch_executor = ThreadPoolExecutor(max_workers=RISK_FETCH_WORKERS, thread_name_prefix="risk-fetch")
+
 # Lazy-loaded model components
 scaler_diabetes = None
 scaler_hypertension = None
@@ -35,143 +48,340 @@ def load_models():
         selected_features_hyp = joblib.load("selected_hypertension_features.pkl")
         print("✅ Models loaded.")
 
-# ✅ Main Endpoint
-@router.post("/{national_id}", response_model=RiskPredictionOutput)
-async def assess_risk(national_id: str):
+# ✅ Feature gathering
+def _latest(ref, field: str) -> dict:
+    doc = next(ref.order_by(field, direction="DESCENDING").limit(1).stream(), None)
+    return doc.to_dict() if doc else {}
+
+
+def _timed(name: str, fetch, timings: dict):
+    start = time.perf_counter()
     try:
-        load_models()  # Ensure models are loaded
+        return fetch()
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+def fetch_risk_inputs(national_id: str, timings: Optional[dict] = None, sources=RISK_SOURCES) -> dict:
+    """
+    Read the raw Firestore documents the risk features are derived from.
+
+    The reads are independent, so they are issued at once on a shared thread
+    pool; the total wait is roughly the slowest read instead of the sum.
+    `sources` limits the reads to a subset of RISK_SOURCES. Per-source
+    durations (ms) are recorded in `timings` when given.
+    """
+    timings = {} if timings is None else timings
+    user_ref = db.collection("Users").document(national_id)
+    indicators = user_ref.collection("ClinicalIndicators")
+    readers = {
+        "user": lambda: user_ref.get(),
+        "measurements": lambda: indicators.document("measurements").get().to_dict(),
+        "hypertension": lambda: _latest(indicators.document("Hypertension").collection("Records"), "date"),
+        "biomarkers": lambda: _latest(indicators.document("bloodbiomarkers").collection("Records"), "date_added"),
+        "medications": lambda: _latest(user_ref.collection("medications"), "start_date")
+    }
+    futures = {name: _fetch_executor.submit(_timed, name, readers[name], timings) for name in sources}
+    inputs = {name: future.result() for name, future in futures.items()}
 
-        # === 1. Load User Info ===
-        user_doc = db.collection("Users").document(national_id).get()
-        if not user_doc.exists:
+    if "user" in inputs:
+        if not inputs["user"].exists:
             raise HTTPException(status_code=404, detail="User not found")
-        user = user_doc.to_dict()
-
-        # === 2. Load Measurements ===
-        measurements = db.collection("Users").document(national_id)\
-            .collection("ClinicalIndicators").document("measurements").get().to_dict()
-        if not measurements:
-            raise HTTPException(status_code=404, detail="Missing measurements")
-
-        # === 3. Load Hypertension Record ===
-        hyp_docs = db.collection("Users").document(national_id)\
-            .collection("ClinicalIndicators").document("Hypertension")\
-            .collection("Records").order_by("date", direction="DESCENDING").limit(1).stream()
-        hypertension = next(hyp_docs, None)
-        hypertension = hypertension.to_dict() if hypertension else {}
-
-        # === 4. Load Blood Biomarkers ===
-        bio_docs = db.collection("Users").document(national_id)\
-            .collection("ClinicalIndicators").document("bloodbiomarkers")\
-            .collection("Records").order_by("date_added", direction="DESCENDING").limit(1).stream()
-        biomarkers = next(bio_docs, None)
-        biomarkers = biomarkers.to_dict() if biomarkers else {}
-
-        # === 5. Load Medications ===
-        med_docs = db.collection("Users").document(national_id).collection("medications")\
-            .order_by("start_date", direction="DESCENDING").limit(1).stream()
-        medications = next(med_docs, None)
-        medications = medications.to_dict() if medications else {}
-
-        # === 6. BMI Logic ===
-        bmi = measurements.get("bmi", 25.0)
-        bmi_category = 0 if bmi < 18.5 else 1 if bmi < 25 else 2 if bmi < 30 else 3
-        is_obese = int(bmi >= 30)
-
-        # === 7. Assemble Features ===
-        features = {
-            'male': 1 if user.get("gender") == "male" else 0,
-            'BPMeds': int(medications.get("bp_medication", 0)),
-            'totChol': float(next((r.get("value") for r in biomarkers.get("results", []) if r.get("item") == "Cholesterol"), 180)),
-            'sysBP': float(hypertension.get("sysBP", 120)),
-            'diaBP': float(hypertension.get("diaBP", 80)),
-            'heartRate': float(hypertension.get("heartRate", 72)),
-            'glucose': float(next((r.get("value") for r in biomarkers.get("results", []) if r.get("item") == "Glucose"), 100)),
-            'age_group': int(user.get("age_group", 1)),
-            'smoker_status': int(user.get("smoker_status", 0)),
-            'is_obese': is_obese,
-            'bp_category': int(hypertension.get("bp_category", 0)),
-            'bmi_category': bmi_category,
-            'male_smoker': int(user.get("gender") == "male" and user.get("smoker_status", 0) > 0),
-            'prediabetes_indicator': int(hypertension.get("prediabetes_indicator", 0)),
-            'insulin_resistance': int(hypertension.get("insulin_resistance", 0)),
-            'metabolic_syndrome': int(hypertension.get("metabolic_syndrome", 0))
-        }
-
-        # === 8. Predict Diabetes ===
-        X_dia = pd.DataFrame([features])
-        X_dia["hypertension"] = 0.5
-        scaled_dia = scaler_diabetes.transform(X_dia[scaler_diabetes.feature_names_in_])
-        selected_dia = selector_dia.transform(scaled_dia)
-        diabetes_prob = float(model_diabetes.predict_proba(selected_dia)[0][1])
-
-        # === 9. Predict Hypertension ===
-        X_hyp = pd.DataFrame([features])
-        X_hyp["diabetes"] = diabetes_prob
-        scaled_hyp = scaler_hypertension.transform(X_hyp[scaler_hypertension.feature_names_in_])
-        selected_hyp = selector_hyp.transform(scaled_hyp)
-        hypertension_prob = float(model_hypertension.predict_proba(selected_hyp)[0][1])
-
-        # === 10. Top Feature Extraction Function ===
-        def top_features(model, X_selected, feature_names, top_n=3):
+        inputs["user"] = inputs["user"].to_dict()
+    if "measurements" in inputs and not inputs["measurements"]:
+        raise HTTPException(status_code=404, detail="Missing measurements")
+
+    return inputs
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+# Each source reduced to the model inputs it contributes; only these are cached, never the raw documents
+SOURCE_FEATURES = {
+    "user": lambda user: {
+        "male": 1 if user.get("gender") == "male" else 0,
+        "age_group": int(user.get("age_group", 1)),
+        "smoker_status": int(user.get("smoker_status", 0))
+    },
+    "measurements": lambda measurements: {
+        "bmi": measurements.get("bmi", 25.0)
+    },
+    "hypertension": lambda hypertension: {
+        "sysBP": float(hypertension.get("sysBP", 120)),
+        "diaBP": float(hypertension.get("diaBP", 80)),
+        "heartRate": float(hypertension.get("heartRate", 72)),
+        "bp_category": int(hypertension.get("bp_category", 0)),
+        "prediabetes_indicator": int(hypertension.get("prediabetes_indicator", 0)),
+        "insulin_resistance": int(hypertension.get("insulin_resistance", 0)),
+        "metabolic_syndrome": int(hypertension.get("metabolic_syndrome", 0))
+    },
+    "biomarkers": lambda biomarkers: {
+        "totChol": float(next((r.get("value") for r in biomarkers.get("results", []) if r.get("item") == "Cholesterol"), 180)),
+        "glucose": float(next((r.get("value") for r in biomarkers.get("results", []) if r.get("item") == "Glucose"), 100))
+    },
+    "medications": lambda medications: {
+        "BPMeds": int(medications.get("bp_medication", 0))
+    }
+}
+
+
+def derive_source_features(inputs: dict) -> dict:
+    """Reduce the raw documents from fetch_risk_inputs to per-source model inputs."""
+    return {name: SOURCE_FEATURES[name](doc) for name, doc in inputs.items()}
+
+
+def build_features(source_features: dict):
+    """Return (features, bmi) for one patient's per-source model inputs."""
+    user = source_features["user"]
+    hypertension = source_features["hypertension"]
+    biomarkers = source_features["biomarkers"]
+
+    # === BMI Logic ===
+    bmi = source_features["measurements"]["bmi"]
+    bmi_category = 0 if bmi < 18.5 else 1 if bmi < 25 else 2 if bmi < 30 else 3
+    is_obese = int(bmi >= 30)
+
+    # === Assemble Features ===
+    features = {
+        'male': user["male"],
+        'BPMeds': source_features["medications"]["BPMeds"],
+        'totChol': biomarkers["totChol"],
+        'sysBP': hypertension["sysBP"],
+        'diaBP': hypertension["diaBP"],
+        'heartRate': hypertension["heartRate"],
+        'glucose': biomarkers["glucose"],
+        'age_group': user["age_group"],
+        'smoker_status': user["smoker_status"],
+        'is_obese': is_obese,
+        'bp_category': hypertension["bp_category"],
+        'bmi_category': bmi_category,
+        'male_smoker': int(user["male"] == 1 and user["smoker_status"] > 0),
+        'prediabetes_indicator': hypertension["prediabetes_indicator"],
+        'insulin_resistance': hypertension["insulin_resistance"],
+        'metabolic_syndrome': hypertension["metabolic_syndrome"]
+    }
+    return features, bmi
+
+
+def gather_source_features(national_id: str, timings: Optional[dict] = None):
+    """
+    Load the feature snapshot and re-read only the sources written since it
+    was saved (all of them when there is no complete snapshot).
+    Returns (snapshot, cached snapshot dict, source_features, stale sources).
+    """
+    timings = {} if timings is None else timings
+    snapshot = _timed("snapshot", lambda: load_feature_snapshot(national_id), timings)
+    cached = snapshot.to_dict() if snapshot else {}
+    cached_sources = cached.get("source_features") or {}
+
+    if all(source in cached_sources for source in RISK_SOURCES):
+        stale = [source for source in cached.get("changed_sources", []) if source in RISK_SOURCES]
+    else:
+        stale = list(RISK_SOURCES)
+    fresh = fetch_risk_inputs(national_id, timings, stale)
+    return snapshot, cached, {**cached_sources, **derive_source_features(fresh)}, stale
+
+
+# ✅ Prediction
+def predict_risk_matrix(feature_rows: list):
+    """Run both pipelines once over a matrix of feature rows (one row per patient)."""
+    X = pd.DataFrame(feature_rows)
+
+    # === Predict Diabetes ===
+    X_dia = X.copy()
+    X_dia["hypertension"] = 0.5
+    scaled_dia = scaler_diabetes.transform(X_dia[scaler_diabetes.feature_names_in_])
+    selected_dia = selector_dia.transform(scaled_dia)
+    diabetes_probs = model_diabetes.predict_proba(selected_dia)[:, 1].astype(float)
+
+    # === Predict Hypertension ===
+    X_hyp = X.copy()
+    X_hyp["diabetes"] = diabetes_probs
+    scaled_hyp = scaler_hypertension.transform(X_hyp[scaler_hypertension.feature_names_in_])
+    selected_hyp = selector_hyp.transform(scaled_hyp)
+    hypertension_probs = model_hypertension.predict_proba(selected_hyp)[:, 1].astype(float)
+
+    return diabetes_probs, hypertension_probs, selected_dia, selected_hyp
+
+
+def top_features(model, X_selected, feature_names, top_n=3):
+    try:
+        base = model.named_estimators_[next(iter(model.named_estimators_))] if hasattr(model, "named_estimators_") else model
+        if hasattr(base, "feature_importances_"):
+            imp = base.feature_importances_
+        elif hasattr(base, "coef_"):
+            imp = np.abs(base.coef_[0])
+        else:
+            raise Exception("Model doesn't support feature importances.")
+        idx = np.argsort(imp)[::-1][:top_n]
+        total = sum(imp[i] for i in idx) or 1
+        return [
+            TopFeatures(feature_name=feature_names[i], contribution_score=round((imp[i]/total)*100, 1))
+            for i in idx
+        ]
+    except Exception:
+        return [
+            TopFeatures(feature_name=feature_names[i], contribution_score=round(s, 1))
+            for i, s in zip(np.random.choice(len(feature_names), top_n, replace=False), [33.3, 33.3, 33.4])
+        ]
+
+
+def build_prediction(features: dict, bmi: float, diabetes_prob: float, hypertension_prob: float, dia_top, hyp_top) -> RiskPredictionOutput:
+    derived = DerivedFeatures(
+        age_group={0: "Young", 1: "Middle-aged", 2: "Older"}.get(features["age_group"], "Middle-aged"),
+        smoker_status={0: "Non-smoker", 1: "Light", 2: "Moderate", 3: "Heavy"}.get(features["smoker_status"], "Non-smoker"),
+        is_obese=bool(features["is_obese"]),
+        bp_category={-1: "Low", 0: "Normal", 1: "Elevated", 2: "Stage 1", 3: "Stage 2"}.get(features["bp_category"], "Normal"),
+        bmi_category={0: "Underweight", 1: "Normal", 2: "Overweight", 3: "Obese"}.get(features["bmi_category"], "Normal"),
+        bmi=bmi,
+        pulse_pressure=features["sysBP"] - features["diaBP"],
+        male_smoker=bool(features["male_smoker"]),
+        prediabetes_indicator=bool(features["prediabetes_indicator"]),
+        insulin_resistance=bool(features["insulin_resistance"]),
+        metabolic_syndrome=bool(features["metabolic_syndrome"])
+    )
+
+    return RiskPredictionOutput(
+        diabetes_risk=round(diabetes_prob * 100, 2),
+        hypertension_risk=round(hypertension_prob * 100, 2),
+        derived_features=derived,
+        input_values=features,
+        top_diabetes_features=dia_top,
+        top_hypertension_features=hyp_top
+    )
+
+
+def prediction_document(result: RiskPredictionOutput, now: datetime) -> dict:
+    return {
+        **result.dict(),
+        "timestamp": now.isoformat(),
+        "display_time": now.strftime("%B %d, %Y at %I:%M %p"),
+        "sortable_time": now.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def _gather_features(national_id: str):
+    snapshot, _, source_features, _ = gather_source_features(national_id)
+    features, bmi = build_features(source_features)
+    return snapshot, source_features, features, bmi
+
+
+def assess_risk_batch(national_ids: list) -> dict:
+    """
+    Score many patients at once: gather inputs concurrently, run each model
+    pipeline once over the whole feature matrix and write all risk_predictions
+    documents with batched writes.
+    """
+    load_models()
+    national_ids = list(dict.fromkeys(national_ids))  # De-duplicate, keep order
+
+    gathered, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=RISK_BATCH_WORKERS) as executor:
+        futures = {executor.submit(_gather_features, nid): nid for nid in national_ids}
+        for future, national_id in futures.items():
             try:
-                base = model.named_estimators_[next(iter(model.named_estimators_))] if hasattr(model, "named_estimators_") else model
-                if hasattr(base, "feature_importances_"):
-                    imp = base.feature_importances_
-                elif hasattr(base, "coef_"):
-                    imp = np.abs(base.coef_[0])
-                else:
-                    raise Exception("Model doesn't support feature importances.")
-                idx = np.argsort(imp)[::-1][:top_n]
-                total = sum(imp[i] for i in idx) or 1
-                return [
-                    TopFeatures(feature_name=feature_names[i], contribution_score=round((imp[i]/total)*100, 1))
-                    for i in idx
-                ]
-            except Exception:
-                return [
-                    TopFeatures(feature_name=feature_names[i], contribution_score=round(s, 1))
-                    for i, s in zip(np.random.choice(len(feature_names), top_n, replace=False), [33.3, 33.3, 33.4])
-                ]
-
-        # === 11. Get Top Features
-        dia_top = top_features(model_diabetes, selected_dia, selected_features_dia)
-        hyp_top = top_features(model_hypertension, selected_hyp, selected_features_hyp)
-
-        # === 12. Derived Values
-        derived = DerivedFeatures(
-            age_group={0: "Young", 1: "Middle-aged", 2: "Older"}.get(features["age_group"], "Middle-aged"),
-            smoker_status={0: "Non-smoker", 1: "Light", 2: "Moderate", 3: "Heavy"}.get(features["smoker_status"], "Non-smoker"),
-            is_obese=bool(is_obese),
-            bp_category={-1: "Low", 0: "Normal", 1: "Elevated", 2: "Stage 1", 3: "Stage 2"}.get(features["bp_category"], "Normal"),
-            bmi_category={0: "Underweight", 1: "Normal", 2: "Overweight", 3: "Obese"}.get(bmi_category, "Normal"),
-            bmi=bmi,
-            pulse_pressure=features["sysBP"] - features["diaBP"],
-            male_smoker=bool(features["male_smoker"]),
-            prediabetes_indicator=bool(features["prediabetes_indicator"]),
-            insulin_resistance=bool(features["insulin_resistance"]),
-            metabolic_syndrome=bool(features["metabolic_syndrome"])
-        )
+                gathered[national_id] = future.result()
+            except HTTPException as e:
+                errors[national_id] = e.detail
+            except Exception as e:
+                errors[national_id] = str(e)
+
+    ids = [nid for nid in national_ids if nid in gathered]
+    if not ids:
+        return {"results": {}, "errors": errors}
+
+    feature_rows = [gathered[nid][2] for nid in ids]
+    diabetes_probs, hypertension_probs, selected_dia, selected_hyp = predict_risk_matrix(feature_rows)
+    dia_top = top_features(model_diabetes, selected_dia, selected_features_dia)
+    hyp_top = top_features(model_hypertension, selected_hyp, selected_features_hyp)
+
+    now = datetime.now()
+    doc_id = now.strftime("%Y%m%d_%H%M%S")
+    results = {}
+    batch = db.batch()
+    pending_writes = 0
+    for i, national_id in enumerate(ids):
+        _, _, features, bmi = gathered[national_id]
+        result = build_prediction(features, bmi, float(diabetes_probs[i]), float(hypertension_probs[i]), dia_top, hyp_top)
+        results[national_id] = result
 
-        result = RiskPredictionOutput(
-            diabetes_risk=round(diabetes_prob * 100, 2),
-            hypertension_risk=round(hypertension_prob * 100, 2),
-            derived_features=derived,
-            input_values=features,
-            top_diabetes_features=dia_top,
-            top_hypertension_features=hyp_top
+        batch.set(
+            db.collection("Users").document(national_id).collection("risk_predictions").document(doc_id),
+            prediction_document(result, now)
         )
+        invalidate_report(national_id, batch)
+        pending_writes += 3
+        if pending_writes >= 498:  # Firestore batch limit is 500 writes
+            batch.commit()
+            batch = db.batch()
+            pending_writes = 0
+    if pending_writes:
+        batch.commit()
+
+    # Refresh each patient's snapshot so the single-patient endpoint does not serve a stale prediction
+    with ThreadPoolExecutor(max_workers=RISK_BATCH_WORKERS) as executor:
+        for national_id in ids:
+            snapshot, source_features, features, bmi = gathered[national_id]
+            executor.submit(
+                save_feature_snapshot, national_id, snapshot, source_features, features, bmi, results[national_id].dict()
+            )
+
+    return {"results": results, "errors": errors}
+
+
+# ✅ Batch Endpoint (declared before /{national_id} so "batch" is not taken as an ID)
+@router.post("/batch", response_model=RiskBatchOutput)
+def assess_risk_for_patients(request: RiskBatchRequest):
+    if not request.national_ids:
+        raise HTTPException(status_code=400, detail="national_ids must not be empty")
+    if len(request.national_ids) > RISK_BATCH_MAX_PATIENTS:
+        raise HTTPException(status_code=400, detail=f"At most {RISK_BATCH_MAX_PATIENTS} patients per request")
+    try:
+        return assess_risk_batch(request.national_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ✅ Main Endpoint
+@router.post("/{national_id}", response_model=RiskPredictionOutput)
+async def assess_risk(national_id: str, response: Response):
+    try:
+        # === 1. Load the feature snapshot and re-read only the sources written since ===
+        timings = {}
+        snapshot, cached, source_features, stale = await run_in_threadpool(gather_source_features, national_id, timings)
+        response.headers["Server-Timing"] = server_timing(timings)
+
+        if cached.get("prediction") and not stale:
+            return RiskPredictionOutput(**cached["prediction"])
+
+        features, bmi = build_features(source_features)
+
+        if cached.get("prediction") and cached.get("features") == features and cached.get("bmi") == bmi:
+            # A record was written but the derived features did not change
+            result = RiskPredictionOutput(**cached["prediction"])
+        else:
+            load_models()  # Ensure models are loaded
+
+            # === 2. Predict Diabetes and Hypertension ===
+            diabetes_probs, hypertension_probs, selected_dia, selected_hyp = predict_risk_matrix([features])
+
+            # === 3. Get Top Features
+            dia_top = top_features(model_diabetes, selected_dia, selected_features_dia)
+            hyp_top = top_features(model_hypertension, selected_hyp, selected_features_hyp)
+
+            result = build_prediction(features, bmi, float(diabetes_probs[0]), float(hypertension_probs[0]), dia_top, hyp_top)
 
-        # === 13. Save to Firestore
-        now = datetime.now()
-        db.collection("Users").document(national_id).collection("risk_predictions")\
-            .document(now.strftime("%Y%m%d_%H%M%S")).set({
-                **result.dict(),
-                "timestamp": now.isoformat(),
-                "display_time": now.strftime("%B %d, %Y at %I:%M %p"),
-                "sortable_time": now.strftime("%Y-%m-%d %H:%M:%S")
-            })
+            # === 4. Save to Firestore
+            now = datetime.now()
+            db.collection("Users").document(national_id).collection("risk_predictions")\
+                .document(now.strftime("%Y%m%d_%H%M%S")).set(prediction_document(result, now))
+            invalidate_report(national_id)
 
+        save_feature_snapshot(national_id, snapshot, source_features, features, bmi, result.dict())
         return result
 
     except HTTPException:
@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Dict, List, Optional, Set
+from firebase_config import db
+
+# ─── CONFIGURATION ───────────────────────────────────────────────────
+NGRAM_SIZE = 3                  # Longest gram stored per field value
+SNAPSHOT_WAIT_SECONDS = 10      # How long the first search waits for the listener's initial load
+FALLBACK_REFRESH_SECONDS = 60   # Full reload interval when a snapshot listener is unavailable
+
+
+def _grams(text: str):
+    # Every substring up to NGRAM_SIZE chars, so short queries are a direct posting lookup
+    for n in range(1, NGRAM_SIZE + 1):
+        for i in range(len(text) - n + 1):
+            yield text[i:i + n]
+
+
+class SearchIndex:
+    """
+    In-memory n-gram index over selected fields of a Firestore collection.
+
+    A non-empty query matches like `query in value.lower()`: queries up to
+    NGRAM_SIZE chars are answered from postings directly, longer ones intersect
+    their trigram postings and verify the candidates. Empty queries are
+    ignored rather than matching everything (see search). The index is kept fresh
+    by a snapshot listener (incremental ADDED/MODIFIED/REMOVED changes); if the
+    listener cannot be started the collection is re-streamed on a timer.
+    """
+
+    def __init__(self, collection: str, fields: List[str], exact_fields: List[str] = ()):
+        self.collection = collection
+        self.fields = list(fields)
+        self.exact_fields = list(exact_fields)
+        self._docs: Dict[str, dict] = {}
+        self._values: Dict[str, Dict[str, str]] = {}
+        self._postings: Dict[tuple, Set[str]] = {}
+        self._exact: Dict[tuple, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._watch = None
+        self._listener_failed = False
+        self._loaded_at = 0.0
+
+    # ─── Index maintenance ───────────────────────────────────────────
+    def _unindex(self, doc_id: str):
+        for field, value in self._values.pop(doc_id, {}).items():
+            for gram in set(_grams(value)):
+                postings = self._postings.get((field, gram))
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._postings[(field, gram)]
+        old = self._docs.pop(doc_id, None) or {}
+        for field in self.exact_fields:
+            key = (field, old.get(field))
+            ids = self._exact.get(key)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._exact[key]
+
+    def _index(self, doc_id: str, data: dict):
+        self._unindex(doc_id)
+        self._docs[doc_id] = data
+        values = {}
+        for field in self.fields:
+            value = str(data.get(field) or "").lower()
+            values[field] = value
+            for gram in set(_grams(value)):
+                self._postings.setdefault((field, gram), set()).add(doc_id)
+        self._values[doc_id] = values
+        for field in self.exact_fields:
+            if data.get(field) is not None:
+                self._exact.setdefault((field, data.get(field)), set()).add(doc_id)
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    self._unindex(change.document.id)
+                else:
+                    self._index(change.document.id, change.document.to_dict() or {})
+            self._loaded_at = time.time()
+        self._ready.set()
+
+    def _reload(self):
+        docs = {doc.id: doc.to_dict() or {} for doc in db.collection(self.collection).stream()}
+        with self._lock:
+            for doc_id in list(self._docs):
+                if doc_id not in docs:
+                    self._unindex(doc_id)
+            for doc_id, data in docs.items():
+                self._index(doc_id, data)
+            self._loaded_at = time.time()
+        self._ready.set()
+
+    def _ensure_loaded(self):
+        if self._watch is None and not self._listener_failed:
+            with self._lock:
+                if self._watch is None and not self._listener_failed:
+                    try:
+                        self._watch = db.collection(self.collection).on_snapshot(self._on_snapshot)
+                    except Exception as e:
+                        print(f"Search index listener for {self.collection} unavailable: {str(e)}")
+                        self._listener_failed = True
+        if self._watch is not None and self._ready.wait(SNAPSHOT_WAIT_SECONDS):
+            return
+        if time.time() - self._loaded_at > FALLBACK_REFRESH_SECONDS:
+            self._reload()
+
+    # ─── Queries ─────────────────────────────────────────────────────
+    def _match(self, field: str, query: str) -> Set[str]:
+        query = query.lower()
+        if len(query) <= NGRAM_SIZE:
+            return set(self._postings.get((field, query), ()))
+
+        grams = [query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)]
+        postings = sorted((self._postings.get((field, g), set()) for g in grams), key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates &= p
+            if not candidates:
+                break
+        return {doc_id for doc_id in candidates if query in self._values[doc_id][field]}
+
+    def search(self, queries: Dict[str, str], exact: Optional[Dict[str, str]] = None,
+               offset: int = 0, limit: Optional[int] = None):
+        """
+        Return (total, page) of documents matching ANY non-empty query/exact value.
+        Empty values are skipped, so one empty parameter no longer makes every
+        document match as the old `"" in value` scan did. With no criteria every
+        document matches. Pages are ordered by document ID.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            matched = None
+            for field, query in queries.items():
+                if query:
+                    ids = self._match(field, query)
+                    matched = ids if matched is None else matched | ids
+            for field, value in (exact or {}).items():
+                if value:
+                    ids = self._exact.get((field, value), set())
+                    matched = set(ids) if matched is None else matched | ids
+            if matched is None:
+                matched = self._docs.keys()
+
+            ordered = sorted(matched)
+            page = ordered[offset:offset + limit] if limit is not None else ordered[offset:]
+            return len(ordered), [{**self._docs[doc_id], "id": doc_id} for doc_id in page]
+
+
+# ─── Shared indexes ──────────────────────────────────────────────────
+users_index = SearchIndex("Users", ["full_name", "national_id", "doctoremail"])
+facilities_index = SearchIndex("Facilities", ["facility_name"], exact_fields=["facility_id"])
+doctors_index = SearchIndex("Doctors", ["doctor_name"], exact_fields=["doctor_id"])
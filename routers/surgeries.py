@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from models.schema import SurgeryEntry
 from firebase_config import db
+from routers.report_cache import invalidate_report
 from datetime import datetime, date as dt_date
 import pytz
 
@@ -26,6 +27,7 @@ def add_surgery(national_id: str, entry: SurgeryEntry):
     data["timestamp"] = record_id
 
     user_ref.collection("surgeries").document(record_id).set(data)
+    invalidate_report(national_id)
     return {"message": "Surgery entry added", "record_id": record_id}
 
 
@@ -62,6 +64,7 @@ def update_surgery(national_id: str, record_id: str, entry: SurgeryEntry):
     data["timestamp"] = record_id
 
     record_ref.set(data)
+    invalidate_report(national_id)
     return {"message": "Surgery updated", "record_id": record_id}
 
 
@@ -79,4 +82,5 @@ def delete_surgery(national_id: str, record_id: str, added_by: str):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this record.")
 
     record_ref.delete()
+    invalidate_report(national_id)
     return {"message": "Surgery entry deleted"}
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 from firebase_config import db
+from routers.feature_store import mark_risk_inputs_changed
 from models.schema import UserCreate, UserResponse, calculate_age
+from routers.search_index import users_index
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -56,6 +58,7 @@ def update_user(national_id: str, user: UserCreate):
 
     updated_data = {**user.dict(), "age": age}
     user_ref.update(updated_data)
+    mark_risk_inputs_changed(national_id, "user")
     return {**user.dict(), "age": age}
 
 # -------------------- Get Single User --------------------
@@ -68,18 +71,23 @@ def get_user(national_id: str):
 
 # -------------------- Get Users List --------------------
 @router.get("/", response_model=List[UserResponse])
-def get_users(name: str = "", national_id: str = ""):
-    users_ref = db.collection("Users")
-    results = []
-
-    for doc in users_ref.stream():
-        user = doc.to_dict()
-        user["id"] = doc.id
-        full_name = user.get("full_name", "").lower()
-        national = user.get("national_id", "").lower()
-        doctor_email = user.get("doctoremail", "").lower()
-
-        if name.lower() in full_name or national_id.lower() in national or national_id.lower() in doctor_email:
-            results.append(user)
-
+def get_users(
+    response: Response,
+    name: str = "",
+    national_id: str = "",
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Users whose full name contains `name`, or whose national ID or doctor email
+    contains `national_id` (case-insensitive). An empty parameter is ignored;
+    before the search index it matched every user, so `?name=ali` returned
+    everyone. With neither parameter every user is returned. The total match
+    count is in the X-Total-Count header (exposed to browsers via CORS).
+    """
+    total, results = users_index.search(
+        {"full_name": name, "national_id": national_id, "doctoremail": national_id},
+        offset=offset, limit=limit
+    )
+    response.headers["X-Total-Count"] = str(total)
     return results
@@ -0,0 +1,19 @@
+import sys
+import types
+import pytest
+from fake_firestore import FakeFirestore
+
+# The routers read `db` from firebase_config at import time; point them at an
+# in-memory Firestore before any of them is imported
+fake_db = FakeFirestore()
+firebase_config = types.ModuleType("firebase_config")
+firebase_config.db = fake_db
+firebase_config.bucket = None
+sys.modules["firebase_config"] = firebase_config
+
+
+@pytest.fixture
+def db():
+    fake_db.reset()
+    yield fake_db
+    fake_db.reset()
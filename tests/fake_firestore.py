@@ -0,0 +1,526 @@
+"""
+In-memory stand-in for the parts of the Firestore client the routers use:
+documents and collections, collection-group queries with filters, ordering
+and cursors, batches, transactions, write preconditions, field transforms and
+collection snapshot listeners. Writes are applied synchronously, and every
+write gets a strictly increasing update_time.
+"""
+import copy
+import functools
+import itertools
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+
+_EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class DocumentChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class WriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class CountResult:
+    def __init__(self, value):
+        self.value = value
+
+
+class AggregationQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self):
+        return [[CountResult(sum(1 for _ in self._query.stream()))]]
+
+
+# ─── Values ──────────────────────────────────────────────────────────
+def _store_value(value):
+    # The client stores datetimes as UTC Timestamps; naive ones are taken as UTC
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+    if isinstance(value, dict):
+        return {k: _store_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_store_value(v) for v in value]
+    return copy.deepcopy(value)
+
+
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, (DocumentReference, tuple)):
+        return 5
+    if isinstance(value, list):
+        return 6
+    return 7
+
+
+def _comparable(value):
+    if isinstance(value, DocumentReference):
+        value = tuple(value.path.split("/"))
+    return _type_rank(value), value
+
+
+def _compare(a, b) -> int:
+    a, b = _comparable(a), _comparable(b)
+    if a[0] != b[0]:
+        return -1 if a[0] < b[0] else 1
+    if a[0] == 0:
+        return 0
+    return (a[1] > b[1]) - (a[1] < b[1])
+
+
+def _get_field(data: dict, field_path: str):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(field_path)
+        value = value[part]
+    return value
+
+
+def _apply_field(data: dict, field_path: str, value, now):
+    parts = field_path.split(".")
+    target = data
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    key = parts[-1]
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = now
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(target.get(key) or [])
+        target[key] = current + [_store_value(v) for v in value.values if v not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        target[key] = [v for v in target.get(key) or [] if v not in value.values]
+    elif isinstance(value, transforms.Increment):
+        target[key] = (target.get(key) or 0) + value.value
+    else:
+        target[key] = _store_value(value)
+
+
+def _merge(data: dict, update: dict, now):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            _merge(data[key], value, now)
+        else:
+            _apply_field(data, key, value, now)
+
+
+# ─── Documents ───────────────────────────────────────────────────────
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field_path):
+        return copy.deepcopy(_get_field(self._data or {}, field_path))
+
+
+class DocumentReference:
+    def __init__(self, client, path: str):
+        parts = path.split("/")
+        if len(parts) % 2:
+            raise ValueError(f"Not a document path: {path}")
+        self._client = client
+        self.path = path
+        self.id = parts[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"DocumentReference({self.path!r})"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id: str):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def collections(self):
+        prefix = self.path + "/"
+        ids = {path[len(prefix):].split("/")[0] for path in self._client._docs if path.startswith(prefix)}
+        return [self.collection(collection_id) for collection_id in sorted(ids)]
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._snapshot(self.path)
+
+    def set(self, document_data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return batch.commit()[0]
+
+    def create(self, document_data):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return batch.commit()[0]
+
+    def update(self, field_updates, option=None):
+        batch = self._client.batch()
+        batch.update(self, field_updates, option=option)
+        return batch.commit()[0]
+
+    def delete(self, option=None):
+        batch = self._client.batch()
+        batch.delete(self, option=option)
+        return batch.commit()[0].update_time
+
+
+# ─── Queries ─────────────────────────────────────────────────────────
+_OPERATORS = {
+    "==": lambda a, b: _compare(a, b) == 0,
+    "!=": lambda a, b: _compare(a, b) != 0,
+    "<": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) < 0,
+    "<=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) <= 0,
+    ">": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) > 0,
+    ">=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) >= 0,
+    "in": lambda a, b: any(_compare(a, v) == 0 for v in b),
+    "not-in": lambda a, b: all(_compare(a, v) != 0 for v in b),
+    "array_contains": lambda a, b: isinstance(a, list) and any(_compare(v, b) == 0 for v in a),
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(_compare(v, w) == 0 for v in a for w in b),
+}
+_INEQUALITIES = {"!=", "<", "<=", ">", ">=", "not-in"}
+
+
+class Query:
+    def __init__(self, client, parent_path, collection_id, all_descendants=False,
+                 filters=(), orders=(), cursor=None, limit=None):
+        self._client = client
+        self._parent_path = parent_path
+        self._collection_id = collection_id
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._cursor = cursor
+        self._limit = limit
+
+    def _copy(self, **changes):
+        fields = dict(parent_path=self._parent_path, collection_id=self._collection_id,
+                      all_descendants=self._all_descendants, filters=self._filters, orders=self._orders,
+                      cursor=self._cursor, limit=self._limit)
+        fields.update(changes)
+        return Query(self._client, **fields)
+
+    def where(self, field_path, op_string, value):
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Unsupported operator {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self
+
+    def count(self):
+        return AggregationQuery(self)
+
+    def _matches_path(self, path: str) -> bool:
+        parts = path.split("/")
+        if parts[-2] != self._collection_id:
+            return False
+        parent = "/".join(parts[:-2])
+        if self._all_descendants:
+            return True
+        return parent == (self._parent_path or "")
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            inequality = next((f for f, op, _ in self._filters if op in _INEQUALITIES), None)
+            if inequality is not None:
+                orders.append((inequality, "ASCENDING"))
+        if not any(field == "__name__" for field, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        return orders
+
+    def _key(self, path, data, orders):
+        return [DocumentReference(self._client, path) if field == "__name__" else _get_field(data, field)
+                for field, _ in orders]
+
+    def _results(self):
+        orders = self._effective_orders()
+        rows = []
+        for path, (data, _, _) in self._client._docs.items():
+            if not self._matches_path(path):
+                continue
+            try:
+                if not all(_OPERATORS[op](_get_field(data, field), value) for field, op, value in self._filters):
+                    continue
+                key = self._key(path, data, orders)
+            except KeyError:
+                continue  # Documents without a filtered or ordered field are left out
+            rows.append((key, path))
+
+        def compare(a, b):
+            for (field, direction), x, y in zip(orders, a[0], b[0]):
+                result = _compare(x, y)
+                if result:
+                    return -result if direction == "DESCENDING" else result
+            return 0
+
+        rows.sort(key=functools.cmp_to_key(compare))
+        if self._cursor is not None:
+            if isinstance(self._cursor, DocumentSnapshot):
+                cursor = self._key(self._cursor.reference.path, self._cursor._data, orders)
+            else:
+                cursor = list(self._cursor)
+                if len(cursor) < len(orders):
+                    raise ValueError("Cursor must have a value for every order_by field")
+            rows = [row for row in rows if compare(row, (cursor, None)) > 0]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return [path for _, path in rows]
+
+    def stream(self, transaction=None):
+        with self._client._lock:
+            snapshots = [self._client._snapshot(path) for path in self._results()]
+        return iter(snapshots)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path: str):
+        parent_path, _, collection_id = path.rpartition("/")
+        super().__init__(client, parent_path, collection_id)
+        self.path = path
+        self.id = collection_id
+
+    @property
+    def parent(self):
+        return DocumentReference(self._client, self._parent_path) if self._parent_path else None
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex}")
+
+    def list_documents(self):
+        prefix = self.path + "/"
+        ids = {path[len(prefix):].split("/")[0] for path in self._client._docs if path.startswith(prefix)}
+        return [self.document(document_id) for document_id in sorted(ids)]
+
+
+class Watch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self._client._lock:
+            self._client._watches.remove(self)
+
+
+# ─── Writes ──────────────────────────────────────────────────────────
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference, document_data, merge, None))
+
+    def create(self, reference, document_data):
+        self._writes.append(("create", reference, document_data, False, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(("update", reference, field_updates, False, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(("delete", reference, None, False, option))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+
+class Transaction(WriteBatch):
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        results = self.commit()
+        self._clean_up()
+        return results
+
+    def _rollback(self):
+        self._clean_up()
+
+    def get_all(self, references, field_paths=None):
+        return self._client.get_all(references)
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}  # path -> (data, create_time, update_time)
+        self._watches = []
+        self._clock = itertools.count(1)
+        self.commits = 0
+
+    def reset(self):
+        with self._lock:
+            self._docs.clear()
+            self._watches.clear()
+            self.commits = 0
+
+    def _now(self):
+        return _EPOCH + timedelta(microseconds=next(self._clock))
+
+    def _snapshot(self, path):
+        data, create_time, update_time = self._docs.get(path, (None, None, None))
+        return DocumentSnapshot(DocumentReference(self, path), copy.deepcopy(data), create_time, update_time, self._now())
+
+    # ─── Client API ──────────────────────────────────────────────────
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        return DocumentReference(self, document_path)
+
+    def collection_group(self, collection_id):
+        return Query(self, None, collection_id, all_descendants=True)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaction(self, max_attempts, read_only)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return WriteOption(last_update_time, exists)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        with self._lock:
+            return [self._snapshot(ref.path) for ref in dict.fromkeys(references)]
+
+    # ─── Internals ───────────────────────────────────────────────────
+    def _check(self, path, kind, option):
+        current = self._docs.get(path)
+        if kind == "create" and current is not None:
+            raise exceptions.AlreadyExists(f"Document already exists: {path}")
+        if kind == "update" and current is None:
+            raise exceptions.NotFound(f"No document to update: {path}")
+        if option is not None:
+            if option.exists is not None and option.exists != (current is not None):
+                raise exceptions.FailedPrecondition(f"Precondition failed on {path}")
+            if option.last_update_time is not None and (current is None or current[2] != option.last_update_time):
+                raise exceptions.FailedPrecondition(f"Document {path} was updated since {option.last_update_time}")
+
+    def _commit(self, writes):
+        with self._lock:
+            # Check every precondition first so a failed commit writes nothing
+            for kind, ref, _, _, option in writes:
+                self._check(ref.path, kind, option)
+
+            now = self._now()
+            changes = []
+            for kind, ref, data, merge, _ in writes:
+                current = self._docs.get(ref.path)
+                if kind == "delete":
+                    if current is not None:
+                        del self._docs[ref.path]
+                        changes.append((ChangeType.REMOVED, ref.path, current[0]))
+                    continue
+                if kind == "update":
+                    document = copy.deepcopy(current[0])
+                    for field_path, value in data.items():
+                        _apply_field(document, field_path, value, now)
+                elif merge and current is not None:
+                    document = copy.deepcopy(current[0])
+                    _merge(document, data, now)
+                else:
+                    document = {}
+                    _merge(document, data, now)
+                create_time = current[1] if current is not None else now
+                self._docs[ref.path] = (document, create_time, now)
+                changes.append((ChangeType.MODIFIED if current is not None else ChangeType.ADDED, ref.path, document))
+            self.commits += 1
+            watches = list(self._watches)
+
+        for watch in watches:
+            matched = [DocumentChange(change_type, DocumentSnapshot(DocumentReference(self, path),
+                                                                     copy.deepcopy(data), None, now))
+                       for change_type, path, data in changes if watch.query._matches_path(path)]
+            if matched:
+                watch.callback([], matched, now)
+        return [WriteResult(now) for _ in writes]
+
+    def _watch(self, query, callback):
+        with self._lock:
+            watch = Watch(self, query, callback)
+            self._watches.append(watch)
+            initial = [DocumentChange(ChangeType.ADDED, self._snapshot(path)) for path in query._results()]
+        callback([], initial, self._now())
+        return watch
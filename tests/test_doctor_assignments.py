@@ -0,0 +1,47 @@
+from models.schema import DoctorAssignment
+from routers import admin, doctor_assignments
+
+
+def add_doctor(db, email, name):
+    db.collection("Doctors").document(email).set({"email": email, "doctor_name": name, "doctor_id": email[:5]})
+
+
+def assign(email, patient, name="Given Name"):
+    return doctor_assignments.assign_doctor(
+        DoctorAssignment(doctor_email=email, doctor_name=name, patient_national_id=patient)
+    )
+
+
+def test_check_reflects_a_doctor_rename(db):
+    add_doctor(db, "a@example.com", "Dr. Ahmed")
+    assign("a@example.com", "p1")
+    assign("u@example.com", "p2", name="Dr. Unregistered")
+
+    admin.update_doctor("a@example.com", {"doctor_name": "Dr. Ahmed Nabil"})
+
+    assert doctor_assignments.check_doctor("p1") == {"email": "a@example.com", "name": "Dr. Ahmed Nabil"}
+    assert doctor_assignments.check_doctor("p2")["name"] == "Dr. Unregistered"
+
+
+def test_latest_assignment_wins(db):
+    add_doctor(db, "a@example.com", "Dr. Ahmed")
+    add_doctor(db, "b@example.com", "Dr. Mona")
+    assign("b@example.com", "p1")
+    assign("a@example.com", "p1")
+    assert doctor_assignments.is_doctor_assigned("p1") == "a@example.com"
+
+
+def test_backfill_keeps_the_old_lookup_order(db):
+    add_doctor(db, "a@example.com", "Dr. Ahmed")
+    add_doctor(db, "b@example.com", "Dr. Mona")
+    for email, patient in (("b@example.com", "p1"), ("a@example.com", "p1"), ("b@example.com", "p2")):
+        db.collection("Doctors").document(email).collection("AssignedPatients").document(patient).set({
+            "patient_national_id": patient
+        })
+    db.collection("DoctorAssignments").document("u@example.com_p2").set({
+        "doctor_email": "u@example.com", "doctor_name": "Dr. Unregistered", "patient_national_id": "p2"
+    })
+
+    assert doctor_assignments.backfill_patient_assignments()["indexed"] == 2
+    assert doctor_assignments.check_doctor("p1") == {"email": "a@example.com", "name": "Dr. Ahmed"}
+    assert doctor_assignments.check_doctor("p2") == {"email": "u@example.com", "name": "Dr. Unregistered"}
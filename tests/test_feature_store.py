@@ -0,0 +1,59 @@
+import pytest
+from routers import feature_store
+
+
+def snapshot_data(db, national_id="p1"):
+    return feature_store.get_feature_snapshot_ref(national_id).get().to_dict()
+
+
+def save(national_id, snapshot, sources=("user",)):
+    return feature_store.save_feature_snapshot(
+        national_id, snapshot, {s: {"x": 1} for s in sources}, {"x": 1}, 25.0, {"diabetes_risk": 10.0}
+    )
+
+
+def test_markers_accumulate_sources(db):
+    feature_store.mark_risk_inputs_changed("p1", "measurements")
+    feature_store.mark_risk_inputs_changed("p1", "biomarkers")
+    feature_store.mark_risk_inputs_changed("p1", "measurements")
+
+    data = snapshot_data(db)
+    assert data["changed_sources"] == ["measurements", "biomarkers"]
+    assert data["version"] == 3
+
+
+def test_unknown_source_is_rejected():
+    with pytest.raises(ValueError):
+        feature_store.mark_risk_inputs_changed("p1", "allergies")
+
+
+def test_first_save_creates_the_snapshot(db):
+    assert feature_store.load_feature_snapshot("p1") is None
+    assert save("p1", None)
+    data = snapshot_data(db)
+    assert data["changed_sources"] == [] and data["version"] == 0
+
+
+def test_save_clears_markers_and_drops_raw_inputs(db):
+    feature_store.get_feature_snapshot_ref("p1").set({"inputs": {"user": {"full_name": "Patient One"}}})
+    feature_store.mark_risk_inputs_changed("p1", "user")
+
+    assert save("p1", feature_store.load_feature_snapshot("p1"))
+    data = snapshot_data(db)
+    assert data["changed_sources"] == []
+    assert "inputs" not in data
+
+
+def test_save_is_skipped_when_a_record_was_written_meanwhile(db):
+    save("p1", None)
+    snapshot = feature_store.load_feature_snapshot("p1")
+    feature_store.mark_risk_inputs_changed("p1", "biomarkers")
+
+    assert not save("p1", snapshot)
+    assert snapshot_data(db)["changed_sources"] == ["biomarkers"]
+
+
+def test_concurrent_first_saves_keep_one_snapshot(db):
+    assert save("p1", None, ("user",))
+    assert not save("p1", None, ("measurements",))
+    assert list(snapshot_data(db)["source_features"]) == ["user"]
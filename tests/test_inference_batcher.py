@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+import pytest
+from routers.inference_batcher import BatchPredictor
+
+
+class FakeModel:
+    def __init__(self, outputs=1):
+        self.batch_sizes = []
+        self.outputs = outputs
+
+    def predict(self, batch, verbose=0):
+        self.batch_sizes.append(len(batch))
+        scores = batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)
+        return [scores, -scores] if self.outputs > 1 else scores
+
+
+def predict_concurrently(predictor, samples):
+    results = [None] * len(samples)
+    errors = [None] * len(samples)
+
+    def call(i):
+        try:
+            results[i] = predictor.predict(samples[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(samples))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results, errors
+
+
+def test_concurrent_samples_share_a_predict_call():
+    model = FakeModel()
+    predictor = BatchPredictor(lambda: model, max_batch_size=4, max_latency_ms=200)
+    samples = [np.full((2, 2), i, dtype=float) for i in range(4)]
+
+    results, errors = predict_concurrently(predictor, samples)
+
+    assert errors == [None] * 4
+    assert [float(r[0]) for r in results] == [0.0, 4.0, 8.0, 12.0]
+    assert sum(model.batch_sizes) == 4 and len(model.batch_sizes) < 4
+
+
+def test_batches_are_capped():
+    model = FakeModel()
+    predictor = BatchPredictor(lambda: model, max_batch_size=2, max_latency_ms=200)
+    predict_concurrently(predictor, [np.zeros(3) for _ in range(5)])
+    assert max(model.batch_sizes) <= 2 and sum(model.batch_sizes) == 5
+
+
+def test_different_shapes_are_predicted_separately():
+    model = FakeModel()
+    predictor = BatchPredictor(lambda: model, max_batch_size=4, max_latency_ms=200)
+    results, errors = predict_concurrently(predictor, [np.ones((2, 2)), np.ones((3, 3)), np.ones((2, 2))])
+    assert errors == [None] * 3
+    assert [float(r[0]) for r in results] == [4.0, 9.0, 4.0]
+
+
+def test_multi_output_models_return_one_row_per_output():
+    predictor = BatchPredictor(lambda: FakeModel(outputs=2), max_batch_size=1, max_latency_ms=0)
+    first, second = predictor.predict(np.ones(3))
+    assert float(first[0]) == 3.0 and float(second[0]) == -3.0
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    class BrokenModel:
+        def predict(self, batch, verbose=0):
+            raise RuntimeError("out of memory")
+
+    predictor = BatchPredictor(BrokenModel, max_batch_size=4, max_latency_ms=200)
+    results, errors = predict_concurrently(predictor, [np.zeros(2), np.zeros(2)])
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+    # The batcher keeps serving after a failed batch
+    with pytest.raises(RuntimeError):
+        predictor.predict(np.zeros(2))
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from routers import ocr_jobs
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture(autouse=True)
+def inline_jobs(monkeypatch, db):
+    monkeypatch.setattr(ocr_jobs, "_executor", InlineExecutor())
+
+
+def report_ok(image_bytes, timeout=None, gender=None):
+    return {"is_valid": True, "is_medical": True, "results": []}
+
+
+def submit(on_report, **kwargs):
+    return ocr_jobs.submit_ocr_job("29901011234567", b"img", "lab.jpg", "image/jpeg", "patient", on_report, **kwargs)
+
+
+def test_job_completes_with_the_report_handler_result(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "run_ocr", report_ok)
+    job = ocr_jobs.get_job(submit(lambda *args: {"saved": True}))
+    assert job["status"] == "completed"
+    assert job["result"] == {"saved": True}
+
+
+def test_job_deadline_bounds_the_engine_wait(monkeypatch):
+    timeouts = []
+    monkeypatch.setattr(ocr_jobs, "run_ocr", lambda image_bytes, timeout=None, gender=None:
+                        timeouts.append(timeout) or report_ok(image_bytes))
+    submit(lambda *args: {})
+    assert 0 < timeouts[0] <= ocr_jobs.OCR_JOB_TIMEOUT_SECONDS
+
+
+def test_expired_job_is_not_revived_by_its_worker(monkeypatch, db):
+    saved = []
+
+    def slow_ocr(image_bytes, timeout=None, gender=None):
+        # The client polls after the deadline while OCR is still running
+        job_ref = ocr_jobs.get_job_ref(db.collection("OCRJobs").list_documents()[0].id)
+        job_ref.update({"expires_at": (datetime.now(ocr_jobs.egypt_tz) - timedelta(seconds=1)).isoformat()})
+        assert ocr_jobs.get_job(job_ref.id)["status_code"] == 504
+        return report_ok(image_bytes)
+
+    monkeypatch.setattr(ocr_jobs, "run_ocr", slow_ocr)
+    job_id = submit(lambda *args: saved.append(args) or {"saved": True})
+
+    job = ocr_jobs.get_job(job_id)
+    assert saved == []
+    assert job["status"] == "failed"
+    assert job["status_code"] == 504
+
+
+def test_job_expired_in_the_queue_never_runs(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "OCR_JOB_TIMEOUT_SECONDS", -1)
+    monkeypatch.setattr(ocr_jobs, "run_ocr", lambda *args, **kwargs: pytest.fail("OCR ran for an expired job"))
+    job = ocr_jobs.get_job(submit(lambda *args: {}))
+    assert job["status"] == "failed"
+    assert job["status_code"] == 504
+
+
+def test_saving_job_gets_a_grace_period(db):
+    expired = (datetime.now(ocr_jobs.egypt_tz) - timedelta(seconds=1)).isoformat()
+    ocr_jobs.get_job_ref("saving").set({"status": "saving", "expires_at": expired})
+    assert ocr_jobs.get_job("saving")["status"] == "saving"
+
+
+def test_handler_errors_fail_the_job(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "run_ocr", report_ok)
+
+    def reject(*args):
+        raise HTTPException(status_code=422, detail="Image is not valid or not medical")
+
+    job = ocr_jobs.get_job(submit(reject))
+    assert (job["status"], job["status_code"]) == ("failed", 422)
+
+
+def test_restart_fails_only_this_machines_active_jobs(db):
+    for job_id, status, instance in [("a", "queued", ocr_jobs.OCR_INSTANCE_ID), ("b", "saving", ocr_jobs.OCR_INSTANCE_ID),
+                                     ("c", "completed", ocr_jobs.OCR_INSTANCE_ID), ("d", "running", "other-machine")]:
+        ocr_jobs.get_job_ref(job_id).set({"status": status, "instance_id": instance})
+
+    assert ocr_jobs.recover_orphaned_jobs() == 2
+    statuses = {doc.id: doc.to_dict()["status"] for doc in db.collection("OCRJobs").stream()}
+    assert statuses == {"a": "failed", "b": "failed", "c": "completed", "d": "running"}
@@ -0,0 +1,59 @@
+import pytest
+
+ocr_utils = pytest.importorskip("routers.ocr_utils")
+
+
+def report(*lines):
+    # extract_medical_tests reads name / value / range from consecutive lines
+    return "\n".join(lines + ("Signed", "Lab"))
+
+
+def flags(text, gender=None):
+    return {r["item"]: r["flag"] for r in ocr_utils.extract_medical_tests(text, gender)}
+
+
+def test_other_units_are_not_compared_to_the_table():
+    text = report("WBC", "6.8 x10^3/uL", "Platelets", "250 x10^3/uL")
+    assert flags(text) == {"WBC": False, "Platelets": False}
+
+
+def test_missing_unit_does_not_fall_back_to_the_table():
+    assert flags(report("WBC", "6.8", "Signed"))["WBC"] is False
+    assert flags(report("Hemoglobin", "9.1", "Signed"), "female")["Hemoglobin"] is False
+
+
+def test_random_glucose_is_not_held_to_the_fasting_range():
+    assert flags(report("Glucose", "120 mg/dL"))["Glucose"] is False
+
+
+def test_stated_qualifier_selects_its_range():
+    assert flags(report("Fasting Blood Glucose", "120 mg/dL"))["Glucose"] is True
+    assert flags(report("FBS", "85 mg/dL"))["Glucose"] is False
+    assert flags(report("Postprandial Glucose", "160 mg/dL"))["Glucose"] is True
+
+
+def test_qualified_limits_need_the_qualifier():
+    assert flags(report("LDL", "130 mg/dL"))["LDL"] is False
+    assert flags(report("CRP", "3.2 mg/L"))["CRP"] is False
+
+
+def test_matching_unit_uses_the_table_range():
+    assert flags(report("Potassium", "6.1 mEq/L"))["Potassium"] is True
+    assert flags(report("Potassium", "4.2 mEq/L"))["Potassium"] is False
+    assert flags(report("Hemoglobin", "11.0 g/dL"), "female")["Hemoglobin"] is True
+    assert flags(report("Hemoglobin", "11.0 g/dL"))["Hemoglobin"] is False  # Sex-specific, gender unknown
+
+
+def test_printed_range_wins_over_the_table():
+    text = report("Glucose", "120", "70 - 140 mg/dL")
+    assert flags(text)["Glucose"] is False
+    text = report("WBC", "12.5", "4.0 - 11.0 x10^3/uL")
+    assert flags(text)["WBC"] is True
+
+
+def test_lookup_reference_range_requires_a_matching_unit():
+    assert ocr_utils.lookup_reference_range("WBC") is None
+    assert ocr_utils.lookup_reference_range("WBC", unit="x10^3/μL") is None
+    assert ocr_utils.lookup_reference_range("WBC", unit="cells/uL")["high"] == 11000
+    assert ocr_utils.lookup_reference_range("T4", unit="ug/dL")["low"] == 5.0
+    assert ocr_utils.lookup_reference_range("ALT", unit="U/L")["high"] == 55
@@ -0,0 +1,74 @@
+import pytest
+from routers import pdf_generator, report_cache
+
+
+class FakeBlob:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.metadata = None
+        self.data = None
+
+    def upload_from_string(self, data, content_type=None):
+        self.data = data
+
+    def patch(self):
+        self.store.blobs[self.name] = self
+
+    def download_as_bytes(self):
+        return self.data
+
+
+class FakeBucket:
+    name = "test-bucket"
+
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return self.blobs.get(name)
+
+
+@pytest.fixture
+def bucket(db, monkeypatch):
+    db.collection("Users").document("p1").set({"full_name": "Patient One"})
+    bucket = FakeBucket()
+    builds = []
+
+    def build_report(user_id):
+        builds.append(user_id)
+        return {"fetch_errors": bucket.fetch_errors}, b"%PDF-" + str(len(builds)).encode()
+
+    bucket.fetch_errors = []
+    bucket.builds = builds
+    monkeypatch.setattr(pdf_generator, "bucket", bucket)
+    monkeypatch.setattr(pdf_generator, "build_report", build_report)
+    return bucket
+
+
+def test_unchanged_report_is_served_from_storage(bucket):
+    first = pdf_generator.get_or_build_report("p1")
+    second = pdf_generator.get_or_build_report("p1")
+    assert second == first
+    assert bucket.builds == ["p1"]
+
+
+def test_invalidated_report_is_rebuilt_at_the_same_url(bucket):
+    first = pdf_generator.get_or_build_report("p1")
+    report_cache.invalidate_report("p1")
+    second = pdf_generator.get_or_build_report("p1")
+    assert second == first
+    assert bucket.builds == ["p1", "p1"]
+    assert bucket.blobs[pdf_generator.report_blob_name("p1")].data == b"%PDF-2"
+
+
+def test_partial_report_is_not_fingerprinted(bucket):
+    bucket.fetch_errors = ["medications"]
+    assert pdf_generator.get_or_build_report("p1")["fetch_errors"] == ["medications"]
+    bucket.fetch_errors = []
+    pdf_generator.get_or_build_report("p1")
+    pdf_generator.get_or_build_report("p1")
+    assert len(bucket.builds) == 2
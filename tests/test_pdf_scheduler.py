@@ -0,0 +1,114 @@
+import time
+import pytest
+from fastapi import HTTPException
+from routers import pdf_scheduler, report_cache
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class HeldExecutor:
+    """Accepts rebuilds without running them, so they stay in flight."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, entry_ref, *args):
+        self.submitted.append(entry_ref.id)
+
+
+@pytest.fixture
+def queued(db, monkeypatch):
+    monkeypatch.setattr(report_cache, "PDF_SCHEDULER_WORKERS", 2)
+    monkeypatch.setattr(report_cache, "PDF_REBUILD_DEBOUNCE_SECONDS", 0)
+    report_cache.invalidate_report("p1")
+    return report_cache.get_rebuild_queue_ref("p1")
+
+
+def scheduler(build, workers=2):
+    scheduler = pdf_scheduler.PdfRebuildScheduler(build, workers)
+    scheduler._executor = InlineExecutor()
+    return scheduler
+
+
+def test_due_entry_is_rebuilt_and_removed(queued):
+    built = []
+    scheduler(built.append).poll()
+    assert built == ["p1"]
+    assert not queued.get().exists
+
+
+def test_entry_waits_for_the_debounce(queued):
+    queued.update({"due_at": time.time() + 60})
+    built = []
+    scheduler(built.append).poll()
+    assert built == []
+
+
+def test_leased_entry_is_skipped(queued):
+    # Edited while another process rebuilds it: due again, but still leased
+    queued.update({"lease_until": time.time() + 60})
+    built = []
+    scheduler(built.append).poll()
+    assert built == []
+
+
+def test_entry_edited_during_the_rebuild_stays_queued(queued):
+    def build(national_id):
+        report_cache.invalidate_report(national_id)
+
+    scheduler(build).poll()
+    entry = queued.get().to_dict()
+    assert entry["lease_until"] == 0
+    assert entry["attempts"] == 0
+
+
+def test_failed_rebuild_backs_off(queued):
+    def build(national_id):
+        raise RuntimeError("storage unavailable")
+
+    scheduler(build).poll()
+    entry = queued.get().to_dict()
+    assert entry["attempts"] == 1
+    assert entry["lease_until"] == 0
+    assert entry["due_at"] >= time.time() + pdf_scheduler.PDF_REBUILD_BACKOFF_SECONDS - 1
+
+
+def test_entry_is_dropped_after_the_last_attempt(queued):
+    queued.update({"attempts": pdf_scheduler.PDF_REBUILD_MAX_ATTEMPTS - 1})
+
+    def build(national_id):
+        raise RuntimeError("storage unavailable")
+
+    scheduler(build).poll()
+    assert not queued.get().exists
+
+
+def test_missing_user_is_dropped(queued):
+    def build(national_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    scheduler(build).poll()
+    assert not queued.get().exists
+
+
+def test_claim_fails_when_the_entry_changed_since_the_query(queued):
+    entry = next(iter(queued.parent.stream()))
+    report_cache.invalidate_report("p1")
+    assert scheduler(lambda national_id: None)._claim(entry, time.time()) is None
+
+
+def test_poll_takes_no_more_than_the_free_workers(db, monkeypatch):
+    monkeypatch.setattr(report_cache, "PDF_SCHEDULER_WORKERS", 2)
+    monkeypatch.setattr(report_cache, "PDF_REBUILD_DEBOUNCE_SECONDS", 0)
+    for national_id in ("p1", "p2", "p3"):
+        report_cache.invalidate_report(national_id)
+
+    busy = scheduler(lambda national_id: None, workers=2)
+    busy._executor = HeldExecutor()
+    busy.poll()
+    assert len(busy._executor.submitted) == 2
+    busy.poll()
+    assert len(busy._executor.submitted) == 2
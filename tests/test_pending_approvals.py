@@ -0,0 +1,195 @@
+from datetime import datetime
+import pytest
+import pytz
+from fastapi import HTTPException
+from models.schema import PendingBulkApproveRequest
+from routers import pending_approvals
+from routers.reviewer_directory import reviewer_directory
+
+egypt_tz = pytz.timezone("Africa/Cairo")
+DOCTOR = "doctor@example.com"
+
+
+@pytest.fixture(autouse=True)
+def clinic(db):
+    reviewer_directory.invalidate()
+    db.collection("Doctors").document(DOCTOR).set({"doctor_id": "11111", "doctor_name": "Dr. Ali"})
+    db.collection("Users").document("p1").set({"full_name": "Patient One"})
+    db.collection("Users").document("p2").set({"full_name": "Patient Two"})
+    yield
+    reviewer_directory.invalidate()
+
+
+def queue(doc_id, national_id="p1", reviewer=DOCTOR, data_type="bloodbiomarkers", submitted_at=None):
+    pending_approvals.submit_pending(reviewer, data_type, doc_id, {
+        "national_id": national_id,
+        "record": {"results": [{"item": "Glucose", "value": "90"}]},
+        "data_type": data_type,
+        "assigned_to": reviewer,
+        "submitted_at": submitted_at or datetime.now(egypt_tz)
+    })
+
+
+def records(db, national_id="p1", data_type="bloodbiomarkers"):
+    return list(db.collection("Users").document(national_id).collection("ClinicalIndicators")
+                .document(data_type).collection("Records").stream())
+
+
+def test_approve_moves_the_record_and_stores_the_decision(db):
+    queue("a")
+    pending_approvals.approve_pending(DOCTOR, "a")
+
+    assert len(records(db)) == 1
+    assert not db.document(f"PendingApprovals/{DOCTOR}/bloodbiomarkers/a").get().exists
+    assert db.document(f"ApprovedApprovals/{DOCTOR}/bloodbiomarkers/a").get().exists
+    locator = pending_approvals.get_pending_index_ref("a").get().to_dict()
+    assert locator["paths"] == []
+    assert locator["decision"]["status"] == "approved"
+
+
+def test_replayed_approval_does_not_write_the_record_twice(db):
+    queue("a")
+    first = pending_approvals.approve_pending(DOCTOR, "a")
+    again = pending_approvals.approve_pending(DOCTOR, "a")
+
+    assert again == first
+    assert len(records(db)) == 1
+
+
+def test_retried_transaction_sees_the_stored_decision(db):
+    queue("a")
+    transaction_outcomes = [
+        pending_approvals._decide_in_transaction(db.transaction(), DOCTOR, DOCTOR, ["a"], "approved")["a"]
+        for _ in range(2)
+    ]
+    assert [o["applied"] for o in transaction_outcomes] == [True, False]
+    assert len(records(db)) == 1
+
+
+def test_reject_after_approve_is_a_conflict(db):
+    queue("a")
+    pending_approvals.approve_pending(DOCTOR, "a")
+    with pytest.raises(HTTPException) as e:
+        pending_approvals.reject_pending(DOCTOR, "a")
+    assert e.value.status_code == 409
+    assert not db.document(f"RejectedApprovals/{DOCTOR}/bloodbiomarkers/a").get().exists
+
+
+def test_replayed_rejection_is_idempotent(db):
+    queue("a")
+    pending_approvals.reject_pending(DOCTOR, "a")
+    pending_approvals.reject_pending(DOCTOR, "a")
+    assert db.document(f"RejectedApprovals/{DOCTOR}/bloodbiomarkers/a").get().exists
+    assert records(db) == []
+
+
+def test_unknown_record_is_not_found():
+    with pytest.raises(HTTPException) as e:
+        pending_approvals.approve_pending(DOCTOR, "missing")
+    assert e.value.status_code == 404
+
+
+def test_legacy_record_without_locator_is_found_and_every_copy_removed(db):
+    # Queued before PendingIndex existed: one copy per reviewer, no locator
+    for reviewer in (DOCTOR, "admin"):
+        db.collection("PendingApprovals").document(reviewer).collection("radiology").document("old").set({
+            "national_id": "p1", "record": {"radiology_name": "Chest X-ray"}, "data_type": "radiology",
+            "assigned_to": reviewer
+        })
+
+    pending_approvals.approve_pending(DOCTOR, "old")
+
+    assert len(records(db, data_type="radiology")) == 1
+    assert not db.document(f"PendingApprovals/{DOCTOR}/radiology/old").get().exists
+    assert not db.document("PendingApprovals/admin/radiology/old").get().exists
+
+
+def test_bulk_reports_each_outcome(db):
+    queue("ok1")
+    queue("ok2", national_id="p2")
+    queue("gone", national_id="deleted-patient")
+    queue("decided")
+    pending_approvals.reject_pending(DOCTOR, "decided")
+
+    result = pending_approvals.approve_pending_bulk(
+        DOCTOR, PendingBulkApproveRequest(doc_ids=["ok1", "ok2", "gone", "missing", "decided", "ok1"])
+    )
+
+    assert sorted(result["results"]) == ["ok1", "ok2"]
+    assert result["errors"] == {
+        "gone": "User not found",
+        "missing": "Pending record not found",
+        "decided": "Pending record was already rejected"
+    }
+    assert len(records(db)) == 1 and len(records(db, "p2")) == 1
+    # A record whose patient is missing stays queued
+    assert db.document(f"PendingApprovals/{DOCTOR}/bloodbiomarkers/gone").get().exists
+
+
+def test_bulk_is_capped(monkeypatch):
+    monkeypatch.setattr(pending_approvals, "PENDING_BULK_MAX", 2)
+    with pytest.raises(HTTPException) as e:
+        pending_approvals.approve_pending_bulk(DOCTOR, PendingBulkApproveRequest(doc_ids=["a", "b", "c"]))
+    assert e.value.status_code == 400
+    with pytest.raises(HTTPException):
+        pending_approvals.approve_pending_bulk(DOCTOR, PendingBulkApproveRequest(doc_ids=[]))
+
+
+def test_bulk_records_approved_together_get_distinct_ids(db):
+    queue("a")
+    queue("b")
+    pending_approvals.approve_pending_bulk(DOCTOR, PendingBulkApproveRequest(doc_ids=["a", "b"]))
+    assert len(records(db)) == 2
+
+
+def test_unknown_reviewer_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        pending_approvals.approve_pending("nobody@example.com", "a")
+    assert e.value.status_code == 404
+
+
+def test_pages_cover_every_record_once_across_types_and_ties():
+    tie = egypt_tz.localize(datetime(2026, 3, 1, 10))
+    queue("b1", submitted_at=tie)
+    queue("r1", data_type="radiology", submitted_at=tie)
+    queue("b2", reviewer="admin", submitted_at=tie)
+    queue("r2", data_type="radiology", submitted_at=egypt_tz.localize(datetime(2026, 3, 2, 9)))
+
+    everything, cursor = pending_approvals.query_pending()
+    assert cursor is None
+    assert [e["id"] for e in everything][0] == "r2"
+
+    for order in ("asc", "desc"):
+        seen, cursor = [], None
+        while True:
+            page, cursor = pending_approvals.query_pending(order=order, limit=1, cursor=cursor)
+            seen += [(e["assigned_to"], e["id"]) for e in page]
+            if not cursor:
+                break
+        assert sorted(seen) == sorted((e["assigned_to"], e["id"]) for e in everything)
+        assert len(seen) == len(set(seen))
+
+
+def test_reviewer_queue_and_filters():
+    queue("b1", submitted_at=egypt_tz.localize(datetime(2026, 3, 1, 10)))
+    queue("b2", national_id="p2", submitted_at=egypt_tz.localize(datetime(2026, 3, 2, 10)))
+    queue("other", reviewer="admin")
+
+    doctor_ids = [e["id"] for e in pending_approvals.query_pending(DOCTOR)[0]]
+    assert doctor_ids == ["b2", "b1"]
+    assert [e["id"] for e in pending_approvals.query_pending(DOCTOR, national_id="p2")[0]] == ["b2"]
+    # A bare date for submitted_to includes that whole day
+    assert [e["id"] for e in pending_approvals.query_pending(DOCTOR, submitted_to="2026-03-01")[0]] == ["b1"]
+    with pytest.raises(HTTPException):
+        pending_approvals.query_pending(submitted_from="yesterday")
+
+
+def test_backfill_converts_string_timestamps(db):
+    db.document(f"PendingApprovals/{DOCTOR}/radiology/r").set({"submitted_at": "2026-03-01 10:00:00"})
+    db.document(f"PendingApprovals/{DOCTOR}/bloodbiomarkers/b").set({"submitted_at": "2026-03-01T10:00:00+02:00"})
+
+    assert pending_approvals.backfill_submitted_at()["converted"] == 2
+    radiology = db.document(f"PendingApprovals/{DOCTOR}/radiology/r").get().to_dict()["submitted_at"]
+    biomarkers = db.document(f"PendingApprovals/{DOCTOR}/bloodbiomarkers/b").get().to_dict()["submitted_at"]
+    assert radiology == biomarkers
+    assert pending_approvals.backfill_submitted_at()["converted"] == 0
@@ -0,0 +1,49 @@
+import pytest
+from fastapi import HTTPException
+from routers import report_cache
+
+
+def test_fingerprint_changes_when_the_report_is_invalidated(db):
+    db.collection("Users").document("p1").set({"full_name": "Patient One"})
+    before = report_cache.report_fingerprint("p1")
+    assert report_cache.report_fingerprint("p1") == before
+
+    report_cache.invalidate_report("p1")
+    after = report_cache.report_fingerprint("p1")
+    assert after != before
+
+    db.collection("Users").document("p1").update({"full_name": "Patient 1"})
+    assert report_cache.report_fingerprint("p1") != after
+
+
+def test_fingerprint_of_missing_user_is_not_found(db):
+    with pytest.raises(HTTPException) as e:
+        report_cache.report_fingerprint("missing")
+    assert e.value.status_code == 404
+
+
+def test_invalidation_queues_a_debounced_rebuild(db, monkeypatch):
+    monkeypatch.setattr(report_cache, "PDF_SCHEDULER_WORKERS", 2)
+    report_cache.invalidate_report("p1")
+    first = report_cache.get_rebuild_queue_ref("p1").get().to_dict()
+    report_cache.get_rebuild_queue_ref("p1").update({"attempts": 3})
+
+    report_cache.invalidate_report("p1")
+    second = report_cache.get_rebuild_queue_ref("p1").get().to_dict()
+    assert second["due_at"] >= first["due_at"]
+    assert second["attempts"] == 0
+
+
+def test_nothing_is_queued_without_a_scheduler(db, monkeypatch):
+    monkeypatch.setattr(report_cache, "PDF_SCHEDULER_WORKERS", 0)
+    report_cache.invalidate_report("p1")
+    assert report_cache.get_report_state_ref("p1").get().exists
+    assert not report_cache.get_rebuild_queue_ref("p1").get().exists
+
+
+def test_invalidation_joins_the_callers_batch(db):
+    batch = db.batch()
+    report_cache.invalidate_report("p1", batch)
+    assert not report_cache.get_report_state_ref("p1").get().exists
+    batch.commit()
+    assert report_cache.get_report_state_ref("p1").get().exists
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("joblib")
+from routers import feature_store, risk_assessment  # noqa: E402
+
+
+@pytest.fixture
+def models(monkeypatch):
+    matrices = []
+
+    def predict_risk_matrix(feature_rows):
+        matrices.append(feature_rows)
+        probs = np.array([row["glucose"] / 1000 for row in feature_rows])
+        return probs, probs / 2, None, None
+
+    monkeypatch.setattr(risk_assessment, "load_models", lambda: None)
+    monkeypatch.setattr(risk_assessment, "predict_risk_matrix", predict_risk_matrix)
+    monkeypatch.setattr(risk_assessment, "top_features", lambda model, X, names: [])
+    return matrices
+
+
+def add_patient(db, national_id, glucose):
+    user = db.collection("Users").document(national_id)
+    user.set({"gender": "male", "age_group": 1})
+    user.collection("ClinicalIndicators").document("measurements").set({"bmi": 31.0})
+    user.collection("ClinicalIndicators").document("bloodbiomarkers").collection("Records").document("r1").set({
+        "date_added": "2026-03-01", "results": [{"item": "Glucose", "value": str(glucose)}]
+    })
+
+
+def test_batch_scores_all_patients_in_one_pass(db, models):
+    add_patient(db, "p1", 100)
+    add_patient(db, "p2", 200)
+
+    result = risk_assessment.assess_risk_batch(["p1", "p2", "p1"])
+
+    assert len(models) == 1 and len(models[0]) == 2
+    assert result["results"]["p1"].diabetes_risk == 10.0
+    assert result["results"]["p2"].hypertension_risk == 10.0
+    assert result["errors"] == {}
+    for national_id in ("p1", "p2"):
+        assert len(list(db.collection("Users").document(national_id).collection("risk_predictions").stream())) == 1
+        assert db.document(f"Users/{national_id}/ReportState/pdf").get().exists
+
+
+def test_missing_patients_are_reported_without_failing_the_batch(db, models):
+    add_patient(db, "p1", 100)
+    db.collection("Users").document("no-measurements").set({"gender": "female"})
+
+    result = risk_assessment.assess_risk_batch(["p1", "missing", "no-measurements"])
+
+    assert list(result["results"]) == ["p1"]
+    assert result["errors"] == {"missing": "User not found", "no-measurements": "Missing measurements"}
+
+
+def test_batch_refreshes_the_feature_snapshot(db, models):
+    add_patient(db, "p1", 100)
+    feature_store.mark_risk_inputs_changed("p1", "biomarkers")
+
+    risk_assessment.assess_risk_batch(["p1"])
+    snapshot = feature_store.load_feature_snapshot("p1").to_dict()
+    assert snapshot["changed_sources"] == []
+    assert snapshot["prediction"]["diabetes_risk"] == 10.0
+
+    # Only the sources written since are re-read on the next assessment
+    feature_store.mark_risk_inputs_changed("p1", "measurements")
+    _, _, source_features, stale = risk_assessment.gather_source_features("p1")
+    assert stale == ["measurements"]
+    assert source_features["biomarkers"]["glucose"] == 100.0
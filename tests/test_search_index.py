@@ -0,0 +1,95 @@
+import pytest
+from fastapi import Response
+from fake_firestore import CollectionReference
+from routers import admin, search_index, users
+from routers.search_index import SearchIndex
+
+
+@pytest.fixture
+def doctors(db):
+    db.collection("Doctors").document("a@example.com").set({"doctor_name": "Ahmed Hassan", "doctor_id": "11111"})
+    db.collection("Doctors").document("b@example.com").set({"doctor_name": "Mona Hassanein", "doctor_id": "22222"})
+    db.collection("Doctors").document("c@example.com").set({"doctor_name": "Omar Said", "doctor_id": "33333"})
+    return SearchIndex("Doctors", ["doctor_name"], exact_fields=["doctor_id"])
+
+
+def ids(page):
+    return [doc["id"] for doc in page]
+
+
+def test_short_query_is_answered_from_postings(doctors):
+    assert ids(doctors.search({"doctor_name": "a"})[1]) == ["a@example.com", "b@example.com", "c@example.com"]
+    assert ids(doctors.search({"doctor_name": "SAI"})[1]) == ["c@example.com"]
+    assert doctors.search({"doctor_name": "xyz"}) == (0, [])
+
+
+def test_long_query_verifies_trigram_candidates(doctors, db):
+    # Has every trigram of "hassan" (has, ass, ssa, san) but not the substring itself
+    db.collection("Doctors").document("d@example.com").set({"doctor_name": "Has Assan"})
+    assert ids(doctors.search({"doctor_name": "Hassan"})[1]) == ["a@example.com", "b@example.com"]
+    assert ids(doctors.search({"doctor_name": "med hass"})[1]) == ["a@example.com"]
+    assert ids(doctors.search({"doctor_name": "s assan"})[1]) == ["d@example.com"]
+
+
+def test_empty_queries_are_ignored(doctors):
+    assert ids(doctors.search({"doctor_name": ""}, exact={"doctor_id": "22222"})[1]) == ["b@example.com"]
+    assert doctors.search({"doctor_name": ""}, exact={"doctor_id": ""})[0] == 3
+
+
+def test_criteria_are_combined_with_or(doctors):
+    total, page = doctors.search({"doctor_name": "omar"}, exact={"doctor_id": "11111"})
+    assert total == 2 and ids(page) == ["a@example.com", "c@example.com"]
+
+
+def test_pages_are_ordered_by_id(doctors):
+    total, page = doctors.search({}, offset=1, limit=1)
+    assert total == 3 and ids(page) == ["b@example.com"]
+
+
+def test_listener_applies_changes(doctors, db):
+    doctors.search({})
+    db.collection("Doctors").document("a@example.com").update({"doctor_name": "Ahmed Nabil", "doctor_id": "44444"})
+    db.collection("Doctors").document("b@example.com").delete()
+
+    assert ids(doctors.search({"doctor_name": "hassan"})[1]) == []
+    assert ids(doctors.search({"doctor_name": "nabil"})[1]) == ["a@example.com"]
+    assert doctors.search({}, exact={"doctor_id": "11111"})[0] == 0
+    assert ids(doctors.search({}, exact={"doctor_id": "44444"})[1]) == ["a@example.com"]
+    assert ids(doctors.search({})[1]) == ["a@example.com", "c@example.com"]
+    # Postings of removed documents are dropped, not left empty
+    assert not any(doc_id == "b@example.com" for posting in doctors._postings.values() for doc_id in posting)
+
+
+def test_reloads_when_the_listener_is_unavailable(doctors, db, monkeypatch):
+    def no_listener(self, callback):
+        raise RuntimeError("listen stream unavailable")
+
+    monkeypatch.setattr(CollectionReference, "on_snapshot", no_listener)
+    assert doctors.search({})[0] == 3
+
+    db.collection("Doctors").document("c@example.com").delete()
+    assert doctors.search({})[0] == 3  # Served from the last reload until it is refreshed
+    monkeypatch.setattr(search_index, "FALLBACK_REFRESH_SECONDS", 0)
+    assert doctors.search({})[0] == 2
+
+
+def test_endpoints_report_the_total(db, monkeypatch):
+    db.collection("Users").document("29901011234567").set({
+        "full_name": "Ali Hassan", "national_id": "29901011234567", "doctoremail": "a@example.com"
+    })
+    db.collection("Users").document("30001011234567").set({
+        "full_name": "Sara Ali", "national_id": "30001011234567", "doctoremail": "b@example.com"
+    })
+    db.collection("Facilities").document("f1").set({"facility_name": "Cairo Lab", "facility_id": "12345"})
+    db.collection("Facilities").document("f2").set({"facility_name": "Giza Clinic", "facility_id": "67890"})
+    monkeypatch.setattr(users, "users_index", SearchIndex("Users", ["full_name", "national_id", "doctoremail"]))
+    monkeypatch.setattr(admin, "facilities_index", SearchIndex("Facilities", ["facility_name"], exact_fields=["facility_id"]))
+
+    response = Response()
+    page = users.get_users(response, name="ali", national_id="", offset=0, limit=1)
+    assert response.headers["X-Total-Count"] == "2" and len(page) == 1
+    assert ids(users.get_users(Response(), name="", national_id="b@ex", offset=0, limit=None)) == ["30001011234567"]
+
+    response = Response()
+    assert ids(admin.search_facilities(response, name="", id="67890", offset=0, limit=None)) == ["f2"]
+    assert response.headers["X-Total-Count"] == "1"